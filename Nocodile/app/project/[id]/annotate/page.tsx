@@ -74,6 +74,7 @@ function AnnotatePageContent() {
   const [saveStatus, setSaveStatus] = useState<'idle' | 'saving' | 'saved' | 'error'>('idle');
   const canvasRef = useRef<HTMLCanvasElement>(null);
   const containerRef = useRef<HTMLDivElement>(null);
+  const imageRef = useRef<HTMLImageElement>(null);
   const projectId = Array.isArray(id) ? id[0] : id;
   const safeProjectId = projectId || "";
 
@@ -208,8 +209,10 @@ function AnnotatePageContent() {
           // Validate and format the image data properly
           let imageData = frameData.image;
           
-          // Check if it's already a data URL
-          if (!imageData.startsWith('data:')) {
+          const isImageUrl = imageData.startsWith('http://') || imageData.startsWith('https://');
+          
+          // Check if it's already a data URL (frame URLs from the backend are used as they are)
+          if (!isImageUrl && !imageData.startsWith('data:')) {
             // If it's raw base64, add the proper data URL prefix
             if (imageData.startsWith('9j/') || imageData.startsWith('iVBORw0KGgo')) {
               // This looks like base64 data without proper data URL format
@@ -222,7 +225,7 @@ function AnnotatePageContent() {
           }
           
           // Validate the data URL format
-          if (!imageData.startsWith('data:image/')) {
+          if (!isImageUrl && !imageData.startsWith('data:image/')) {
             console.error('❌ [FRONTEND] Invalid image data format:', imageData.substring(0, 100) + '...');
             setCurrentFrameImage("");
             return;
@@ -500,6 +503,31 @@ function AnnotatePageContent() {
     console.log('Previous frame navigation is disabled');
   };
 
+  // Boxes are drawn in canvas pixels; convert them to pixels of the served frame, which may be
+  // downscaled. The backend maps frame_width/frame_height back to the source resolution.
+  const buildAnnotationData = () => {
+    const img = imageRef.current;
+    const frameWidth = img?.naturalWidth || 0;
+    const frameHeight = img?.naturalHeight || 0;
+    const scaleX = img && img.offsetWidth ? frameWidth / img.offsetWidth : 1;
+    const scaleY = img && img.offsetHeight ? frameHeight / img.offsetHeight : 1;
+    const offsetX = img?.offsetLeft || 0;
+    const offsetY = img?.offsetTop || 0;
+    return {
+      project_id: safeProjectId,
+      video_id: currentVideoId,
+      frame_num: currentFrame,
+      bboxes: annotations.map(ann => ({
+        class_name: ann.class,
+        x: (Number(ann.x) - offsetX) * scaleX,
+        y: (Number(ann.y) - offsetY) * scaleY,
+        width: Number(ann.width) * scaleX,
+        height: Number(ann.height) * scaleY
+      })),
+      ...(frameWidth && frameHeight ? { frame_width: frameWidth, frame_height: frameHeight } : {})
+    };
+  };
+
   const handleAutoSave = async () => {
     if (annotations.length === 0) {
       console.log('No annotations to save, skipping auto-save');
@@ -508,18 +536,7 @@ function AnnotatePageContent() {
     setIsAutoSaving(true);
     setSaveStatus('saving');
     try {
-      const annotationData = {
-        project_id: safeProjectId,
-        video_id: currentVideoId,
-        frame_num: currentFrame,
-        bboxes: annotations.map(ann => ({
-          class_name: ann.class,
-          x: Number(ann.x),
-          y: Number(ann.y),
-          width: Number(ann.width),
-          height: Number(ann.height)
-        }))
-      };
+      const annotationData = buildAnnotationData();
       const result = await ApiService.saveAnnotation(annotationData);
       if (result.success) {
         setLastSavedTime(result.savedAt || getClientTimestamp());
@@ -532,18 +549,7 @@ function AnnotatePageContent() {
     } catch (error) {
       console.error('Error auto-saving annotations:', error);
       setSaveStatus('error');
-      const annotationData = {
-        project_id: safeProjectId,
-        video_id: currentVideoId,
-        frame_num: currentFrame,
-        bboxes: annotations.map(ann => ({
-          class_name: ann.class,
-          x: Number(ann.x),
-          y: Number(ann.y),
-          width: Number(ann.width),
-          height: Number(ann.height)
-        }))
-      };
+      const annotationData = buildAnnotationData();
       saveToLocalStorage(annotationData);
     } finally {
       setIsAutoSaving(false);
@@ -572,18 +578,7 @@ function AnnotatePageContent() {
       return;
     }
     try {
-      const annotationData = {
-        project_id: safeProjectId,
-        video_id: currentVideoId,
-        frame_num: currentFrame,
-        bboxes: annotations.map(ann => ({
-          class_name: ann.class,
-          x: Number(ann.x),
-          y: Number(ann.y),
-          width: Number(ann.width),
-          height: Number(ann.height)
-        }))
-      };
+      const annotationData = buildAnnotationData();
       const result = await ApiService.saveAnnotation(annotationData);
       if (result.success) {
         console.log('Annotations saved successfully', { savedAt: result.savedAt, bboxCount: annotations.length });
@@ -594,18 +589,7 @@ function AnnotatePageContent() {
       }
     } catch (error) {
       console.error('Error saving annotations:', error);
-      const annotationData = {
-        project_id: safeProjectId,
-        video_id: currentVideoId,
-        frame_num: currentFrame,
-        bboxes: annotations.map(ann => ({
-          class_name: ann.class,
-          x: Number(ann.x),
-          y: Number(ann.y),
-          width: Number(ann.width),
-          height: Number(ann.height)
-        }))
-      };
+      const annotationData = buildAnnotationData();
       saveToLocalStorage(annotationData);
       alert(`Error saving annotations: ${error instanceof Error ? error.message : 'Unknown error'}. Data backed up locally.`);
     }
@@ -867,6 +851,7 @@ function AnnotatePageContent() {
           <div ref={containerRef} className="flex-1 relative bg-white overflow-hidden flex items-center justify-center">
             {currentFrameImage ? (
               <img
+                ref={imageRef}
                 src={currentFrameImage}
                 alt={`Frame ${currentImage}`}
                 className="max-w-full max-h-full object-contain pointer-events-none"
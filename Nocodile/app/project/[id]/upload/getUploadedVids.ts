@@ -8,6 +8,7 @@ export type uploadedVid = {
   fallbackUrl?: string;
   video_id?: string;
   file_id?: string | number;
+  ingest_status?: string;  // queued / probe / seek_index / proxy / thumbnails / ready / failed
 };
 
 // Synchronous version - returns empty array (for compatibility)
@@ -36,8 +37,8 @@ export async function getUploadedVidsAsync(projectId: number): Promise<uploadedV
       const uploadedVideos: uploadedVid[] = backendVideos.map((item: any) => {
         // 使用後端提供的URL，如果沒有則使用path
         const videoUrl = item.url || item.path || item.file || '';
-        // 如果是相對路徑，添加後端基礎URL
-        const fullUrl = videoUrl.startsWith('/videos/') 
+        // 如果是相對路徑（例如 /projects/17/videos/3/stream），添加後端基礎URL
+        const fullUrl = videoUrl.startsWith('/') 
           ? `http://localhost:8888${videoUrl}` 
           : videoUrl;
           
@@ -47,7 +48,8 @@ export async function getUploadedVidsAsync(projectId: number): Promise<uploadedV
           file: new File([], item.name || 'video.mp4', { type: 'video/mp4' }),
           fallbackUrl: item.fallbackUrl,
           video_id: item.file || item.video_id || item.id || null,  // 優先使用 file 字段（後端返回的 video_id）
-          file_id: item.file || item.video_id || item.id || null  // 添加 file_id 字段來存儲實際的 ID
+          file_id: item.file || item.video_id || item.id || null,  // 添加 file_id 字段來存儲實際的 ID
+          ingest_status: item.ingest_status || 'ready'
         };
       });
       
@@ -63,6 +63,26 @@ const UploadPage = () => {
     loadProjectData();
   }, [project_id]);
 
+  // Poll the ingest status of videos that are still being processed after upload
+  const ingesting = uploadedVideos.filter(
+    vid => vid.ingest_status && !["ready", "failed"].includes(vid.ingest_status)
+  );
+  useEffect(() => {
+    if (ingesting.length === 0) return;
+    const timer = setTimeout(async () => {
+      const statuses = await Promise.all(ingesting.map(vid =>
+        ApiService.getIngestStatus(project_id as string, vid.video_id as string)
+          .then(result => [vid.video_id, result.status] as const)
+          .catch(() => [vid.video_id, vid.ingest_status] as const)
+      ));
+      const byId = new Map(statuses);
+      setUploadedVideos(prev => prev.map(vid =>
+        byId.has(vid.video_id) ? { ...vid, ingest_status: byId.get(vid.video_id) } : vid
+      ));
+    }, 2000);
+    return () => clearTimeout(timer);
+  }, [uploadedVideos, project_id]);
+
   // Refresh videos from backend
   const refreshVideos = useCallback(async () => {
     if (isLoadingVideos) return;
@@ -85,13 +105,13 @@ const UploadPage = () => {
     const selectedPendingVideos = Array.from(event.target.files || []);
     const validPendingVideos = selectedPendingVideos.filter((file) => {
       const isValidType = ["video/mp4", "video/mov", "video/x-matroska"].includes(file.type);
-      const isValidSize = file.size <= 100 * 1024 * 1024;
+      const isValidSize = file.size <= 5 * 1024 * 1024 * 1024;
       
       if (!isValidType) {
         alert(`File ${file.name} is not a supported video format. Please use MP4, MOV, or MKV.`);
       }
       if (!isValidSize) {
-        alert(`File ${file.name} is too large. Maximum size is 100MB.`);
+        alert(`File ${file.name} is too large. Maximum size is 5GB.`);
       }
       
       return isValidType && isValidSize;
@@ -106,13 +126,13 @@ const UploadPage = () => {
     const droppedFiles = Array.from(event.dataTransfer.files);
     const validPendingVideos = droppedFiles.filter((file) => {
       const isValidType = ["video/mp4", "video/mov", "video/x-matroska"].includes(file.type);
-      const isValidSize = file.size <= 100 * 1024 * 1024;
+      const isValidSize = file.size <= 5 * 1024 * 1024 * 1024;
       
       if (!isValidType) {
         alert(`File ${file.name} is not a supported video format. Please use MP4, MOV, or MKV.`);
       }
       if (!isValidSize) {
-        alert(`File ${file.name} is too large. Maximum size is 100MB.`);
+        alert(`File ${file.name} is too large. Maximum size is 5GB.`);
       }
       
       return isValidType && isValidSize;
@@ -150,7 +170,8 @@ const UploadPage = () => {
             title: file.name,
             file: file,
             video_id: result.video_id,
-            video_path: result.video_path
+            video_path: result.video_path,
+            ingest_status: result.ingest_status
           };
         } catch (error) {
           console.error(`Upload failed for ${file.name}:`, error);
@@ -223,10 +244,15 @@ const UploadPage = () => {
   const UploadedCard = React.memo(({ vid, onRemove }: { vid: uploadedVid; onRemove: (vid: uploadedVid) => void }) => {
     return (
       <div className="items-center flex flex-row border mb-4 p-4 rounded-md border-gray-300 w-full justify-between">
-        <video controls poster="" className="w-[200px]">
+        <video controls poster="" preload="metadata" className="w-[200px]">
           <source src={vid.url} type="video/mp4" />
         </video>
-        <div className="flex flex-row gap-2">
+        <div className="flex flex-row gap-2 items-center">
+          {vid.ingest_status && vid.ingest_status !== "ready" && (
+            <span className={`px-2 py-1 rounded text-xs ${vid.ingest_status === "failed" ? "bg-red-200 text-red-800" : "bg-yellow-200 text-yellow-800"}`}>
+              {vid.ingest_status === "failed" ? "Processing failed" : `Processing (${vid.ingest_status})...`}
+            </span>
+          )}
           <Link
             href={`/project/${project_id}/annotate?video_id=${vid.file_id || vid.video_id || '1'}`}
             className="btn-secondary w-fit"
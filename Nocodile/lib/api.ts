@@ -1,6 +1,9 @@
 // API service for connecting frontend to backend
 import { log, logger } from './logger';
 
+// Identifies this browser tab to the backend frame prefetcher (one prefetch queue per annotator)
+const PREFETCH_SESSION_ID = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 // Utility function to validate and fix image data
 function validateAndFixImageData(imageData: string): string {
   if (!imageData || typeof imageData !== 'string') {
@@ -8,6 +11,11 @@ function validateAndFixImageData(imageData: string): string {
     return '';
   }
   
+  // 圖片 URL（後端的二進位幀端點）直接使用
+  if (imageData.startsWith('http://') || imageData.startsWith('https://')) {
+    return imageData;
+  }
+  
   // 檢查是否已經是正確的 data URL 格式
   if (imageData.startsWith('data:image/')) {
     // 驗證 data URL 格式是否完整
@@ -47,6 +55,11 @@ function validateAndFixImageData(imageData: string): string {
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8888';
 
+// 超過此大小的影片使用可續傳的分塊上傳
+const RESUMABLE_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+const RESUMABLE_UPLOAD_PARALLEL = 4;
+const RESUMABLE_UPLOAD_RETRIES = 5;
+
 // Fallback URLs to try if the primary URL fails
 const FALLBACK_URLS = [
   'http://localhost:8888',
@@ -162,6 +175,9 @@ export interface AnnotationRequest {
     width: number;
     height: number;
   }>;
+  // 標註時所見影格的尺寸, 後端會換算回原始解析度
+  frame_width?: number;
+  frame_height?: number;
 }
 
 export interface ClassInfo {
@@ -397,6 +413,10 @@ static async changeProjectName(projectId: number, newName: string): Promise<any>
   // ========== Upload API Methods ==========
 static async uploadVideo(project_id: string, file: File): Promise<any> {
     const baseUrl = await this.findWorkingBackendUrl();
+    // 大檔案走可續傳的分塊上傳
+    if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+      return this.uploadVideoResumable(baseUrl, project_id, file);
+    }
     const url = `${baseUrl}/upload?project_id=${project_id}`;
     const formData = new FormData();
     formData.append("file", file);
@@ -430,6 +450,111 @@ static async uploadVideo(project_id: string, file: File): Promise<any> {
     return data;
   }
 
+  // 可續傳上傳：建立 session，分塊平行 PUT，中斷後查詢已收到的範圍再補傳，最後 complete
+  static async uploadVideoResumable(baseUrl: string, project_id: string, file: File): Promise<any> {
+    const storageKey = `upload:${project_id}:${file.name}:${file.size}:${file.lastModified}`;
+    const readError = async (response: Response) => {
+      const error = await response.json().catch(() => ({}));
+      return new Error(error.error || error.detail || `HTTP ${response.status}`);
+    };
+
+    // 沿用上次中斷的 session
+    let session: any = null;
+    const savedId = localStorage.getItem(storageKey);
+    if (savedId) {
+      const response = await fetch(`${baseUrl}/uploads/${savedId}`);
+      if (response.ok) session = await response.json();
+      else localStorage.removeItem(storageKey);
+    }
+    if (!session) {
+      const response = await fetch(`${baseUrl}/uploads`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ project_id: Number(project_id), filename: file.name, size: file.size }),
+      });
+      if (!response.ok) throw await readError(response);
+      session = await response.json();
+      localStorage.setItem(storageKey, session.upload_id);
+    }
+
+    const chunkSize: number = session.chunk_size;
+    const chunks: [number, number][] = [];
+    for (const [start, end] of session.missing as [number, number][]) {
+      for (let offset = start; offset < end; offset += chunkSize) {
+        chunks.push([offset, Math.min(offset + chunkSize, end)]);
+      }
+    }
+    log.info('API', '開始分塊上傳影片', {
+      project_id,
+      fileName: file.name,
+      fileSize: file.size,
+      upload_id: session.upload_id,
+      resumedBytes: session.bytes_received,
+      chunks: chunks.length,
+    });
+
+    const sendChunk = async ([start, end]: [number, number]) => {
+      for (let attempt = 1; ; attempt++) {
+        try {
+          const response = await fetch(`${baseUrl}/uploads/${session.upload_id}?offset=${start}`, {
+            method: "PUT",
+            headers: { "Content-Type": "application/octet-stream" },
+            body: file.slice(start, end),
+          });
+          if (response.ok) return;
+          // 伺服器上傳名額已滿：依 Retry-After 等待後重送，不計入重試次數
+          if (response.status === 503) {
+            const retryAfter = Number(response.headers.get("Retry-After")) || 5;
+            await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+            attempt--;
+            continue;
+          }
+          // 4xx（413/416 等）重送也不會成功
+          if (response.status < 500) throw Object.assign(await readError(response), { fatal: true });
+          throw await readError(response);
+        } catch (error: any) {
+          if (error.fatal || attempt >= RESUMABLE_UPLOAD_RETRIES) throw error;
+          log.warn('API', '分塊上傳失敗，重試中', { start, attempt, error: error.message });
+          await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** (attempt - 1)));
+        }
+      }
+    };
+    let next = 0;
+    const workers = Array.from({ length: Math.min(RESUMABLE_UPLOAD_PARALLEL, chunks.length) }, async () => {
+      while (next < chunks.length) await sendChunk(chunks[next++]);
+    });
+    await Promise.all(workers);
+
+    const response = await fetch(`${baseUrl}/uploads/${session.upload_id}/complete`, { method: "POST" });
+    if (!response.ok) {
+      const error = await readError(response);
+      log.error('API', '上傳失敗', { status: response.status, error: error.message });
+      // 檔案校驗失敗時 session 已無用，下次重新開始
+      if (response.status === 422) localStorage.removeItem(storageKey);
+      throw error;
+    }
+    localStorage.removeItem(storageKey);
+    const data = await response.json();
+    log.info('API', '上傳成功', {
+      filename: data.filename,
+      path: data.path,
+      size_bytes: data.size_bytes,
+      sha256: data.sha256
+    });
+    return data;
+  }
+
+  // 上傳後的匯入進度（probe → seek_index → proxy → thumbnails → ready / failed）
+  static async getIngestStatus(project_id: string | number, video_id: string | number): Promise<any> {
+    const baseUrl = await this.findWorkingBackendUrl();
+    const response = await fetch(`${baseUrl}/projects/${project_id}/videos/${video_id}/ingest`);
+    if (!response.ok) {
+      const error = await response.json().catch(() => ({}));
+      throw new Error(error.error || error.detail || `HTTP ${response.status}`);
+    }
+    return response.json();
+  }
+
   // === 2. 取得專案影片（推薦 GET）===
   static async getProjectVideos(project_id: number): Promise<uploadedVid[]> {
     const baseUrl = await this.findWorkingBackendUrl();
@@ -793,6 +918,7 @@ static async uploadVideo(project_id: string, file: File): Promise<any> {
         body: JSON.stringify({
           project_id: projectIdInt,
           video_id: cleanVideoId,  // 保持為字符串
+          session_id: PREFETCH_SESSION_ID,
         }),
       });
 
@@ -858,6 +984,11 @@ static async uploadVideo(project_id: string, file: File): Promise<any> {
         };
       }
       
+      // 後端只返回幀的 URL，圖片由瀏覽器直接載入（可被快取）
+      if (typeof data.url === 'string' && data.url) {
+        processedData.image = `${workingUrl}${data.url}`;
+      }
+      
       // 處理後端返回 None 的情況
       if (processedData.image === null || processedData.image === undefined) {
         processedData = {
@@ -1107,7 +1238,9 @@ static async uploadVideo(project_id: string, file: File): Promise<any> {
           y: Math.max(0, Number(bbox.y)), // 確保非負數
           width: Math.max(1, Number(bbox.width)), // 確保大於0
           height: Math.max(1, Number(bbox.height)) // 確保大於0
-        }))
+        })),
+        frame_width: annotationData.frame_width,
+        frame_height: annotationData.frame_height
       };
       
       // 驗證數據
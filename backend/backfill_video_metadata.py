@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+補齊影片資訊
+Probe frame count, fps, resolution, codec and duration for videos that were uploaded
+before this metadata was stored, and save them in the video table.
+
+Usage:
+    python backfill_video_metadata.py                  # videos that were never probed
+    python backfill_video_metadata.py --force          # re-probe every video
+    python backfill_video_metadata.py --project-id 17  # only one project
+    python backfill_video_metadata.py --seek-index     # also build missing keyframe seek indexes
+    python backfill_video_metadata.py --proxy          # also transcode missing annotation proxies
+    python backfill_video_metadata.py --blobs          # move videos into the blob store (one copy per content)
+"""
+
+import argparse
+import os
+import sys
+
+import pymysql
+from blobstore import BlobStore
+from db import DB_CONFIG
+from media import probe_video, build_seek_index, save_seek_index, load_seek_index, transcode_proxy, proxy_path
+
+
+def backfill(project_id=None, force=False, seek_index=False, proxy=False, blobs=False):
+    # Same database as server.py (not config.py, whose defaults point to another database)
+    connection = pymysql.connect(**DB_CONFIG)
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    try:
+        query = "SELECT video_id, video_path, proxy_path, content_hash FROM video WHERE 1 = 1"
+        params = []
+        if not force and not seek_index and not proxy and not blobs:
+            query += " AND fps IS NULL"
+        if project_id is not None:
+            query += " AND project_id = %s"
+            params.append(project_id)
+        cursor.execute(query, params)
+        videos = cursor.fetchall()
+        print(f'需要處理 {len(videos)} 個視頻')
+
+        store = BlobStore()
+        updated, failed = 0, 0
+        for video in videos:
+            # Identical files in several projects become hardlinks of one blob
+            if blobs and not video["content_hash"] and os.path.isfile(video["video_path"]):
+                digest, created = store.put_file(video["video_path"])
+                if not store.link(digest, video["video_path"]):
+                    video["video_path"] = store.path(digest)
+                cursor.execute("UPDATE video SET video_path = %s, content_hash = %s WHERE video_id = %s",
+                               (video["video_path"], digest, video["video_id"]))
+                connection.commit()
+                video["content_hash"] = digest
+                print(f'ID: {video["video_id"]}, sha256 {digest[:12]}, {"新內容" if created else "重複內容"}')
+            # Artifacts of stored content are kept next to the blob (shared by every copy)
+            artifact_path = video["video_path"]
+            if video["content_hash"] and store.exists(video["content_hash"]):
+                artifact_path = store.path(video["content_hash"])
+            if seek_index and (force or load_seek_index(artifact_path) is None):
+                index = build_seek_index(artifact_path)
+                if index is not None:
+                    save_seek_index(artifact_path, index)
+                    print(f'ID: {video["video_id"]}, 索引 {index.frame_count} 幀, {len(index.keyframes)} 個關鍵幀')
+            if proxy and (force or not video["proxy_path"]):
+                path = proxy_path(artifact_path)
+                if not force and video["content_hash"] and os.path.isfile(path):
+                    proxy_metadata = probe_video(path)
+                else:
+                    proxy_metadata = transcode_proxy(artifact_path)
+                    index = build_seek_index(path) if proxy_metadata is not None else None
+                    if index is not None:
+                        save_seek_index(path, index)
+                if proxy_metadata is None:
+                    print(f'無法轉檔 ID: {video["video_id"]}')
+                else:
+                    cursor.execute(
+                        "UPDATE video SET proxy_path = %s, proxy_frames = %s, proxy_width = %s, proxy_height = %s WHERE video_id = %s",
+                        (path, proxy_metadata["total_frames"], proxy_metadata["width"], proxy_metadata["height"], video["video_id"]))
+                    connection.commit()
+                    print(f'ID: {video["video_id"]}, 代理檔 {proxy_metadata["width"]}x{proxy_metadata["height"]}, '
+                          f'{proxy_metadata["total_frames"]} 幀')
+            metadata = probe_video(artifact_path)
+            if metadata is None:
+                print(f'無法打開視頻 ID: {video["video_id"]}, 路徑: {video["video_path"]}')
+                failed += 1
+                continue
+            cursor.execute(
+                "UPDATE video SET total_frames = %s, fps = %s, width = %s, height = %s, codec = %s, duration = %s WHERE video_id = %s",
+                (metadata["total_frames"], metadata["fps"], metadata["width"], metadata["height"],
+                 metadata["codec"], metadata["duration"], video["video_id"]))
+            connection.commit()
+            updated += 1
+            print(f'ID: {video["video_id"]}, {metadata["total_frames"]} 幀, {metadata["fps"]:.2f} fps, '
+                  f'{metadata["width"]}x{metadata["height"]}, {metadata["codec"]}, {metadata["duration"]:.1f}s')
+
+        print(f'完成: 更新 {updated} 個, 失敗 {failed} 個')
+        if blobs:
+            stats = store.stats()
+            print(f'檔案倉庫: {stats["blobs"]} 個檔案, {stats["bytes"] / 1024**3:.2f} GB')
+        return failed == 0
+    finally:
+        cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill video metadata")
+    parser.add_argument("--project-id", type=int)
+    parser.add_argument("--force", action="store_true", help="Re-probe videos that already have metadata")
+    parser.add_argument("--seek-index", action="store_true", help="Build keyframe seek indexes that are missing or outdated")
+    parser.add_argument("--proxy", action="store_true", help="Transcode annotation proxies that are missing")
+    parser.add_argument("--blobs", action="store_true", help="Store videos in the content-addressed blob store")
+    args = parser.parse_args()
+    success = backfill(args.project_id, args.force, args.seek_index, args.proxy, args.blobs)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,137 @@
+"""
+Nocodile 檔案倉庫
+Content-addressed storage: every distinct video is stored once, named by its SHA-256
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """
+    Files are stored as <root>/<aa>/<bb>/<sha256> and linked into the project directories, so
+    the same video uploaded to several projects uses the disk once. Artifacts derived from the
+    content (seek index, proxy, thumbnails) are stored next to the blob and shared as well.
+
+    The root must be on the same filesystem as the projects for hardlinks; otherwise link()
+    reports failure and callers reference the blob path directly.
+    """
+
+    def __init__(self, root=None):
+        default_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projects", ".blobs")
+        self.root = root or os.getenv('BLOB_STORE_DIR', default_root)
+        self._tmp_dir = os.path.join(self.root, "tmp")
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest):
+        return os.path.isfile(self.path(digest))
+
+    # Directory for artifacts derived from the blob (e.g. thumbnails)
+    def artifact_dir(self, digest):
+        return self.path(digest) + ".d"
+
+    # Incremental writer: hashes the bytes while they are written to a temporary file in the store
+    def writer(self):
+        os.makedirs(self._tmp_dir, exist_ok=True)
+        return BlobWriter(self)
+
+    # Move a finished file (on the store's filesystem) into place; an existing blob with the
+    # same content is kept and the file is removed
+    # Output: (blob path, True if the content was new)
+    def adopt(self, tmp_path, digest):
+        path = self.path(digest)
+        if os.path.isfile(path):
+            os.remove(tmp_path)
+            return path, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return path, True
+
+    # Store an existing file (e.g. a video uploaded before the blob store existed)
+    # Output: (digest, True if the content was new)
+    def put_file(self, source_path, chunk_size=8 * 1024 * 1024):
+        with self.writer() as writer:
+            with open(source_path, "rb") as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+            writer.commit()
+        return writer.digest, writer.created
+
+    # Hardlink the blob to destination (replacing a file that is already there)
+    # Output: True if destination is a hardlink of the blob
+    def link(self, digest, destination):
+        destination = str(destination)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        tmp_path = destination + ".link"
+        try:
+            os.link(self.path(digest), tmp_path)
+            os.replace(tmp_path, destination)
+            return True
+        except OSError as e:
+            logger.warning(f"Cannot hardlink blob {digest} to {destination}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def stats(self):
+        blobs, size = 0, 0
+        for directory, _, files in os.walk(self.root):
+            if directory.startswith(self._tmp_dir):
+                continue
+            for name in files:
+                if len(name) == 64:
+                    blobs += 1
+                    size += os.path.getsize(os.path.join(directory, name))
+        return {"root": self.root, "blobs": blobs, "bytes": size}
+
+
+class BlobWriter:
+    """Write chunks with write(), then commit() to store them under their SHA-256"""
+
+    def __init__(self, store):
+        self.store = store
+        self.size = 0
+        self.digest = None
+        self.path = None
+        self.created = False
+        self._hash = hashlib.sha256()
+        fd, self._tmp_path = tempfile.mkstemp(dir=store._tmp_dir, suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    # The bytes are flushed to disk before the blob is moved into place, so a stored blob
+    # survives a crash once commit() returned
+    # Output: (digest, True if the content was new)
+    def commit(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self.digest = self._hash.hexdigest()
+        self.path, self.created = self.store.adopt(self._tmp_path, self.digest)
+        return self.digest, self.created
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        if self.digest is None and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.abort()
+        return False
@@ -0,0 +1,183 @@
+"""
+Nocodile 快取
+Small thread-safe in-process caches shared by the API endpoints
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries expire `ttl` seconds after they were stored.
+
+    Values are loaded with get_or_load(key, loader) (read-through) and dropped with
+    invalidate() whenever the backing data is written. Hits, misses, expiries and
+    evictions are counted for /metrics.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or int(os.getenv('PROJECT_CACHE_SIZE', '1024'))
+        self.ttl = ttl if ttl is not None else float(os.getenv('PROJECT_CACHE_TTL', '30'))
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._invalidations = 0
+        # Bumped by every invalidation, so a load that raced with a write is not stored
+        self._generation = 0
+
+    # Output: (True, value) on a hit, (False, None) otherwise
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, entry[1]
+                del self._entries[key]
+                self._expired += 1
+            self._misses += 1
+            return False, None
+
+    def set(self, key, value, generation=None):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    # Return the cached value for `key`, calling loader() and caching its result on a miss
+    def get_or_load(self, key, loader):
+        hit, value = self.lookup(key)
+        if hit:
+            return value
+        generation = self._generation
+        value = loader()
+        self.set(key, value, generation)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "expired": self._expired,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+            }
+
+
+class FrameCache:
+    """
+    LRU cache of encoded frames bounded by total size in bytes.
+
+    Keys are (video_id, frame version, frame_num, encoding params), values are bytes. Entries larger than
+    the whole budget are not stored. invalidate_video() drops every frame of a video, e.g.
+    when its file is replaced or deleted.
+    """
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('FRAME_CACHE_MB', '256')) * 1024 * 1024
+        self._entries = OrderedDict()  # key -> bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._evicted_bytes = 0
+        self._invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return data
+
+    # Membership test that does not count as a hit or miss and does not refresh the entry
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, data):
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._evictions += 1
+                self._evicted_bytes += len(evicted)
+
+    # Return the cached frame, calling loader() and caching its result on a miss
+    def get_or_load(self, key, loader):
+        data = self.get(key)
+        if data is None:
+            data = loader()
+            self.put(key, data)
+        return data
+
+    def invalidate_video(self, video_id):
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == video_id]
+            for key in keys:
+                self._bytes -= len(self._entries.pop(key))
+            self._invalidations += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "frames": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "evicted_bytes": self._evicted_bytes,
+                "invalidations": self._invalidations,
+            }
@@ -1,5 +1,11 @@
 
 import cv2
+import gc
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from segment_anything import SamAutomaticMaskGenerator, sam_model_registry
 import os
 from PIL import Image
@@ -9,111 +15,316 @@ import torch.nn.functional as F
 from transformers import AutoModelForImageSegmentation
 from torchvision.transforms.functional import normalize
 import numpy as np
+from media import get_decoder, load_seek_index
+
+logger = logging.getLogger(__name__)
+
+# Decode a range of a video once and hand the frames to every consumer of that range
+# (tracker, segmenter, JPEG writer) instead of letting each of them decode it again
+
+class FrameReader:
+    """
+    Iterate over (frame_num, frame) for frames [start, end) of a video, decoded on a background
+    thread into a bounded queue, so decoding overlaps with the consumers while at most
+    queue_size frames are held in memory. decode_seconds and frames_read measure the decode cost.
+    Frames come from the configured decoder (media.get_decoder) unless one is passed in.
+    """
+
+    _END = object()
+
+    def __init__(self, video_path, start=0, end=None, queue_size=None, decoder=None):
+        self.video_path = str(video_path)
+        self.start = start
+        self.end = end
+        self.decoder = decoder or get_decoder()
+        # PyAV numbers frames by the indexed pts when the video has a seek index
+        self.index = load_seek_index(self.video_path)
+        self.queue_size = queue_size or int(os.getenv('FRAME_READER_QUEUE', '8'))
+        self.decode_seconds = 0.0
+        self.frames_read = 0
+
+    def __iter__(self):
+        frames = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._decode, args=(frames, stop), name="frame-reader", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is FrameReader._END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # The consumer may stop early; unblock the decoder and wait for it to release the file
+            stop.set()
+            while thread.is_alive():
+                try:
+                    frames.get_nowait()
+                except queue.Empty:
+                    pass
+                thread.join(timeout=0.05)
+
+    def _decode(self, frames, stop):
+        decoded = self.decoder.frames(self.video_path, self.start, self.end, self.index)
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                item = next(decoded, None)
+                self.decode_seconds += time.perf_counter() - started
+                if item is None:
+                    break
+                self.frames_read += 1
+                frames.put(item)
+        except Exception as e:
+            frames.put(e)
+        finally:
+            decoded.close()
+            frames.put(FrameReader._END)
+
+    def stats(self):
+        return {
+            "decoder": self.decoder.name,
+            "frames": self.frames_read,
+            "decode_s": round(self.decode_seconds, 3),
+            "decode_fps": round(self.frames_read / self.decode_seconds, 1) if self.decode_seconds else 0.0,
+        }
 
 # Users shall create an instance of KCF class for each video, multiple predictions can be made on the same video instance
 # starting_frame_bbox is in (x, y, width, height) format
+# Callers that already decode the frames use init() and update() directly
 
 class KCF:
-    # Define video path when initializing
-    def __init__(self, video_path):
-        self.cap = cv2.VideoCapture(video_path)
-        if not self.cap.isOpened():
-            print(f"无法打开视频文件 {video_path}")
-            return None
+    # Define video path when initializing (only needed for predict_frames)
+    def __init__(self, video_path=None):
+        self.video_path = video_path
+        self.tracker = None
 
     def release(self):
-        self.cap.release()
-
-    def predict_frames(self, starting_frame_bbox, starting_frame_num=0, ending_frame_num=60):
-        """
-        预测多帧中目标的位置
-        """
-
-        # reset cap before reading frames
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, starting_frame_num)
-
-        ret, starting_frame = self.cap.read()
-        if not ret:
-            print(f"无法读取第 {starting_frame} 帧，视频可能结束")
-            self.release()
-            return None
-
-        print("成功读取起始帧。")
-
-        height, width = starting_frame.shape[:2]
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
-        total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-
-        print(f"视频尺寸: {width}x{height}")
-        print(f"视频帧率: {fps:.2f} FPS")
-        print(f"总帧数: {total_frames-starting_frame_num}")
-        print(f"原始边界框: {starting_frame_bbox}")
-        print("准备创建跟踪器...")
+        self.tracker = None
 
+    # Start tracking starting_frame_bbox on frame
+    # Output: True if the tracker was initialized
+    def init(self, frame, starting_frame_bbox):
         # 使用TrackerMIL跟踪器
         try:
             tracker = cv2.TrackerMIL_create()
-            print("成功创建跟踪器")
         except Exception as e:
             print(f"创建跟踪器失败: {e}")
-            self.release()
-            return None
+            return False
 
         # 将边界框转换为OpenCV格式 (x, y, width, height)
         adjusted_bbox = tuple(starting_frame_bbox)
-
-        print(f"尝试初始化跟踪器，边界框: {adjusted_bbox}")
         try:
-            success = tracker.init(starting_frame, adjusted_bbox)
-            print(f"跟踪器初始化结果: {success}")
-
-            # 处理返回None的情况
-            if success is None:
-                print("跟踪器初始化返回None，尝试继续执行")
-                success = True  # 假设初始化成功
-            elif not success:
+            success = tracker.init(frame, adjusted_bbox)
+            # 处理返回None的情况 (OpenCV 4.5+ 的 init 沒有返回值)
+            if success is not None and not success:
                 print("跟踪器初始化明确失败")
-                self.release()
-                return None
+                return False
         except Exception as e:
             print(f"跟踪器初始化异常: {e}")
-            self.release()
-            return None
-
-        # 跟踪多帧
-        tracking_results = []
-
-        print(f"开始根据 {starting_frame_num} 帧跟踪 {ending_frame_num} 帧...")
-
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, starting_frame_num)
-        for frame_num in range(starting_frame_num, ending_frame_num + 1):
-            ret, frame = self.cap.read()
-            if not ret:
-                print(f"无法读取第 {frame_num + 1} 帧，视频可能结束")
-                break
+            return False
+        self.tracker = tracker
+        return True
+
+    # Output: (x, y, width, height) as integers, or None if the target was lost
+    def update(self, frame):
+        success, bbox = self.tracker.update(frame)
+        if success:
+            # 将浮点数转换为整数
+            return tuple(map(int, bbox))
+        return None
 
-            # 更新跟踪器
-            success, bbox = tracker.update(frame)
-
-            if success:
-                # 将浮点数转换为整数
-                bbox = tuple(map(int, bbox))
+    def predict_frames(self, starting_frame_bbox, starting_frame_num=0, ending_frame_num=60):
+        """
+        预测多帧中目标的位置
+        Output: [bbox or None for frames starting_frame_num .. ending_frame_num], or None if tracking cannot start
+        """
+        print(f"开始根据 {starting_frame_num} 帧跟踪 {ending_frame_num} 帧, 原始边界框: {starting_frame_bbox}")
+        tracking_results = None
+        try:
+            for frame_num, frame in FrameReader(self.video_path, starting_frame_num, ending_frame_num + 1):
+                if tracking_results is None:
+                    if not self.init(frame, starting_frame_bbox):
+                        return None
+                    tracking_results = []
+                bbox = self.update(frame)
+                if bbox is None:
+                    print(f"第 {frame_num + 1} 帧跟踪失败")
                 tracking_results.append(bbox)
-                print(f"第 {frame_num + 1} 帧跟踪成功: {bbox}")
-            else:
-                print(f"第 {frame_num + 1} 帧跟踪失败")
-                tracking_results.append(None)
-
+        except (IOError, ValueError) as e:
+            print(e)
+            return None
+        finally:
+            self.release()
         return tracking_results
 
+# Models are loaded once per process and shared by every job that uses them
+
+def _torch_device():
+    return torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+def _load_sam():
+    model = sam_model_registry[os.getenv('SAM_MODEL_TYPE', 'vit_b')](checkpoint=os.getenv('SAM_CHECKPOINT', 'sam_vit_b_01ec64.pth'))
+    return model.to(_torch_device()).eval()
+
+def _load_rmbg():
+    model = AutoModelForImageSegmentation.from_pretrained("RMBG-1.4", trust_remote_code=True)
+    return model.to(_torch_device()).eval()
+
+# Bytes held by the parameters and buffers of a torch module
+def _model_bytes(model):
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Load each registered model on first use and keep it for the whole process.
+
+    use(name) pins the model while a job runs, so it is never evicted in the middle of a job.
+    Unpinned models idle for MODEL_IDLE_TIMEOUT seconds are evicted by a background thread
+    (started with start(), 0 = never), and the least recently used unpinned models are evicted
+    when loading another one would exceed MODEL_MEMORY_MB. start() can also load models right
+    away (MODEL_WARMUP, e.g. "sam,rmbg") so the first job does not pay for the load.
+    """
+
+    def __init__(self, memory_mb=None, idle_timeout=None):
+        self.memory_budget = (memory_mb or int(os.getenv('MODEL_MEMORY_MB', '4096'))) * 1024 * 1024
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.getenv('MODEL_IDLE_TIMEOUT', '1800'))
+        self._loaders = {}
+        self._load_locks = {}
+        self._models = {}  # name -> {"model", "bytes", "users", "last_used"}
+        self._sizes = {}   # name -> bytes of the last load, to make room before loading it again
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._loads = 0
+        self._hits = 0
+        self._evictions = 0
+        self._load_seconds = 0.0
+
+    def register(self, name, loader):
+        self._loaders[name] = loader
+        self._load_locks[name] = threading.Lock()
+
+    @contextmanager
+    def use(self, name):
+        entry = self._acquire(name)
+        try:
+            yield entry["model"]
+        finally:
+            with self._lock:
+                entry["users"] -= 1
+                entry["last_used"] = time.time()
+
+    def _acquire(self, name):
+        # Jobs asking for a model that is being loaded wait for that load instead of starting another
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._models.get(name)
+                if entry is not None:
+                    entry["users"] += 1
+                    self._hits += 1
+                    return entry
+                self._make_room(self._sizes.get(name, 0))
+            started = time.perf_counter()
+            model = self._loaders[name]()
+            seconds = time.perf_counter() - started
+            size = _model_bytes(model)
+            with self._lock:
+                self._make_room(size)
+                entry = {"model": model, "bytes": size, "users": 1, "last_used": time.time()}
+                self._models[name] = entry
+                self._sizes[name] = size
+                self._loads += 1
+                self._load_seconds += seconds
+            logger.info(f"Loaded model {name} ({size / 1024 ** 2:.0f} MB) in {seconds:.1f}s")
+            return entry
+
+    # Called with the lock held
+    def _make_room(self, size):
+        while sum(e["bytes"] for e in self._models.values()) + size > self.memory_budget:
+            idle = [(e["last_used"], n) for n, e in self._models.items() if e["users"] == 0]
+            if not idle:
+                logger.warning(f"Models in use exceed MODEL_MEMORY_MB ({self.memory_budget // 1024 ** 2} MB)")
+                return
+            self._evict(min(idle)[1])
+
+    # Called with the lock held
+    def _evict(self, name):
+        del self._models[name]
+        self._evictions += 1
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info(f"Evicted model {name}")
+
+    def evict_idle(self):
+        if self.idle_timeout <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            for name in [n for n, e in self._models.items()
+                         if e["users"] == 0 and now - e["last_used"] > self.idle_timeout]:
+                self._evict(name)
+
+    def warm(self, names):
+        for name in names:
+            try:
+                with self.use(name):
+                    pass
+            except Exception as e:
+                logger.warning(f"Could not warm up model {name}: {e}")
+
+    # Start the idle eviction thread and load the `warm` models in the background
+    def start(self, warm=None):
+        warm = warm if warm is not None else [n for n in os.getenv('MODEL_WARMUP', '').split(",") if n.strip()]
+        warm = [n.strip() for n in warm if n.strip() in self._loaders]
+        if warm:
+            threading.Thread(target=self.warm, args=(warm,), name="model-warmup", daemon=True).start()
+        if self.idle_timeout > 0:
+            threading.Thread(target=self._reap, name="model-reaper", daemon=True).start()
+
+    def _reap(self):
+        while not self._stop.wait(min(60.0, self.idle_timeout)):
+            self.evict_idle()
+
+    def shutdown(self):
+        self._stop.set()
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            return {
+                "budget_mb": self.memory_budget // 1024 ** 2,
+                "loaded": {n: {"mb": round(e["bytes"] / 1024 ** 2, 1), "users": e["users"],
+                               "idle_s": round(now - e["last_used"], 1)} for n, e in self._models.items()},
+                "loads": self._loads,
+                "hits": self._hits,
+                "evictions": self._evictions,
+                "load_s": round(self._load_seconds, 2),
+            }
+
+
+model_registry = ModelRegistry()
+model_registry.register("sam", _load_sam)
+model_registry.register("rmbg", _load_rmbg)
+
+
 class SAM:
-    def __init__(self, image):
-        self.sam = sam_model_registry["vit_b"](checkpoint="sam_vit_b_01ec64.pth")
+    # model: a SAM model the caller already holds (e.g. for a whole auto-annotation job),
+    # otherwise the shared one is taken from model_registry for each segment() call
+    def __init__(self, image, model=None):
+        self.sam = model
         self.image = image
         
     def segment(self):
-        mask_generator = SamAutomaticMaskGenerator(self.sam)
-        masks = mask_generator.generate(self.image)
+        if self.sam is None:
+            with model_registry.use("sam") as sam:
+                masks = SamAutomaticMaskGenerator(sam).generate(self.image)
+        else:
+            masks = SamAutomaticMaskGenerator(self.sam).generate(self.image)
         self.bboxes = []
         for mask in masks:
             bbox = mask['bbox']
@@ -144,9 +355,7 @@ class RMBG():
         self.foreground_boundary_path = f"{base}_foreground_boundary{ext}"
         self.foreground_path = f"{base}_foreground{ext}"
 
-        # Load model
-        self.model = AutoModelForImageSegmentation.from_pretrained("RMBG-1.4", trust_remote_code=True)
-
+    @staticmethod
     def preprocess_image(im: np.ndarray, model_input_size: list) -> torch.Tensor:
         if len(im.shape) < 3:
             im = im[:, :, np.newaxis]
@@ -156,6 +365,7 @@ class RMBG():
         image = normalize(image, [0.5, 0.5, 0.5], [1.0, 1.0, 1.0])
         return image
 
+    @staticmethod
     def postprocess_image(result: torch.Tensor, im_size: list) -> np.ndarray:
         result = torch.squeeze(F.interpolate(result, size=im_size, mode='bilinear'), 0)
         binary_mask = (result > 0.5).float()  # Create a binary mask
@@ -164,8 +374,7 @@ class RMBG():
         return im_array
 
     def remove_background(self):
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-        self.model.to(device)
+        device = _torch_device()
 
         # Prepare input
         orig_im = io.imread(self.image_path)
@@ -173,8 +382,9 @@ class RMBG():
         model_input_size = [1024, 1024]
         image = self.preprocess_image(orig_im, model_input_size).to(device)
 
-        # Inference
-        result = self.model(image)
+        # Inference (the model is loaded once, see model_registry)
+        with model_registry.use("rmbg") as model, torch.no_grad():
+            result = model(image)
 
         # Post process
         self.result_image = self.postprocess_image(result[0][0], orig_im_size)
@@ -0,0 +1,338 @@
+"""
+Nocodile 資料庫連接池
+Thread-safe pymysql connection pool shared by the API endpoints and background jobs
+"""
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+import pymysql.cursors
+
+
+# Connection settings of the Nocodile database, shared by server.py and the maintenance scripts
+# (backfill_video_metadata.py) so they always read and write the same database
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': 'noconoconocodile',
+    'database': 'Nocodile',
+    'charset': 'utf8mb4'
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the pool timeout"""
+
+
+class _CountingConnection(pymysql.connections.Connection):
+    """pymysql connection that reports every statement sent to the server back to its pool"""
+
+    def __init__(self, *args, pool=None, **kwargs):
+        self._pool = pool
+        super().__init__(*args, **kwargs)
+
+    def query(self, sql, unbuffered=False):
+        if self._pool is not None:
+            self._pool._count_query()
+        return super().query(sql, unbuffered)
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of pymysql connections.
+
+    Connections are created lazily up to `size`. Every checkout records how long the
+    caller waited, idle connections are pinged (and transparently reconnected) before
+    being handed out, and connections older than `recycle` seconds are replaced.
+    Statements sent to the server are counted so that round trips per request can be measured.
+    """
+
+    def __init__(self, conn_config: dict, size=None, timeout=None, recycle=None, ping_interval=None):
+        self.conn_config = dict(conn_config)
+        self.size = size or int(os.getenv('MYSQL_POOL_SIZE', '10'))
+        self.timeout = timeout or float(os.getenv('MYSQL_POOL_TIMEOUT', '30'))
+        self.recycle = recycle or float(os.getenv('MYSQL_POOL_RECYCLE', '3600'))
+        self.ping_interval = ping_interval if ping_interval is not None else float(os.getenv('MYSQL_POOL_PING_INTERVAL', '30'))
+
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._lock = threading.Lock()
+        # Notified whenever a connection is returned or a slot is freed
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._in_use = 0
+        # id(connection) -> (created_at, last_used_at)
+        self._timestamps = {}
+
+        # Checkout metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_last = 0.0
+        self._queries = 0
+
+    # Open a new physical connection
+    def _connect(self):
+        conn = _CountingConnection(pool=self, **self.conn_config)
+        now = time.monotonic()
+        self._timestamps[id(conn)] = (now, now)
+        return conn
+
+    # Close a connection and free its slot in the pool
+    def _discard(self, conn):
+        self._timestamps.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+            self._available.notify()
+
+    def _count_query(self):
+        with self._lock:
+            self._queries += 1
+
+    # Make sure an idle connection is still usable before handing it out
+    def _check_health(self, conn):
+        created_at, last_used = self._timestamps.get(id(conn), (0, 0))
+        now = time.monotonic()
+        if now - created_at > self.recycle:
+            self._timestamps.pop(id(conn), None)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._reconnects += 1
+            return self._connect()
+        if now - last_used > self.ping_interval or not conn.open:
+            try:
+                conn.ping(reconnect=True)
+            except pymysql.Error:
+                self._timestamps.pop(id(conn), None)
+                with self._lock:
+                    self._reconnects += 1
+                return self._connect()
+        return conn
+
+    # Check out a connection
+    # Output: pymysql connection (must be given back with release())
+    def acquire(self):
+        start = time.perf_counter()
+        deadline = start + self.timeout
+        conn = None
+        create = False
+        # Wait until a connection is returned or a slot is freed (e.g. a broken connection was discarded)
+        with self._available:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                    break
+                except queue.Empty:
+                    pass
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                    break
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout:.1f}s (pool size {self.size})")
+                self._available.wait(remaining)
+
+        if create:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                    self._available.notify()
+                raise
+
+        try:
+            conn = self._check_health(conn)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_last = waited
+            self._wait_max = max(self._wait_max, waited)
+        return conn
+
+    # Give a connection back to the pool
+    # Broken connections (or ones with an open transaction after an error) are dropped
+    def release(self, conn, discard=False):
+        with self._lock:
+            self._in_use -= 1
+        if discard or not conn.open:
+            self._discard(conn)
+            return
+        created_at, _ = self._timestamps.get(id(conn), (time.monotonic(), 0))
+        self._timestamps[id(conn)] = (created_at, time.monotonic())
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._discard(conn)
+            return
+        with self._lock:
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a `with` block"""
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    @contextmanager
+    def cursor(self, cursor_class=pymysql.cursors.DictCursor):
+        """
+        Check out a connection and yield a cursor on it.
+        The transaction is committed when the block exits normally and rolled back otherwise.
+        """
+        with self.connection() as conn:
+            cursor = conn.cursor(cursor_class)
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                try:
+                    conn.rollback()
+                except pymysql.Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
+    # Open one connection up front so that configuration errors show up at startup
+    def warmup(self):
+        conn = self.acquire()
+        self.release(conn)
+
+    # Check whether the database can currently be reached
+    # Output: True/False
+    def ping(self):
+        try:
+            with self.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    # Pool metrics, including checkout wait times in milliseconds
+    def stats(self):
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": checkouts,
+                "queries": self._queries,
+                "timeouts": self._timeouts,
+                "reconnects": self._reconnects,
+                "wait_ms_avg": round(self._wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 3),
+                "wait_ms_last": round(self._wait_last * 1000, 3),
+            }
+
+
+class BatchWriter:
+    """
+    Buffer rows for one INSERT statement and write them with executemany.
+
+    Each flush is a single transaction. `on_flush(cursor, rows)` runs inside that same
+    transaction, e.g. to record progress together with the rows it covers. Leaving the
+    `with` block flushes whatever is still buffered, also when the block raised.
+    """
+
+    def __init__(self, pool, query, flush_size=None, on_flush=None):
+        self.pool = pool
+        self.query = query
+        self.flush_size = flush_size or int(os.getenv('BBOX_FLUSH_SIZE', '500'))
+        self.on_flush = on_flush
+        self.rows = []
+        self.written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return 0
+        rows, self.rows = self.rows, []
+        with self.pool.cursor() as cursor:
+            cursor.executemany(self.query, rows)
+            if self.on_flush is not None:
+                self.on_flush(cursor, rows)
+        self.written += len(rows)
+        return len(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
+
+
+class ProgressWriter:
+    """
+    Coalesce progress updates from a hot loop into occasional saves.
+
+    update(value) only remembers the latest value; `save(value)` is called when `interval`
+    seconds have passed or `every` updates have piled up since the last save. Leaving the
+    `with` block (normally or through an exception) always saves the latest value.
+    """
+
+    def __init__(self, save, interval=None, every=None):
+        self.save = save
+        self.interval = interval if interval is not None else float(os.getenv('PROGRESS_FLUSH_INTERVAL', '2'))
+        self.every = every or int(os.getenv('PROGRESS_FLUSH_EVERY', '100'))
+        self.value = None
+        self.pending = 0
+        self.saves = 0
+        self._last_save = time.monotonic()
+
+    def update(self, value):
+        self.value = value
+        self.pending += 1
+        if self.pending >= self.every or time.monotonic() - self._last_save >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        self.save(self.value)
+        self.pending = 0
+        self.saves += 1
+        self._last_save = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+        return False
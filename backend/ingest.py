@@ -0,0 +1,121 @@
+"""
+Nocodile 影片匯入
+Post-upload pipeline: the stages that make an uploaded video ready for annotation run in the
+background, so the upload returns as soon as the bytes are stored
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+READY = "ready"
+FAILED = "failed"
+
+
+class IngestPipeline:
+    """
+    Run the ingest stages of each video, in order, on INGEST_WORKERS threads.
+
+    A job is a list of (stage name, function, required). Before each stage on_status(key, stage)
+    is called, at the end on_status(key, "ready"). A required stage that raises or returns False
+    stops the job with on_status(key, "failed", error); an optional one is logged and skipped
+    (e.g. frames are still read from the original when the proxy cannot be written).
+    A key that is already queued or running is not submitted a second time. Jobs with the same
+    group (e.g. the content hash, whose artifacts they share) run one after another: a later
+    one waits in the group's queue, not on a worker, and then finds the artifacts already built.
+    """
+
+    def __init__(self, on_status, workers=None):
+        self.on_status = on_status
+        self._executor = ThreadPoolExecutor(max_workers=workers or int(os.getenv('INGEST_WORKERS', '2')),
+                                            thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self._jobs = {}  # key -> future (None while waiting for its group)
+        self._groups = {}  # group -> deque of (key, stages) waiting for the running job of the group
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._stage_seconds = {}  # stage -> total seconds
+
+    # Output: True if the job was queued
+    def submit(self, key, stages, group=None):
+        with self._lock:
+            if key in self._jobs:
+                return False
+            self._jobs[key] = None
+            self._submitted += 1
+        # The status is written (a database round trip) without holding the lock
+        self._set_status(key, QUEUED)
+        with self._lock:
+            if group is not None and group in self._groups:
+                self._groups[group].append((key, stages))
+                return True
+            if group is not None:
+                self._groups[group] = deque()
+            self._jobs[key] = self._executor.submit(self._run, key, stages, group)
+            return True
+
+    def pending(self, key):
+        with self._lock:
+            return key in self._jobs
+
+    def _set_status(self, key, status, error=None):
+        try:
+            self.on_status(key, status, error)
+        except Exception as e:
+            logger.warning(f"Could not record ingest status {status} of {key}: {e}")
+
+    def _run(self, key, stages, group=None):
+        failed = None
+        try:
+            for stage, function, required in stages:
+                self._set_status(key, stage)
+                start = time.perf_counter()
+                try:
+                    ok = function() is not False
+                    error = None if ok else f"{stage} failed"
+                except Exception as e:
+                    ok, error = False, f"{stage}: {e}"
+                    logger.exception(f"Ingest stage {stage} of {key} raised")
+                with self._lock:
+                    self._stage_seconds[stage] = self._stage_seconds.get(stage, 0.0) + time.perf_counter() - start
+                if not ok and required:
+                    failed = error
+                    break
+                if not ok:
+                    logger.warning(f"Ingest of {key}: optional stage {stage} failed, continuing")
+        finally:
+            self._set_status(key, FAILED if failed else READY, failed)
+            with self._lock:
+                self._jobs.pop(key, None)
+                if failed:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+                # Start the next job of the group
+                if group is not None:
+                    waiting = self._groups[group]
+                    if waiting:
+                        next_key, next_stages = waiting.popleft()
+                        self._jobs[next_key] = self._executor.submit(self._run, next_key, next_stages, group)
+                    else:
+                        del self._groups[group]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._jobs),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "stage_seconds": {stage: round(s, 2) for stage, s in self._stage_seconds.items()},
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,588 @@
+"""
+Nocodile 影片工具
+Helpers that read information from video files (used by server.py and the maintenance scripts)
+"""
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+try:
+    import av
+except ImportError:
+    av = None
+
+logger = logging.getLogger(__name__)
+
+
+# Unique temporary file next to path (same filesystem, so os.replace() of it is atomic). Writers of the
+# same artifact at the same time (two ingests of one content, the backfill script) do not share it
+def _temp_path(path, suffix=".tmp"):
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, prefix=os.path.basename(path) + ".",
+                                    dir=os.path.dirname(path) or ".")
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)  # mkstemp creates it private; the artifact is an ordinary file
+    return tmp_path
+
+
+# Read frame count, fps, resolution, codec and duration with a single VideoCapture
+# Output: {"total_frames": int, "fps": float, "width": int, "height": int, "codec": str, "duration": float}
+#         or None if the file cannot be opened
+def probe_video(video_path):
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        if not cap.isOpened():
+            return None
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = float(cap.get(cv2.CAP_PROP_FPS))
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    finally:
+        cap.release()
+    codec = "".join(chr((fourcc >> 8 * i) & 0xFF) for i in range(4)).strip("\x00 ")
+    return {
+        "total_frames": total_frames,
+        "fps": fps,
+        "width": width,
+        "height": height,
+        "codec": codec,
+        "duration": total_frames / fps if fps > 0 else 0.0,
+    }
+
+
+#=================================== Seek index ==========================================
+# Per-video index of presentation timestamps and keyframes, stored next to the video as
+# <video>.seekidx.npz. With PyAV, random access seeks to the nearest keyframe at or before the
+# wanted frame and matches decoded frames by pts, so a read costs at most one GOP and frame
+# numbers follow the real timestamps (also for variable frame rate files and streams that do
+# not start at 0). OpenCV cannot match frames by pts, so it does not use the index for seeking;
+# an index built by the OpenCV fallback only provides the frame count and GOP statistics.
+
+SEEK_INDEX_SUFFIX = ".seekidx.npz"
+
+
+class SeekIndex:
+    def __init__(self, pts, keyframes, time_base, file_size=0, file_mtime=0.0, backend=""):
+        self.pts = pts              # int64 array, presentation timestamp of every frame in stream time_base units
+        self.keyframes = keyframes  # int32 array, sorted frame numbers of keyframes
+        self.time_base = time_base  # seconds per pts unit
+        self.file_size = file_size
+        self.file_mtime = file_mtime
+        self.backend = backend
+
+    @property
+    def frame_count(self):
+        return len(self.pts)
+
+    # Frame number of the last keyframe at or before frame_num
+    def keyframe_before(self, frame_num):
+        i = int(np.searchsorted(self.keyframes, frame_num, side="right")) - 1
+        return int(self.keyframes[i]) if i >= 0 else 0
+
+    # Largest number of frames decoded to reach any frame
+    def max_gop(self):
+        bounds = np.append(self.keyframes, self.frame_count)
+        return int(np.diff(bounds).max()) if len(bounds) > 1 else self.frame_count
+
+    def timestamp(self, frame_num):
+        return float(self.pts[frame_num]) * self.time_base
+
+
+def seek_index_path(video_path):
+    return str(video_path) + SEEK_INDEX_SUFFIX
+
+
+# Packets are read in decode order, so the timestamps are sorted into presentation order
+# and the keyframes are mapped to their position in that order
+def _make_index(packet_pts, packet_keyframes, time_base, video_path, backend):
+    packet_pts = np.asarray(packet_pts, dtype=np.int64)
+    order = np.argsort(packet_pts, kind="stable")
+    pts = packet_pts[order]
+    is_keyframe = np.asarray(packet_keyframes, dtype=bool)[order]
+    keyframes = np.flatnonzero(is_keyframe).astype(np.int32)
+    if len(keyframes) == 0 or keyframes[0] != 0:
+        keyframes = np.insert(keyframes, 0, 0).astype(np.int32)
+    stat = os.stat(video_path)
+    return SeekIndex(pts, keyframes, time_base, stat.st_size, stat.st_mtime, backend)
+
+
+# Read packet timestamps and keyframe flags without decoding any frame
+# Output: SeekIndex or None if the file cannot be read
+def build_seek_index(video_path):
+    video_path = str(video_path)
+    if av is not None:
+        try:
+            with av.open(video_path) as container:
+                stream = container.streams.video[0]
+                packet_pts, packet_keyframes = [], []
+                for packet in container.demux(stream):
+                    pts = packet.pts if packet.pts is not None else packet.dts
+                    if pts is None or packet.size == 0:
+                        continue
+                    packet_pts.append(pts)
+                    packet_keyframes.append(packet.is_keyframe)
+                if packet_pts:
+                    return _make_index(packet_pts, packet_keyframes, float(stream.time_base), video_path, "pyav")
+        except (av.error.FFmpegError, IndexError):
+            pass
+
+    # OpenCV fallback: raw packets (CAP_PROP_FORMAT = -1) are not decoded
+    # Older OpenCV builds do not report keyframes, and an index without them is of no use
+    has_key_frame = getattr(cv2, "CAP_PROP_LRF_HAS_KEY_FRAME", None)
+    if has_key_frame is None:
+        return None
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    try:
+        if not cap.isOpened():
+            return None
+        cap.set(cv2.CAP_PROP_FORMAT, -1)
+        packet_pts, packet_keyframes = [], []
+        while cap.grab():
+            packet_pts.append(round(cap.get(cv2.CAP_PROP_POS_MSEC) * 1000))
+            packet_keyframes.append(bool(cap.get(has_key_frame)))
+    finally:
+        cap.release()
+    if not packet_pts:
+        return None
+    return _make_index(packet_pts, packet_keyframes, 1e-6, video_path, "opencv")
+
+
+def save_seek_index(video_path, index):
+    path = seek_index_path(video_path)
+    tmp_path = _temp_path(path, ".tmp.npz")
+    try:
+        np.savez(tmp_path, pts=index.pts, keyframes=index.keyframes, time_base=index.time_base,
+                 file_size=index.file_size, file_mtime=index.file_mtime, backend=index.backend)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path
+
+
+@lru_cache(maxsize=256)
+def _load_seek_index(path, index_mtime):
+    with np.load(path) as data:
+        return SeekIndex(data["pts"], data["keyframes"], float(data["time_base"]),
+                         int(data["file_size"]), float(data["file_mtime"]), str(data["backend"]))
+
+
+# Output: SeekIndex, or None if there is no index or it belongs to an older version of the file
+def load_seek_index(video_path):
+    path = seek_index_path(video_path)
+    try:
+        index = _load_seek_index(path, os.path.getmtime(path))
+        stat = os.stat(video_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if index.file_size != stat.st_size or abs(index.file_mtime - stat.st_mtime) > 1e-3:
+        return None
+    return index
+
+
+#=================================== Decoders ==========================================
+# All frame decoding goes through a decoder chosen by configuration:
+#   DECODER               opencv (cv2.VideoCapture) or pyav (FFmpeg through PyAV, frame + slice threading)
+#   DECODER_THREADS       decoding threads, 0 lets the library decide
+#   DECODER_PIXEL_FORMAT  bgr24 (what OpenCV and the models expect), rgb24 or gray
+# frames(video_path, start, end, index) yields (frame_num, image) for frames [start, end); PyAV
+# with a PyAV seek index starts decoding at the keyframe before `start` and numbers frames by pts.
+
+PIXEL_FORMATS = ("bgr24", "rgb24", "gray")
+
+
+class OpenCVDecoder:
+    name = "opencv"
+
+    def __init__(self, threads=0, pixel_format="bgr24"):
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unsupported pixel format '{pixel_format}'. Supported: {', '.join(PIXEL_FORMATS)}")
+        self.threads = threads
+        self.pixel_format = pixel_format
+
+    def _open(self, video_path):
+        # Thread count is an open-time parameter of the FFmpeg backend (OpenCV 4.6+)
+        n_threads = getattr(cv2, "CAP_PROP_N_THREADS", None)
+        if self.threads and n_threads is not None:
+            return cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [n_threads, self.threads])
+        return cv2.VideoCapture(video_path)
+
+    def _convert(self, frame):
+        if self.pixel_format == "rgb24":
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if self.pixel_format == "gray":
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+
+    def frames(self, video_path, start=0, end=None, index=None):
+        cap = self._open(str(video_path))
+        try:
+            if not cap.isOpened():
+                raise IOError(f"Cannot open video {video_path}")
+            # The seek index is not used: CAP_PROP_POS_MSEC is relative to the stream start and
+            # converted through the nominal fps, so it lands on the wrong frame for VFR files and
+            # streams with a non-zero start time. POS_FRAMES is OpenCV's own frame-accurate seek.
+            if start:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            frame_num = start
+            while end is None or frame_num < end:
+                ret, frame = cap.read()
+                if not ret:
+                    return
+                yield frame_num, self._convert(frame)
+                frame_num += 1
+        finally:
+            cap.release()
+
+
+class PyAVDecoder:
+    name = "pyav"
+
+    def __init__(self, threads=0, pixel_format="bgr24"):
+        if av is None:
+            raise ImportError("PyAV is not installed")
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unsupported pixel format '{pixel_format}'. Supported: {', '.join(PIXEL_FORMATS)}")
+        self.threads = threads
+        self.pixel_format = pixel_format
+
+    def frames(self, video_path, start=0, end=None, index=None):
+        with av.open(str(video_path)) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            stream.codec_context.thread_count = self.threads
+            if index is not None and index.backend == "pyav" and index.frame_count:
+                # Frame numbers follow the indexed presentation timestamps
+                def number(frame):
+                    return int(np.searchsorted(index.pts, frame.pts))
+                seek_pts = int(index.pts[index.keyframe_before(start)])
+            elif not start:
+                # Decoding from the first frame: frames are counted, which is exact also for VFR files
+                counter = iter(range(1 << 62))
+                def number(frame):
+                    return next(counter)
+                seek_pts = 0
+            else:
+                # Without an index, frame numbers are derived from the timestamp and the average rate
+                # (only exact for constant frame rate files)
+                rate = float(stream.average_rate or 0) or 30.0
+                first_pts = stream.start_time or 0
+                def number(frame):
+                    return int(round(float((frame.pts - first_pts) * stream.time_base) * rate))
+                seek_pts = first_pts + int(start / rate / stream.time_base)
+            if start:
+                container.seek(seek_pts, stream=stream, backward=True, any_frame=False)
+            for frame in container.decode(stream):
+                if frame.pts is None:
+                    continue
+                frame_num = number(frame)
+                if frame_num < start:
+                    continue
+                if end is not None and frame_num >= end:
+                    return
+                yield frame_num, frame.to_ndarray(format=self.pixel_format)
+
+
+DECODERS = {"opencv": OpenCVDecoder, "pyav": PyAVDecoder}
+_DECODE_ERRORS = (IOError, ValueError) + ((av.error.FFmpegError,) if av is not None else ())
+
+
+# Decoder from DECODER / DECODER_THREADS / DECODER_PIXEL_FORMAT, arguments override the configuration
+# Falls back to OpenCV when PyAV is configured but not installed
+def get_decoder(name=None, threads=None, pixel_format=None):
+    name = (name or os.getenv('DECODER', 'opencv')).lower()
+    threads = threads if threads is not None else int(os.getenv('DECODER_THREADS', '0'))
+    pixel_format = pixel_format or os.getenv('DECODER_PIXEL_FORMAT', 'bgr24')
+    if name not in DECODERS:
+        raise ValueError(f"Unknown decoder '{name}'. Supported: {', '.join(DECODERS)}")
+    if name == "pyav" and av is None:
+        logger.warning("DECODER=pyav but PyAV is not installed, decoding with OpenCV")
+        name = "opencv"
+    return DECODERS[name](threads, pixel_format)
+
+
+# Decode one frame: seek to the keyframe before it and decode forward
+# With a PyAV seek index the frame is read with PyAV (matched by pts, whatever DECODER is),
+# without one the decoder falls back to its own frame seek
+# Output: image (numpy array, DECODER_PIXEL_FORMAT) or None
+def read_frame(video_path, frame_num, index=None, decoder=None):
+    if index is not None and (frame_num < 0 or frame_num >= index.frame_count):
+        return None
+    if decoder is None:
+        exact = index is not None and index.backend == "pyav" and av is not None
+        decoder = get_decoder("pyav" if exact else None)
+    try:
+        for _, frame in decoder.frames(video_path, frame_num, frame_num + 1, index):
+            return frame
+    except _DECODE_ERRORS as e:
+        logger.warning(f"Could not read frame {frame_num} of {video_path}: {e}")
+    return None
+
+
+#=================================== Frame encoding ==========================================
+
+class FrameProfile:
+    """
+    How a frame is encoded for the annotation UI: image format, quality and the longest
+    side in pixels (0 keeps the source resolution). Used as part of the frame cache key.
+    """
+
+    FORMATS = {
+        "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+        "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+    }
+
+    def __init__(self, format="jpeg", quality=95, max_dim=0):
+        format = (format or "jpeg").lower()
+        if format == "jpg":
+            format = "jpeg"
+        if format not in self.FORMATS:
+            raise ValueError(f"Unsupported frame format '{format}'. Supported: {', '.join(self.FORMATS)}")
+        quality = 95 if quality is None else int(quality)
+        if not 1 <= quality <= 100:
+            raise ValueError("Frame quality must be between 1 and 100")
+        max_dim = int(max_dim or 0)
+        if max_dim < 0:
+            raise ValueError("max_dim must not be negative")
+        self.format, self.quality, self.max_dim = format, quality, max_dim
+
+    @property
+    def key(self):
+        return (self.format, self.quality, self.max_dim)
+
+    @property
+    def media_type(self):
+        return self.FORMATS[self.format][1]
+
+    def __eq__(self, other):
+        return isinstance(other, FrameProfile) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    # Query string of the frame endpoint for this profile
+    def query(self):
+        return f"format={self.format}&quality={self.quality}&max_dim={self.max_dim}"
+
+    # Size of an encoded frame for a source of width x height (aspect ratio is kept)
+    def scaled_size(self, width, height):
+        if not self.max_dim or max(width, height) <= self.max_dim:
+            return width, height
+        scale = self.max_dim / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# Output: encoded image bytes
+def encode_frame(frame, profile):
+    height, width = frame.shape[:2]
+    target = profile.scaled_size(width, height)
+    if target != (width, height):
+        frame = cv2.resize(frame, target, interpolation=cv2.INTER_AREA)
+    ext, _, quality_flag = FrameProfile.FORMATS[profile.format]
+    ok, buffer = cv2.imencode(ext, frame, [quality_flag, profile.quality])
+    if not ok:
+        raise ValueError(f"Could not encode frame as {profile.format}")
+    return buffer.tobytes()
+
+
+#=================================== Annotation proxy ==========================================
+# Phone videos are long-GOP, often variable frame rate and large. At ingest a proxy is written
+# next to the original as <video>.proxy.mp4: constant frame rate, a keyframe every PROXY_GOP
+# frames and the longest side capped at PROXY_MAX_DIM, so random access decodes at most a few
+# frames. Annotation reads frames from the proxy, so frame numbers are proxy frame numbers; the
+# dataset export decodes the original, at full quality, mapping each proxy frame to the source frame
+# it shows by timestamp (proxy_source_frames).
+
+PROXY_SUFFIX = ".proxy.mp4"
+
+
+def proxy_path(video_path):
+    return str(video_path) + PROXY_SUFFIX
+
+
+def _proxy_size(width, height, max_dim):
+    # Even dimensions for yuv420p
+    if max_dim and max(width, height) > max_dim:
+        scale = max_dim / max(width, height)
+        width, height = width * scale, height * scale
+    return max(2, int(round(width / 2)) * 2), max(2, int(round(height / 2)) * 2)
+
+
+def _transcode_ffmpeg(ffmpeg, video_path, output_path, fps, size, gop, crf):
+    command = [
+        ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", video_path, "-an",
+        "-vf", f"fps={fps},scale={size[0]}:{size[1]}:flags=area",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf), "-pix_fmt", "yuv420p",
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+        "-movflags", "+faststart", "-f", "mp4", output_path,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ffmpeg exited with {result.returncode}")
+
+
+# Constant frame rate by holding each decoded frame until the next one's timestamp: proxy frame n shows
+# the last source frame at or before (n + 0.5) / fps, i.e. timestamps are rounded to the nearest proxy
+# frame as ffmpeg's fps filter does. Times count from the first frame, so a stream that starts late
+# gets no leading copies
+def _transcode_pyav(video_path, output_path, fps, size, gop, crf):
+    with av.open(video_path) as source, av.open(output_path, "w", format="mp4") as target:
+        rate = Fraction(fps).limit_denominator(1001)
+        stream = target.add_stream("libx264", rate=rate)
+        stream.width, stream.height = size
+        stream.pix_fmt = "yuv420p"
+        stream.options = {"g": str(gop), "keyint_min": str(gop), "sc_threshold": "0",
+                          "crf": str(crf), "preset": "veryfast"}
+        time_base = stream.codec_context.time_base = 1 / rate
+        written, held, start = 0, None, None
+        for frame in source.decode(source.streams.video[0]):
+            if frame.time is None:
+                continue
+            if start is None:
+                start = frame.time
+            while held is not None and (written + 0.5) / fps < frame.time - start:
+                held.pts, held.time_base = written, time_base
+                target.mux(stream.encode(held))
+                written += 1
+            held = frame.reformat(width=size[0], height=size[1], format="yuv420p")
+        if held is not None:
+            held.pts, held.time_base = written, time_base
+            target.mux(stream.encode(held))
+        target.mux(stream.encode(None))
+
+
+# Source frame shown by every proxy frame, from the seek indexes of both files: proxy frame n shows the
+# last source frame whose time (from the first frame) is at or before its own, rounded to the nearest
+# proxy frame like the transcode
+# Output: int array with one source frame number per proxy frame
+def proxy_source_frames(source_index, proxy_index):
+    source = (source_index.pts - source_index.pts[0]) * source_index.time_base
+    proxy = (proxy_index.pts - proxy_index.pts[0]) * proxy_index.time_base
+    half_frame = float(np.median(np.diff(proxy))) / 2 if len(proxy) > 1 else 0.0
+    frames = np.searchsorted(source, proxy + half_frame + 1e-6, side="right") - 1
+    return np.clip(frames, 0, len(source) - 1)
+
+
+# Write the annotation proxy with the ffmpeg binary (FFMPEG_BINARY) or, without it, PyAV
+# Output: probe_video() of the proxy, or None if no encoder is available or the source cannot be read
+def transcode_proxy(video_path, max_dim=None, gop=None, crf=None):
+    video_path = str(video_path)
+    max_dim = max_dim if max_dim is not None else int(os.getenv('PROXY_MAX_DIM', '1280'))
+    gop = gop or int(os.getenv('PROXY_GOP', '10'))
+    crf = crf if crf is not None else int(os.getenv('PROXY_CRF', '20'))
+    metadata = probe_video(video_path)
+    if metadata is None or metadata["fps"] <= 0:
+        return None
+    # Same nominal rate as the original, so frame numbers of constant frame rate sources do not move
+    fps = round(metadata["fps"], 3)
+    size = _proxy_size(metadata["width"], metadata["height"], max_dim)
+
+    ffmpeg = shutil.which(os.getenv('FFMPEG_BINARY', 'ffmpeg'))
+    if ffmpeg is None and av is None:
+        return None
+    output_path = proxy_path(video_path)
+    tmp_path = _temp_path(output_path, ".tmp.mp4")
+    try:
+        if ffmpeg is not None:
+            _transcode_ffmpeg(ffmpeg, video_path, tmp_path, fps, size, gop, crf)
+        else:
+            _transcode_pyav(video_path, tmp_path, fps, size, gop, crf)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return probe_video(output_path)
+
+
+#=================================== Thumbnail sprites ==========================================
+# Timeline previews: one frame every THUMBNAIL_INTERVAL seconds, tiled into sprite-sheet JPEGs of
+# columns x rows thumbnails, with an index.json that maps each thumbnail to its sheet and offset.
+# Written in one sequential pass, so a whole timeline costs one or two image fetches.
+
+THUMBNAIL_INDEX = "index.json"
+
+
+def _write_sprite(output_dir, sheet, tiles, columns, thumb_size, quality):
+    rows = (len(tiles) + columns - 1) // columns
+    width, height = thumb_size
+    image = np.zeros((rows * height, columns * width, 3), dtype=np.uint8)
+    for i, tile in enumerate(tiles):
+        row, column = divmod(i, columns)
+        image[row * height:(row + 1) * height, column * width:(column + 1) * width] = tile
+    filename = f"sprite_{sheet:03d}.jpg"
+    ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode sprite sheet")
+    _write_file(os.path.join(output_dir, filename), buffer.tobytes())
+    return filename
+
+
+# Replace path with data atomically (readers never see a partly written file)
+def _write_file(path, data):
+    tmp_path = _temp_path(path)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Output: the index dict (also written to output_dir/index.json), or None if the video cannot be read
+def build_thumbnails(video_path, output_dir, interval=None, thumb_width=None, columns=10, rows=10, quality=70):
+    interval = interval or float(os.getenv('THUMBNAIL_INTERVAL', '1'))
+    thumb_width = thumb_width or int(os.getenv('THUMBNAIL_WIDTH', '160'))
+    metadata = probe_video(video_path)
+    if metadata is None or metadata["total_frames"] <= 0 or not metadata["width"]:
+        return None
+    fps = metadata["fps"] if metadata["fps"] > 0 else 30.0
+    step = max(1, int(round(interval * fps)))
+    thumb_size = (thumb_width, max(2, int(round(metadata["height"] * thumb_width / metadata["width"]))))
+    os.makedirs(output_dir, exist_ok=True)
+
+    per_sheet = columns * rows
+    sheets, tiles, thumbnails = [], [], []
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        frame_num = 0
+        # grab() every frame, but only convert the sampled ones
+        while cap.grab():
+            if frame_num % step == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    tiles.append(cv2.resize(frame, thumb_size, interpolation=cv2.INTER_AREA))
+                    thumbnails.append(frame_num)
+                    if len(tiles) == per_sheet:
+                        sheets.append(_write_sprite(output_dir, len(sheets), tiles, columns, thumb_size, quality))
+                        tiles = []
+            frame_num += 1
+    finally:
+        cap.release()
+    if tiles:
+        sheets.append(_write_sprite(output_dir, len(sheets), tiles, columns, thumb_size, quality))
+    if not thumbnails:
+        return None
+
+    index = {
+        "interval": step / fps,
+        "frame_step": step,
+        "width": thumb_size[0],
+        "height": thumb_size[1],
+        "columns": columns,
+        "rows": rows,
+        "sheets": sheets,
+        # Thumbnail i shows frame frames[i]; it is tile i % (columns * rows) of sheet i // (columns * rows)
+        "frames": thumbnails,
+    }
+    _write_file(os.path.join(output_dir, THUMBNAIL_INDEX), json.dumps(index).encode())
+    return index
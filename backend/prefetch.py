@@ -0,0 +1,118 @@
+"""
+Nocodile 預取
+Background decoding of the frames an annotator is about to request
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class FramePrefetcher:
+    """
+    Decode and encode upcoming frames in worker threads and store them in a FrameCache.
+
+    Every session (e.g. one annotator) has at most `depth` frames queued; scheduling a new
+    batch for a session cancels whatever of its previous batch has not started yet. Only the
+    `max_sessions` most recently active sessions are tracked. A request for a frame that is
+    being prefetched waits for that decode instead of starting a second one (see wait()), but
+    at most `wait_timeout` seconds, after which the caller decodes the frame itself.
+    """
+
+    def __init__(self, frame_cache, workers=None, depth=None, max_sessions=None, wait_timeout=None):
+        self.frame_cache = frame_cache
+        self.depth = depth if depth is not None else int(os.getenv('FRAME_PREFETCH_DEPTH', '3'))
+        self.max_sessions = max_sessions or int(os.getenv('FRAME_PREFETCH_SESSIONS', '64'))
+        self.wait_timeout = wait_timeout if wait_timeout is not None else float(os.getenv('FRAME_PREFETCH_WAIT', '2'))
+        self._executor = ThreadPoolExecutor(max_workers=workers or int(os.getenv('FRAME_PREFETCH_WORKERS', '2')),
+                                            thread_name_prefix="frame-prefetch")
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session -> [future, ...]
+        self._inflight = {}             # cache key -> future
+        self._scheduled = 0
+        self._skipped = 0
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._wait_timeouts = 0
+
+    # frames: [(cache key, loader), ...] in the order they will be needed
+    def schedule(self, session, frames):
+        if self.depth <= 0:
+            return
+        with self._lock:
+            self._cancel(self._sessions.pop(session, []))
+            futures = []
+            for key, loader in frames[:self.depth]:
+                if key in self._inflight or self.frame_cache.contains(key):
+                    self._skipped += 1
+                    continue
+                future = self._executor.submit(self._load, key, loader)
+                self._inflight[key] = future
+                futures.append(future)
+                self._scheduled += 1
+            self._sessions[session] = futures
+            while len(self._sessions) > self.max_sessions:
+                _, old = self._sessions.popitem(last=False)
+                self._cancel(old)
+
+    # Called with the lock held
+    def _cancel(self, futures):
+        for future in futures:
+            if future.cancel():
+                self._cancelled += 1
+        for key in [k for k, f in self._inflight.items() if f.cancelled()]:
+            del self._inflight[key]
+
+    def _load(self, key, loader):
+        try:
+            data = loader()
+            self.frame_cache.put(key, data)
+            with self._lock:
+                self._completed += 1
+            return data
+        except Exception as e:
+            logger.warning(f"Prefetch of frame {key} failed: {e}")
+            with self._lock:
+                self._failed += 1
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    # Bytes of a frame that is currently being prefetched, or None if it is not in flight or
+    # did not finish within timeout seconds (wait_timeout if None)
+    def wait(self, key, timeout=None):
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=self.wait_timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._wait_timeouts += 1
+            return None
+        except Exception:
+            return None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "sessions": len(self._sessions),
+                "inflight": len(self._inflight),
+                "scheduled": self._scheduled,
+                "skipped": self._skipped,
+                "completed": self._completed,
+                "failed": self._failed,
+                "cancelled": self._cancelled,
+                "wait_timeouts": self._wait_timeouts,
+            }
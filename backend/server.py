@@ -1,11 +1,11 @@
 import logging
 import traceback
-from fastapi import FastAPI, Request, status, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, Request, status, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Dict, List
+from typing import Dict, List, Optional
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 # from passlib.context import CryptContext
 import shutil
@@ -13,19 +13,29 @@ import uuid
 import cv2
 import pandas as pd
 import os
-from cv_models import KCF, SAM
+from cv_models import KCF, SAM, FrameReader, model_registry
+from media import probe_video, build_seek_index, save_seek_index, load_seek_index, read_frame, FrameProfile, encode_frame
+from media import transcode_proxy, proxy_path as media_proxy_path, proxy_source_frames, build_thumbnails, THUMBNAIL_INDEX
 import numpy as np
 import base64
-import aiofiles
 from ultralytics import YOLO
 import yaml
 import random
 from shutil import copy2, rmtree
 from pathlib import Path
 import pymysql
+from db import ConnectionPool, BatchWriter, ProgressWriter, DB_CONFIG
+from cache import TTLCache, FrameCache
+from prefetch import FramePrefetcher
+from blobstore import BlobStore
+from uploads import UploadSessions, UploadError, UploadLimiter, UploadIO, MultipartFileReader, read_limited
+from ingest import IngestPipeline
 import hashlib
+import re
 import hmac
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
+import anyio
 # from config import config
 
 # # 導入配置模組
@@ -76,23 +86,50 @@ class RequestSizeLimitMiddleware(BaseHTTPMiddleware):
 
 app.add_middleware(RequestSizeLimitMiddleware, max_header_size=8192)
 
+# 上傳併發限制：在讀取 request body 之前取得名額，名額滿時排隊，排隊也滿或逾時則回 503
+class UploadLimitMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        is_upload = (request.method == "POST" and request.url.path == "/upload") or \
+                    (request.method == "PUT" and request.url.path.startswith("/uploads/"))
+        if not is_upload:
+            return await call_next(request)
+        try:
+            await upload_limiter.acquire()
+        except UploadError as e:
+            return JSONResponse(
+                status_code=e.status,
+                content={"error": str(e)},
+                headers={"Retry-After": str(upload_limiter.retry_after)}
+            )
+        try:
+            return await call_next(request)
+        finally:
+            upload_limiter.release()
+
+app.add_middleware(UploadLimitMiddleware)
+
 # # 添加靜態文件服務 - 提供視頻文件
 # app.mount("/videos", StaticFiles(directory="/app/projects"), name="videos")
 
 #=================================== Health Check and Root Endpoints ==========================================
 
 @app.get("/health")
-async def health_check():
+def health_check():
     """健康檢查端點"""
     try:
         # 檢查資料庫連接
-        if connection and connection.open:
-            return {"status": "healthy", "database": "connected", "config": config}
+        if db.ping():
+            return {"status": "healthy", "database": "connected", "config": config, "pool": db.stats()}
         else:
             return {"status": "unhealthy", "database": "disconnected", "config": config}
     except Exception as e:
         return {"status": "unhealthy", "error": str(e), "config": config}
 
+@app.get("/metrics")
+async def metrics():
+    """運行指標端點"""
+    return {"db_pool": db.stats(), "project_cache": project_cache.stats(), "frame_cache": frame_cache.stats(), "frame_prefetch": frame_prefetcher.stats(), "uploads": upload_limiter.stats(), "ingest": ingest_pipeline.stats(), "models": model_registry.stats()}
+
 @app.get("/test")
 async def test_endpoint():
     """測試端點 - 用於 API 連接驗證"""
@@ -200,27 +237,106 @@ def sanitize_filename(filename):
 #             print("所有連接嘗試都失敗了")
 #             return None
 
-config = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': 'noconoconocodile',
-    'database': 'Nocodile',
-    'charset': 'utf8mb4'
-}
+config = DB_CONFIG
+
+# Every request / background job checks out its own connection from the pool
+# Pool size, checkout timeout and recycle time can be set with MYSQL_POOL_* environment variables
+db = ConnectionPool(config)
 
 try:
-    connection = pymysql.connect(**config)
+    db.warmup()
     print("数据库连接成功！")
 except pymysql.Error as e:
     print(f"数据库连接失败: {e}")
 
-# # 資料庫連接重連機制 by (ensure the db will not crash when the db is lost)
-# def ensure_database_connection():
-#     global connection
-#     if not connection or not connection.open:
-#         logger.warning("Database connection lost, attempting to reconnect...")
-#         connection = connect_to_database()
-#     return connection
+# Read-through cache for project metadata (row, classes, video list), keyed by (kind, project_id)
+# Entries live PROJECT_CACHE_TTL seconds and are invalidated by the Project methods that write them
+project_cache = TTLCache()
+
+# Encoded annotation frames, keyed by (video_id, frame version, frame_num, encoding params), bounded by FRAME_CACHE_MB
+frame_cache = FrameCache()
+
+# Decodes the next FRAME_PREFETCH_DEPTH annotation frames of each client in the background
+frame_prefetcher = FramePrefetcher(frame_cache)
+
+@app.on_event("shutdown")
+def stop_frame_prefetcher():
+    frame_prefetcher.shutdown()
+
+# Uploaded videos are stored once per content (SHA-256) and hardlinked into the projects
+blob_store = BlobStore()
+
+# Resumable upload sessions, kept inside the blob store so finished files are moved, not copied
+upload_sessions = UploadSessions(os.path.join(blob_store.root, "uploads"))
+
+# Upload disk writes run on their own UPLOAD_IO_WORKERS threads; at most UPLOAD_MAX_CONCURRENT
+# uploads write at once (see UploadLimitMiddleware)
+upload_io = UploadIO()
+upload_limiter = UploadLimiter()
+
+@app.on_event("shutdown")
+def stop_upload_io():
+    upload_io.shutdown()
+
+# Stages after an upload (metadata, seek index, proxy, thumbnails) run on INGEST_WORKERS threads;
+# INGEST_PROXY / INGEST_THUMBNAILS = 0 leave the proxy / thumbnails to backfill_video_metadata.py
+INGEST_PROXY = os.getenv('INGEST_PROXY', '1') == '1'
+INGEST_THUMBNAILS = os.getenv('INGEST_THUMBNAILS', '1') == '1'
+
+def record_ingest_status(key, ingest_status, error=None):
+    project_id, video_id = key
+    Video(project_id=project_id, video_id=video_id).save_ingest_status(ingest_status, error)
+
+ingest_pipeline = IngestPipeline(record_ingest_status)
+
+@app.on_event("shutdown")
+def stop_ingest_pipeline():
+    ingest_pipeline.shutdown()
+
+# SAM / RMBG are loaded once per process (see cv_models.ModelRegistry); MODEL_WARMUP loads them at startup
+@app.on_event("startup")
+def start_model_registry():
+    model_registry.start()
+
+@app.on_event("shutdown")
+def stop_model_registry():
+    model_registry.shutdown()
+
+# Requeue videos whose ingest was interrupted by a restart
+@app.on_event("startup")
+def resume_ingest():
+    try:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT project_id, video_id FROM video WHERE ingest_status NOT IN ('ready', 'failed')")
+            rows = cursor.fetchall()
+        for row in rows:
+            Video(project_id=row["project_id"], video_id=row["video_id"]).queue_ingest()
+        if rows:
+            logger.info(f"Resumed ingest of {len(rows)} videos")
+    except Exception as e:
+        logger.warning(f"Could not resume interrupted ingests: {e}")
+
+# Cache-Control for binary frame responses whose URL carries the current frame version (?v=)
+# The frames of a video change when its proxy is (re)built, which changes the version and so the URL
+FRAME_CACHE_CONTROL = os.getenv('FRAME_CACHE_CONTROL', 'public, max-age=31536000, immutable')
+# Cache-Control for frame URLs without the current version: cached copies are revalidated with the ETag
+FRAME_REVALIDATE_CACHE_CONTROL = os.getenv('FRAME_REVALIDATE_CACHE_CONTROL', 'no-cache')
+
+# Encoding of annotation frames when the client does not ask for one (FRAME_MAX_DIM 0 = source resolution)
+DEFAULT_FRAME_PROFILE = FrameProfile(os.getenv('FRAME_FORMAT', 'jpeg'),
+                                     int(os.getenv('FRAME_QUALITY', '95')),
+                                     int(os.getenv('FRAME_MAX_DIM', '0')))
+
+# Cache-Control for thumbnail sprites and their index (rewritten when thumbnails are rebuilt)
+THUMBNAIL_CACHE_CONTROL = os.getenv('THUMBNAIL_CACHE_CONTROL', 'public, max-age=3600')
+
+# Endpoints that query the database or decode video are plain `def` functions, so FastAPI
+# runs them in its worker threadpool instead of blocking the event loop.
+# The threadpool size (API_THREADPOOL_SIZE) bounds how many of them run concurrently.
+@app.on_event("startup")
+async def configure_threadpool():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = int(os.getenv('API_THREADPOOL_SIZE', '40'))
 
 #=================================== Define Request Types ==========================================
 
@@ -228,7 +344,11 @@ class AnnotationRequest(BaseModel):
     project_id: int
     video_id: int
     frame_num: int
-    bboxes: list  # List of bounding boxes, each box is [class_name, x, y, w, h]
+    bboxes: list  # List of bounding boxes, each box is [class_name, x, y, w, h] or {class_name, x, y, width, height}
+    # Size of the frame the boxes were drawn on; boxes are scaled back to the source resolution
+    # Left out: the size of the frame as served by default (Video.get_frame_size(DEFAULT_FRAME_PROFILE))
+    frame_width: Optional[int] = None
+    frame_height: Optional[int] = None
 
 #=================================== Class to deal with user logins ==========================================
 
@@ -241,22 +361,20 @@ class UserLogin():
 
     # Fetch hashed password and salt from database
     def get_password_hash(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT password FROM user WHERE username = %s"
-        cursor.execute(query, (self.username,))
-        password = cursor.fetchone()['password']
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "SELECT password FROM user WHERE username = %s"
+            cursor.execute(query, (self.username,))
+            password = cursor.fetchone()['password']
         decoded_bytes = base64.b64decode(password)
         salt, pwd_hash = decoded_bytes.split(b':')
         return pwd_hash, salt
     
     # Fecth userID given self.username
     def get_userID(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query="SELECT user_id FROM user WHERE username = %s"
-        cursor.execute(query,(self.username,))
-        result = cursor.fetchone()
-        cursor.close()
+        with db.cursor() as cursor:
+            query="SELECT user_id FROM user WHERE username = %s"
+            cursor.execute(query,(self.username,))
+            result = cursor.fetchone()
         if result:
             return result['user_id']
         else:
@@ -314,21 +432,19 @@ class User():
     
     # Fetch username from database given the userID
     def get_username(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query= "SELECT username FROM user WHERE user_id =%s"
-        cursor.execute(query,(self.userID,))
-        username = cursor.fetchone()['username']
-        cursor.close()
+        with db.cursor() as cursor:
+            query= "SELECT username FROM user WHERE user_id =%s"
+            cursor.execute(query,(self.userID,))
+            username = cursor.fetchone()['username']
         return username
 
     # Fetch all project IDs of projects the user own
     # Output: [projectID, projectID, ...]
     def get_owned_projects(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query="SELECT DISTINCT project_id FROM project WHERE project_owner_id =%s"
-        cursor.execute(query,(self.userID))
-        result = cursor.fetchall()
-        cursor.close()
+        with db.cursor() as cursor:
+            query="SELECT DISTINCT project_id FROM project WHERE project_owner_id =%s"
+            cursor.execute(query,(self.userID))
+            result = cursor.fetchall()
         owned_projects = [d['project_id'] for d in result if 'project_id' in d]
         self.owned_projects = owned_projects
         return owned_projects
@@ -336,33 +452,92 @@ class User():
     # Fetch all the project IDs of projects the user has been shared with
     # Output: [projectID, projectID, ...]
     def get_shared_projects(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query="SELECT DISTINCT project_id FROM project_shared_users WHERE user_id =%s"
-        cursor.execute(query,(self.userID))
-        result = cursor.fetchall()
-        cursor.close()
+        with db.cursor() as cursor:
+            query="SELECT DISTINCT project_id FROM project_shared_users WHERE user_id =%s"
+            cursor.execute(query,(self.userID))
+            result = cursor.fetchall()
         shared_projects = [d['project_id'] for d in result if 'project_id' in d]
         self.shared_projects = shared_projects
         return shared_projects
 
+    # Fetch summary info of every project the user owns or has been shared with, in a single query
+    # Output: [{"id": projectID, "name": str, "videoCount": int, "status": str, "isOwned": True/False}, ...]
+    def get_projects_info(self):
+        with db.cursor() as cursor:
+            query = """
+                SELECT p.project_id AS id, p.project_name AS name, p.project_status AS status,
+                       p.project_owner_id = %s AS isOwned, COUNT(v.video_id) AS videoCount
+                FROM project p
+                LEFT JOIN video v ON v.project_id = p.project_id
+                WHERE p.project_owner_id = %s
+                   OR p.project_id IN (SELECT project_id FROM project_shared_users WHERE user_id = %s)
+                GROUP BY p.project_id
+                ORDER BY p.project_id ASC
+            """
+            cursor.execute(query, (self.userID, self.userID, self.userID))
+            rows = cursor.fetchall()
+        projects_info = []
+        for row in rows:
+            row['isOwned'] = bool(row['isOwned'])
+            row['videoCount'] = int(row['videoCount'])
+            projects_info.append(row)
+        return projects_info
+
 #=================================== Class to deal with projects ==========================================
 
 class Project():
+    # Attributes backed by columns of the project row, loaded together on first access
+    _project_columns = {
+        "project_name": "project_name",
+        "owner": "project_owner_id",
+        "project_status": "project_status",
+        "training_progress": "training_progress",
+        "dataset_path": "dataset_path",
+    }
+
     def __init__(self, project_id=None, initialize=False):
         if initialize:
             # 初始化新项目时不执行任何操作
             pass
         else:
             self.project_id = project_id
-            self.project_name = self.get_project_name()
-            self.owner = self.get_owner()
-            self.project_status = self.get_project_status()
+
+    # Load database-backed attributes lazily, so that constructing a Project costs no queries
+    def __getattr__(self, name):
+        if name in Project._project_columns:
+            self._load_project_row()
+            return self.__dict__[name]
+        if name == "videos":
+            self.videos = self.get_videos()
+            return self.videos
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    # Fetch the whole project row in one query (through project_cache)
+    # Attributes that were already assigned (e.g. a new status about to be saved) are kept
+    def _load_project_row(self):
+        def load():
+            with db.cursor() as cursor:
+                columns = ", ".join(Project._project_columns.values())
+                query = f"SELECT {columns} FROM project WHERE project_id = %s"
+                cursor.execute(query, (self.project_id,))
+                return cursor.fetchone()
+        row = project_cache.get_or_load(("project", self.project_id), load)
+        if row is None:
+            logger.warning(f"Project with ID {self.project_id} not found")
+            row = {"project_status": "Unknown", "training_progress": 0}
+        for attribute, column in Project._project_columns.items():
+            self.__dict__.setdefault(attribute, row.get(column))
+
+    # Drop cached entries of this project after writing them, e.g. _invalidate_cache("classes")
+    def _invalidate_cache(self, *kinds):
+        project_cache.invalidate(*((kind, self.project_id) for kind in kinds))
 
     # Initialize the attributes and database when the project is first created
     # Input: project name, project type, ID of owner
     # Output: project ID (int)
     def initialize(self, project_name: str, project_type: str, owner: int):
         self.project_name = project_name
+        self.owner = owner
         if self.project_name.strip() == '':
             self.project_name = "Untitled"
             i = 1
@@ -374,12 +549,10 @@ class Project():
         self.project_status = "Not started" # can be "Awaiting Labeling", "Labeling in progress", "Data is ready", "Training in progress", "Trained"
 
         # Add new row in project table
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query="INSERT INTO project (project_name, project_type, project_owner_id, project_status, model_path, dataset_path) VALUES (%s, %s, %s, %s, %s, %s);"
-        cursor.execute(query,(self.project_name, self.project_type, self.owner, self.project_status, "", ""))
-        project_id = cursor.lastrowid
-        connection.commit()  # 提交事务
-        cursor.close()
+        with db.cursor() as cursor:
+            query="INSERT INTO project (project_name, project_type, project_owner_id, project_status, model_path, dataset_path) VALUES (%s, %s, %s, %s, %s, %s);"
+            cursor.execute(query,(self.project_name, self.project_type, self.owner, self.project_status, "", ""))
+            project_id = cursor.lastrowid
         
         # Save project_id to the attribute
         self.project_id = project_id
@@ -392,34 +565,17 @@ class Project():
     # Check if project name exists for this owner
     # Output: True/False
     def project_name_exists(self):
-        self.project_name = self.get_project_name()
-        self.owner = self.get_owner()
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT COUNT(*) as count FROM project WHERE project_name = %s AND project_owner_id = %s"
-        cursor.execute(query, (self.project_name, self.owner))
-        result = cursor.fetchone()
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "SELECT COUNT(*) as count FROM project WHERE project_name = %s AND project_owner_id = %s"
+            cursor.execute(query, (self.project_name, self.owner))
+            result = cursor.fetchone()
         return result['count'] > 0
     
     # Fetch project name given project ID
     # Output: str
     def get_project_name(self):
         try:
-            # 檢查資料庫連接
-            if not connection or not connection.open:
-                logger.error("Database connection not available in get_project_name")
-                return None
-                
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT project_name FROM project WHERE project_id = %s"
-            cursor.execute(query,(self.project_id,))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result['project_name']
-            else:
-                logger.warning(f"Project with ID {self.project_id} not found")
-                return None
+            return self.project_name
         except Exception as e:
             logger.error(f"Error in get_project_name: {str(e)}")
             return None
@@ -434,19 +590,14 @@ class Project():
     # Fetch list of videos given project ID
     # Output: [video ID (int), ...]
     def get_videos(self):
+        def load():
+            with db.cursor() as cursor:
+                query = "SELECT DISTINCT video_id FROM video WHERE project_id = %s ORDER BY video_id ASC"
+                cursor.execute(query,(self.project_id,))
+                data = cursor.fetchall()
+            return tuple(d['video_id'] for d in data if 'video_id' in d)
         try:
-            # 檢查資料庫連接
-            if not connection or not connection.open:
-                logger.error("Database connection not available in get_videos")
-                return []
-                
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT DISTINCT video_id FROM video WHERE project_id = %s ORDER BY video_id ASC"
-            cursor.execute(query,(self.project_id,))
-            data = cursor.fetchall()
-            video_ids = [d['video_id'] for d in data if 'video_id' in d]
-            cursor.close()
-            return video_ids
+            return list(project_cache.get_or_load(("videos", self.project_id), load))
         except Exception as e:
             logger.error(f"Error in get_videos: {str(e)}")
             return []
@@ -455,17 +606,11 @@ class Project():
     # Output: int
     def get_video_count(self):
         try:
-            # 檢查資料庫連接
-            if not connection or not connection.open:
-                logger.error("Database connection not available in get_videos")
-                return []
-                
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT COUNT(video_id) as total FROM video WHERE project_id = %s"
-            cursor.execute(query,(self.project_id,))
-            result = cursor.fetchone()
+            with db.cursor() as cursor:
+                query = "SELECT COUNT(video_id) as total FROM video WHERE project_id = %s"
+                cursor.execute(query,(self.project_id,))
+                result = cursor.fetchone()
             video_count = result['total']
-            cursor.close()
             return video_count
         except Exception as e:
             logger.error(f"Error in get_videos: {str(e)}")
@@ -474,75 +619,43 @@ class Project():
     # Fetch the ID of the owner of a project
     # Output: Owner's ID (int)
     def get_owner(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT project_owner_id FROM project WHERE project_id = %s"
-        cursor.execute(query,(self.project_id,))
-        result = cursor.fetchone()
-        cursor.close()
-        if result:
-            return result['project_owner_id']
-        else:
-            return None
+        return self.owner
     
     # Fetch all shared users of a project
     # Output: [shared user ID (int), ...]
     def get_shared_users(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT DISTINCT user_id FROM project_shared_users WHERE project_id = %s"
-        cursor.execute(query,(self.project_id,))
-        result = cursor.fetchall()
+        with db.cursor() as cursor:
+            query = "SELECT DISTINCT user_id FROM project_shared_users WHERE project_id = %s"
+            cursor.execute(query,(self.project_id,))
+            result = cursor.fetchall()
         shared_users = [d['user_id'] for d in result if 'user_id' in d]
         return shared_users
     
     # Fetch all the classes that the model would contain in a project
     # Output: {class_name (str): color (str), ...}
     def get_classes(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT class_name, color FROM class WHERE project_id = %s"
-        cursor.execute(query,(self.project_id,))
-        rows = cursor.fetchall()
-        classes = {item["class_name"]: item["color"] for item in rows}
+        def load():
+            with db.cursor() as cursor:
+                query = "SELECT class_name, color FROM class WHERE project_id = %s"
+                cursor.execute(query,(self.project_id,))
+                rows = cursor.fetchall()
+            return {item["class_name"]: item["color"] for item in rows}
+        # Callers modify the returned dict, so hand out a copy
+        classes = dict(project_cache.get_or_load(("classes", self.project_id), load))
         return classes
     
     # Fetch the status of a project
     # Output: Project status(str)
     def get_project_status(self):
         try:
-            # 檢查資料庫連接
-            if not connection or not connection.open:
-                logger.error("Database connection not available in get_project_status")
-                return "Unknown"
-                
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT project_status FROM project WHERE project_id = %s"
-            cursor.execute(query,(self.project_id,))
-            result = cursor.fetchone()
-            cursor.close()
-            if result:
-                return result['project_status']
-            else:
-                logger.warning(f"Project status not found for project ID {self.project_id}")
-                return "Unknown"
+            return self.project_status
         except Exception as e:
             logger.error(f"Error in get_project_status: {str(e)}")
             return "Error"
 
     def get_project_progress(self):
         try:
-            # 檢查資料庫連接
-            if not connection or not connection.open:
-                logger.error("Database connection not available in get_project_status")
-                return "Unknown"
-                
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT training_progress FROM project WHERE project_id = %s"
-            cursor.execute(query,(self.project_id,))
-            result = cursor.fetchone()
-            if result:
-                return result['training_progress']
-            else:
-                logger.warning(f"Project progress not found for project ID {self.project_id}")
-                return 0
+            return self.training_progress
         except Exception as e:
             logger.error(f"Error in get_project_status: {str(e)}")
             return "Error"
@@ -587,11 +700,10 @@ class Project():
         self.classes[class_name] = colour
         
         # Add new row in class table
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query="INSERT INTO class (project_id, class_name, color) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE `color` = VALUES(`color`);"
-        cursor.execute(query,(self.project_id, class_name, colour))
-        connection.commit()
-        cursor.close()
+        with db.cursor() as cursor:
+            query="INSERT INTO class (project_id, class_name, color) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE `color` = VALUES(`color`);"
+            cursor.execute(query,(self.project_id, class_name, colour))
+        self._invalidate_cache("classes")
 
         return True
     
@@ -602,11 +714,10 @@ class Project():
         self.classes[new_class_name] = self.classes.pop(old_class_name)
 
         # Save change to database
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE class SET class_name = %s WHERE project_id = %s AND class_name = %s;"
-        cursor.execute(query,(new_class_name, self.project_id, old_class_name))
-        connection.commit()
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "UPDATE class SET class_name = %s WHERE project_id = %s AND class_name = %s;"
+            cursor.execute(query,(new_class_name, self.project_id, old_class_name))
+        self._invalidate_cache("classes")
 
         return True
     
@@ -617,11 +728,10 @@ class Project():
         self.classes.pop(class_name)
 
         # Save changes to database
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "DELETE FROM class WHERE project_id = %s AND class_name = %s"
-        cursor.execute(query,(self.project_id, class_name))
-        connection.commit()
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "DELETE FROM class WHERE project_id = %s AND class_name = %s"
+            cursor.execute(query,(self.project_id, class_name))
+        self._invalidate_cache("classes")
 
         return True
 
@@ -658,32 +768,49 @@ class Project():
         for video_id in self.videos:
             video = Video(self.project_id, video_id)
 
-            # Write labels in txt files
-            bbox_data = video.get_bbox_data()
-            for result in bbox_data:
-                # bbox_data = [{"frame_num": 0, "class_name": "车", "coordinates": "100 100 50 50"}, ...]
-                frame_num = result['frame_num']
-                class_name = result['class_name']
-                coordinates = result['coordinates']
-
-                if not isinstance(coordinates, str):
-                    raise ValueError(f"Video {video.video_id} has unannotated frames. Please complete annotation before creating dataset.")
-                
-                filename = f"{label_dir}/{video.video_id}_frame_{frame_num}.txt"
-
+            # Images are decoded from the original (full resolution and quality). Labels keep the annotation
+            # frame numbers; each is mapped to the source frame it shows, which differs from its number for
+            # variable frame rate videos annotated on the proxy. Boxes are stored in source pixels.
+            # If the frames cannot be mapped the images come from the annotated file, with boxes in its pixels
+            source_frames = video.get_source_frames()
+            if source_frames is not None:
+                image_source, scale_x, scale_y = video.get_artifact_path(), 1.0, 1.0
+            else:
+                logger.warning(f"No seek index to map proxy frames of video {video.video_id}, exporting proxy frames")
+                image_source = video.get_frame_path()
+                source_frames = np.arange(video.frame_count)
+                scale_x, scale_y = video.get_frame_scale()
+
+            # Write labels in txt files (rows are ordered by frame, one file per frame)
+            frame_nums, class_names, boxes = video.get_bbox_array()
+            boxes = boxes / np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+            frame_starts = np.flatnonzero(np.diff(frame_nums, prepend=-1))
+            for start, end in zip(frame_starts, np.append(frame_starts[1:], len(frame_nums))):
+                filename = f"{label_dir}/{video.video_id}_frame_{frame_nums[start]}.txt"
                 with open(filename, 'a') as file:
-                    file.write(f"{class_id_dict[class_name]} {coordinates}\n")
-
-            # Decompose videos into jpg images
-            cap = cv2.VideoCapture(video.get_video_path())
-            frame_idx = 0
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                image_path = f"{image_dir}/{video.video_id}_frame_"+str(frame_idx)+".jpg"
-                cv2.imwrite(image_path, frame)
-                frame_idx += 1
+                    for i in range(start, end):
+                        x, y, w, h = boxes[i]
+                        file.write(f"{class_id_dict[class_names[i]]} {x:g} {y:g} {w:g} {h:g}\n")
+
+            # Decompose videos into jpg images, one per annotation frame (a source frame held by several
+            # proxy frames is encoded once and copied)
+            # Frames are decoded on a background thread while this one encodes the JPEGs
+            frames_of_source = {}
+            for frame_idx, source_num in enumerate(source_frames.tolist()):
+                frames_of_source.setdefault(source_num, []).append(frame_idx)
+            reader = FrameReader(image_source, 0, int(source_frames[-1]) + 1 if len(source_frames) else 0)
+            try:
+                for source_num, frame in reader:
+                    image_paths = [f"{image_dir}/{video.video_id}_frame_{frame_idx}.jpg"
+                                   for frame_idx in frames_of_source.get(source_num, ())]
+                    if not image_paths:
+                        continue
+                    cv2.imwrite(image_paths[0], frame)
+                    for image_path in image_paths[1:]:
+                        copy2(image_paths[0], image_path)
+            except (IOError, ValueError) as e:
+                logger.warning(f"Skipping images of video {video.video_id}: {e}")
+            logger.info(f"Dataset export of video {video.video_id} decoded {reader.stats()}")
 
         self.project_status = "Data is ready"
         self.save_project_status()
@@ -723,100 +850,85 @@ class Project():
     
     # Save project status to database
     def save_project_status(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET project_status = %s WHERE project_id = %s"
-        cursor.execute(query,(self.project_status, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()        
+        with db.cursor() as cursor:
+            query = "UPDATE project SET project_status = %s WHERE project_id = %s"
+            cursor.execute(query,(self.project_status, self.project_id))
+            success = bool(cursor.rowcount)
+        self._invalidate_cache("project")
         return success
     
     # Save dataset path to database
     def save_dataset_path(self, dataset_path):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET dataset_path = %s WHERE project_id = %s"
-        cursor.execute(query,(dataset_path, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()        
+        self.dataset_path = dataset_path
+        with db.cursor() as cursor:
+            query = "UPDATE project SET dataset_path = %s WHERE project_id = %s"
+            cursor.execute(query,(dataset_path, self.project_id))
+            success = bool(cursor.rowcount)
+        self._invalidate_cache("project")
         return success
     
     # Get dataset path from database
     def get_dataset_path(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT dataset_path FROM project WHERE project_id = %s"
-        cursor.execute(query,(self.project_id,))
-        result = cursor.fetchone()
-        cursor.close()
-        return result['dataset_path'] if result else None
+        return self.dataset_path
     
     # Get model path from database
     def get_model_path(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "SELECT model_path FROM project WHERE project_id = %s"
-        cursor.execute(query,(self.project_id,))
-        result = cursor.fetchone()
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "SELECT model_path FROM project WHERE project_id = %s"
+            cursor.execute(query,(self.project_id,))
+            result = cursor.fetchone()
         return result['model_path'] if result else None
     
     # Save model path to database
     def save_model_path(self, model_path):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET model_path = %s WHERE project_id = %s"
-        cursor.execute(query,(model_path, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()        
+        with db.cursor() as cursor:
+            query = "UPDATE project SET model_path = %s WHERE project_id = %s"
+            cursor.execute(query,(model_path, self.project_id))
+            success = bool(cursor.rowcount)
         return success    
     
     # Save project name to database
     def save_project_name(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET project_name = %s WHERE project_id = %s"
-        cursor.execute(query,(self.project_name, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()  
+        with db.cursor() as cursor:
+            query = "UPDATE project SET project_name = %s WHERE project_id = %s"
+            cursor.execute(query,(self.project_name, self.project_id))
+            success = bool(cursor.rowcount)
+        self._invalidate_cache("project")
         return success
     
     # Save project type to database
     def save_project_type(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET project_type = %s WHERE project_id = %s"
-        cursor.execute(query,(self.project_type, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()  
+        with db.cursor() as cursor:
+            query = "UPDATE project SET project_type = %s WHERE project_id = %s"
+            cursor.execute(query,(self.project_type, self.project_id))
+            success = bool(cursor.rowcount)
         return success
     
     # Save owner ID to database
     def save_owner(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET project_owner_id = %s WHERE project_id = %s"
-        cursor.execute(query,(self.owner, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()  
+        with db.cursor() as cursor:
+            query = "UPDATE project SET project_owner_id = %s WHERE project_id = %s"
+            cursor.execute(query,(self.owner, self.project_id))
+            success = bool(cursor.rowcount)
+        self._invalidate_cache("project")
         return success
     
     # Save training progress (int) to database
     def save_training_progress(self, training_progress: int):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET training_progress = %s WHERE project_id = %s"
-        cursor.execute(query,(training_progress, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close() 
+        self.training_progress = training_progress
+        with db.cursor() as cursor:
+            query = "UPDATE project SET training_progress = %s WHERE project_id = %s"
+            cursor.execute(query,(training_progress, self.project_id))
+            success = bool(cursor.rowcount)
+        self._invalidate_cache("project")
         return success 
     
     # Save auto annotation progress (int) to database
     def save_auto_annotation_progress(self, auto_annotation_progress: int):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE project SET auto_annotation_progress = %s WHERE project_id = %s"
-        cursor.execute(query,(auto_annotation_progress, self.project_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()  
+        with db.cursor() as cursor:
+            query = "UPDATE project SET auto_annotation_progress = %s WHERE project_id = %s"
+            cursor.execute(query,(auto_annotation_progress, self.project_id))
+            success = bool(cursor.rowcount)
         return success
     
     # Save class ids as used in the model
@@ -824,12 +936,10 @@ class Project():
     def save_class_ids(self, class_list):
         success = True
         for class_name in class_list:
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "UPDATE class SET class_num = %s WHERE project_id = %s AND class_name = %s"
-            cursor.execute(query, (class_list[class_name], self.project_id, class_name))
-            connection.commit()
-            success = bool(cursor.rowcount) and success
-            cursor.close()  
+            with db.cursor() as cursor:
+                query = "UPDATE class SET class_num = %s WHERE project_id = %s AND class_name = %s"
+                cursor.execute(query, (class_list[class_name], self.project_id, class_name))
+                success = bool(cursor.rowcount) and success
     
     # Used during training
     @staticmethod
@@ -922,19 +1032,20 @@ class Project():
         print("Starting model training...")
         try:
             # Train epoch-by-epoch to track progress
-            for epoch in range(total_epochs):
-                model.train(
-                    data=str(yaml_path),
-                    epochs=1,
-                    imgsz=640,
-                    batch=4,
-                    #device="cpu",
-                    save=True,
-                    exist_ok=True
-                )
-                progress = round((epoch + 1) / total_epochs * 100) # YOUR TRAINING VARIABLE
-                print(f"Training progress: {progress}%")
-                self.save_training_progress(progress)
+            with ProgressWriter(self.save_training_progress) as progress_writer:
+                for epoch in range(total_epochs):
+                    model.train(
+                        data=str(yaml_path),
+                        epochs=1,
+                        imgsz=640,
+                        batch=4,
+                        #device="cpu",
+                        save=True,
+                        exist_ok=True
+                    )
+                    progress = round((epoch + 1) / total_epochs * 100) # YOUR TRAINING VARIABLE
+                    print(f"Training progress: {progress}%")
+                    progress_writer.update(progress)
             print("Model training completed successfully!")
 
         except Exception as e:
@@ -975,11 +1086,10 @@ class Project():
             print(f"Error updating project status: {e}")
             # Force update status even if there's an error
             try:
-                cursor = connection.cursor(pymysql.cursors.DictCursor)
-                cursor.execute("UPDATE project SET project_status = %s, training_progress = %s WHERE project_id = %s", 
-                             ("Training completed", 100, self.project_id))
-                connection.commit()
-                cursor.close()
+                with db.cursor() as cursor:
+                    cursor.execute("UPDATE project SET project_status = %s, training_progress = %s WHERE project_id = %s", 
+                                 ("Training completed", 100, self.project_id))
+                self._invalidate_cache("project")
                 print("Project status force-updated to 'Training completed'")
             except Exception as e2:
                 print(f"Failed to force-update status: {e2}")
@@ -1026,17 +1136,75 @@ class Project():
         return performance
     
 class Video(Project):
+    # Attributes backed by columns of the video row, loaded together on first access
+    _video_columns = ("video_path", "video_name", "annotation_status", "last_annotated_frame",
+                      "proxy_path", "proxy_frames", "proxy_width", "proxy_height", "content_hash",
+                      "ingest_status", "ingest_error")
+    # File metadata, probed once (at upload or on first access) and stored in the video row
+    _metadata_columns = ("total_frames", "fps", "width", "height", "codec", "duration")
+    # Derived from the metadata columns
+    _probe_attributes = ("frame_count", "resolution")
+
     def __init__(self, project_id: int, video_id=None, initialize=False):
         super().__init__(project_id)
         self.video_id = video_id
-        if not initialize:
-            self.video_path = self.get_video_path()
-            self.cap = cv2.VideoCapture(self.video_path)
-            # 从数据库获取标注状态
-            self.annotation_status, self.last_annotated_frame = self.get_annotation_status()
-            # 获取视频信息
-            self.frame_count = self.get_frame_count()
-            self.fps = self.get_fps()
+
+    # Load the video row and the file metadata lazily, so that endpoints which only need
+    # the annotation status never open the video file
+    def __getattr__(self, name):
+        if name in Video._video_columns:
+            self._load_video_row()
+            return self.__dict__[name]
+        if name in Video._metadata_columns or name in Video._probe_attributes:
+            self._load_video_row()
+            if self.__dict__.get("fps") is None:
+                self.probe_metadata()
+            self.__dict__.setdefault("frame_count", self.proxy_frames if self.has_proxy() else (self.total_frames or 0))
+            self.__dict__.setdefault("resolution", (self.width or 0, self.height or 0))
+            return self.__dict__[name]
+        return super().__getattr__(name)
+
+    # Fetch the whole video row (including the stored metadata) in one query
+    def _load_video_row(self):
+        if "_row_loaded" in self.__dict__:
+            return
+        self._row_loaded = True
+        row = None
+        # 首先嘗試將 video_id 轉換為整數（向後兼容）
+        try:
+            video_id_int = int(self.video_id)
+            with db.cursor() as cursor:
+                columns = ", ".join(Video._video_columns + Video._metadata_columns)
+                query = f"SELECT {columns} FROM video WHERE video_id = %s"
+                cursor.execute(query, (video_id_int,))
+                row = cursor.fetchone()
+        except (ValueError, TypeError):
+            pass
+        if row is None:
+            logger.warning(f"Video with ID {self.video_id} not found")
+            row = {"annotation_status": "yet to start"}
+        for column in Video._video_columns + Video._metadata_columns:
+            self.__dict__.setdefault(column, row.get(column))
+
+    # Probe frame count, fps, resolution, codec and duration from the file and save them to the database
+    # Videos that cannot be opened get zeros in memory and are probed again next time
+    # Output: True if the metadata was saved
+    def probe_metadata(self):
+        metadata = probe_video(self.video_path) if self.video_path else None
+        if metadata is None:
+            logger.warning(f"Could not open video {self.video_id} at {self.video_path}")
+            metadata = {"total_frames": 0, "fps": 0.0, "width": 0, "height": 0, "codec": "", "duration": 0.0}
+            saved = False
+        else:
+            with db.cursor() as cursor:
+                query = "UPDATE video SET total_frames = %s, fps = %s, width = %s, height = %s, codec = %s, duration = %s WHERE video_id = %s"
+                cursor.execute(query, tuple(metadata[c] for c in Video._metadata_columns) + (self.video_id,))
+            saved = True
+        for column in Video._metadata_columns:
+            self.__dict__[column] = metadata[column]
+        self.frame_count = self.proxy_frames if self.has_proxy() else metadata["total_frames"]
+        self.resolution = (metadata["width"], metadata["height"])
+        return saved
 
     # Initialize when a video is uploaded, includes inserting data to the database
     # Output: video_id, video_path
@@ -1059,64 +1227,63 @@ class Video(Project):
         self.video_count += 1
 
         # Add row to video
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "INSERT INTO video (project_id, video_path, video_name, annotation_status) VALUES (%s, %s, %s, %s);"
-        cursor.execute(query,(self.project_id, self.video_path, self.video_name, self.annotation_status))
-        self.video_id = cursor.lastrowid
-        connection.commit()  # 提交事务
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "INSERT INTO video (project_id, video_path, video_name, annotation_status) VALUES (%s, %s, %s, %s);"
+            cursor.execute(query,(self.project_id, str(self.video_path), self.video_name, self.annotation_status))
+            self.video_id = cursor.lastrowid
+        project_cache.invalidate(("videos", self.project_id))
 
         return self.video_id, self.video_path
     
     # Return some video info (used in project.get_videos_info)
     def get_video_info(self):
         video_path = self.get_video_path()
-        # 將絕對路徑轉換為相對URL路徑
-        # 例如: /app/projects/17/videos/IMG_0499..mp4 -> /videos/17/videos/IMG_0499..mp4
-        if video_path.startswith('/app/projects/'):
-            relative_path = video_path.replace('/app/projects/', '/videos/')
-        else:
-            relative_path = video_path
-
         info = {
             "name": self.get_video_name(),
             "file": self.video_id,
             "path": video_path,
-            "url": relative_path  # 添加URL字段供前端使用
+            "url": self.get_video_url(),  # 添加URL字段供前端使用
+            "thumbnails": self.get_thumbnail_url(THUMBNAIL_INDEX) if self.has_thumbnails() else None,
+            "ingest_status": self.get_ingest_status()["status"]
         }
         return info
-    
-    # Fetch the video from server given the file_path
-    # Output: video file (.mp4, ...)
-    async def get_video(self, file_path: str):
-        if not os.path.exists(file_path):
+
+    # URL of the streaming endpoint (get_video_stream)
+    def get_video_url(self):
+        return f"/projects/{self.project_id}/videos/{self.video_id}/stream"
+
+    _media_types = {
+        '.mp4': 'video/mp4',
+        '.m4v': 'video/mp4',
+        '.mov': 'video/quicktime',
+        '.avi': 'video/x-msvideo',
+        '.webm': 'video/webm',
+        '.mkv': 'video/x-matroska'
+    }
+
+    # Stream the video file for playback
+    # FileResponse reads the file in chunks (or hands it to the server with the pathsend extension),
+    # answers Range requests with 206 Partial Content and honours If-Range against its ETag/Last-Modified,
+    # so memory use does not depend on the file size and the browser player can seek.
+    # Output: FileResponse, or 304 when If-None-Match matches the ETag
+    def get_video(self, request: Request):
+        file_path = self.get_video_path()
+        if not file_path or not os.path.isfile(file_path):
             raise HTTPException(status_code=404, detail="File not found.")
         ext = os.path.splitext(file_path)[-1].lower()
-        media_types = {
-            '.mp4': 'video/mp4',
-            '.mov': 'video/quicktime',
-            '.avi': 'video/x-msvideo',
-            '.webm': 'video/webm',
-            '.mkv': 'video/x-matroska'
-        }
-        # Read the file contents for response
-        async with aiofiles.open(file_path, "rb") as f:
-            contents = await f.read()
-        return Response(contents, media_type=media_types.get(ext, "application/octet-stream"),
-                        headers={"Content-Disposition": f"attachment; filename={os.path.basename(file_path)}"})
+        response = FileResponse(file_path,
+                                media_type=self._media_types.get(ext, "application/octet-stream"),
+                                filename=os.path.basename(file_path),
+                                stat_result=os.stat(file_path),
+                                content_disposition_type="inline")
+        if response.headers["etag"] in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers={"ETag": response.headers["etag"],
+                                                      "Last-Modified": response.headers["last-modified"]})
+        return response
 
     # Fetch video name (str) from database
     def get_video_name(self):
-        try:
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            video_id_int = int(self.video_id)
-            query = "SELECT video_name FROM video WHERE video_id = %s"
-            cursor.execute(query, (video_id_int,))
-            result = cursor.fetchone()
-            if result:
-                return result['video_name']
-        except (ValueError, TypeError):
-            pass
+        return self.video_name
     
     # Update video name and save to database
     def update_video_name(self, new_name: str):
@@ -1126,91 +1293,141 @@ class Video(Project):
     
     # Fetch video path (str) from database
     def get_video_path(self):
-        # 首先嘗試將 video_id 轉換為整數（向後兼容）
-        try:
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            video_id_int = int(self.video_id)
-            query = "SELECT video_path FROM video WHERE video_id = %s"
-            cursor.execute(query, (video_id_int,))
-            result = cursor.fetchone()
-            if result:
-                return result['video_path']
-        except (ValueError, TypeError):
-            pass
+        return self.video_path
+
+    # True if the annotation proxy was written and is still on disk
+    def has_proxy(self):
+        return bool(self.proxy_path) and os.path.isfile(self.proxy_path)
+
+    # File that annotation frames are decoded from: the proxy when there is one, else the original
+    def get_frame_path(self):
+        return self.proxy_path if self.has_proxy() else self.get_artifact_path()
+
+    # Frame of the original shown by each annotation frame: the identity without a proxy, else mapped by
+    # timestamp through the seek indexes of the original and the proxy (built when missing)
+    # Output: int array indexed by frame_num, or None if an index cannot be built
+    def get_source_frames(self):
+        if not self.has_proxy():
+            return np.arange(self.frame_count)
+        indexes = []
+        for path in (self.get_artifact_path(), self.proxy_path):
+            index = load_seek_index(path)
+            if index is None:
+                index = build_seek_index(path)
+                if index is None or index.frame_count == 0:
+                    return None
+                save_seek_index(path, index)
+            indexes.append(index)
+        return proxy_source_frames(*indexes)
+
+    # Derived artifacts (seek index, proxy, thumbnails) are keyed by content: they are stored next to
+    # the blob when the video is in the blob store, so every upload of the same bytes shares them
+    def get_artifact_path(self):
+        if self.content_hash and blob_store.exists(self.content_hash):
+            return blob_store.path(self.content_hash)
+        return self.video_path
+
+    # Hardlink the stored content to the video path and record its hash
+    # If the blob store is on another filesystem the video row references the blob directly
+    def attach_blob(self, digest):
+        if not blob_store.link(digest, self.video_path):
+            self.video_path = blob_store.path(digest)
+            self.save_video_path()
+        with db.cursor() as cursor:
+            cursor.execute("UPDATE video SET content_hash = %s WHERE video_id = %s", (digest, self.video_id))
+        self.content_hash = digest
+
+    # Copy probe metadata and proxy of an earlier video with the same content
+    # Output: True if one was found (nothing needs to be probed or indexed again)
+    def reuse_artifacts(self):
+        if not self.content_hash:
+            return False
+        columns = Video._metadata_columns + ("proxy_path", "proxy_frames", "proxy_width", "proxy_height")
+        with db.cursor() as cursor:
+            query = f"SELECT {', '.join(columns)} FROM video WHERE content_hash = %s AND video_id <> %s AND fps IS NOT NULL LIMIT 1"
+            cursor.execute(query, (self.content_hash, self.video_id))
+            row = cursor.fetchone()
+            if row is None:
+                return False
+            query = f"UPDATE video SET {', '.join(f'{c} = %s' for c in columns)} WHERE video_id = %s"
+            cursor.execute(query, tuple(row[c] for c in columns) + (self.video_id,))
+        for column in columns:
+            self.__dict__[column] = row[column]
+        self.__dict__.pop("frame_count", None)
+        self.__dict__.pop("resolution", None)
+        return True
+
+    # Source pixels per pixel of get_frame_path() frames
+    # Output: (scale_x, scale_y)
+    def get_frame_scale(self):
+        width, height = self.resolution
+        if not self.has_proxy() or not (width and height and self.proxy_width and self.proxy_height):
+            return 1.0, 1.0
+        return width / self.proxy_width, height / self.proxy_height
     
-    # Fetch video name (str) from database
+    # Fetch number of frames of the video
     def get_frame_count(self):
-        if not self.video_path:
-            self.video_path = self.get_video_path()
-        cap = cv2.VideoCapture(self.video_path)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        return frame_count
+        return self.frame_count
     
     def get_fps(self):
-        if not self.video_path:
-            self.video_path = self.get_video_path()
-        cap = cv2.VideoCapture(self.video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        return fps
+        return self.fps
     
     def get_resolution(self):
-        if not self.video_path:
-            self.video_path = self.get_video_path()
-        cap = cv2.VideoCapture(self.video_path)
-        
-        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        return (width, height)
+        return self.resolution
+
+    def get_codec(self):
+        return self.codec
+
+    def get_duration(self):
+        return self.duration
     
     def get_bbox_data(self, frame_num = None):
-        # Output format: [{"frame_num": 0, "class_name": abc, "coordinates": (x, y, w, h)}, ...]
-        if frame_num:
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT frame_num, class_name, coordinates FROM bbox WHERE video_id = %s AND frame_num = %s"
-            cursor.execute(query,(self.video_id, frame_num))
-            bbox_data = cursor.fetchall()
+        # Output format: [{"frame_num": 0, "class_name": abc, "x": 100.0, "y": 100.0, "w": 50.0, "h": 50.0}, ...]
+        if frame_num is not None:
+            with db.cursor() as cursor:
+                query = "SELECT frame_num, class_name, x, y, w, h FROM bbox WHERE video_id = %s AND frame_num = %s"
+                cursor.execute(query,(self.video_id, frame_num))
+                bbox_data = cursor.fetchall()
         else:
             # fetch all if frame_num is not specified
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT frame_num, class_name, coordinates FROM bbox WHERE video_id = %s"
-            cursor.execute(query,(self.video_id))
-            bbox_data = cursor.fetchall()
+            with db.cursor() as cursor:
+                query = "SELECT frame_num, class_name, x, y, w, h FROM bbox WHERE video_id = %s"
+                cursor.execute(query,(self.video_id))
+                bbox_data = cursor.fetchall()
         return bbox_data
+
+    # Bulk read of bboxes for export / tracking, ordered by frame
+    # Output: frame_nums (N,) int32 array, class_names [str] * N, boxes (N, 4) float32 array of x, y, w, h
+    def get_bbox_array(self, frame_num = None):
+        query = "SELECT frame_num, class_name, x, y, w, h FROM bbox WHERE video_id = %s"
+        params = [self.video_id]
+        if frame_num is not None:
+            query += " AND frame_num = %s"
+            params.append(frame_num)
+        with db.cursor(pymysql.cursors.Cursor) as cursor:
+            cursor.execute(query + " ORDER BY frame_num, id", params)
+            rows = cursor.fetchall()
+        frame_nums = np.fromiter((r[0] for r in rows), dtype=np.int32, count=len(rows))
+        class_names = [r[1] for r in rows]
+        boxes = np.array([r[2:] for r in rows], dtype=np.float32).reshape(-1, 4)
+        return frame_nums, class_names, boxes
     
     def get_annotation_status(self):
-        annotation_status='yet to start'
-        last_annotated_frame=None
-
-        # 首先嘗試將 video_id 轉換為整數（向後兼容）
-        try:
-            video_id_int = int(self.video_id)
-            cursor = connection.cursor(pymysql.cursors.DictCursor)
-            query = "SELECT annotation_status,last_annotated_frame FROM video WHERE video_id = %s"
-            cursor.execute(query,(self.video_id,))
-            result = cursor.fetchone()
-            if result:
-                annotation_status = result['annotation_status']
-                last_annotated_frame = result['last_annotated_frame']
-                return annotation_status, last_annotated_frame
-            else:
-                raise ValueError(f"Video with ID {self.video_id} not found")
-        except (ValueError, TypeError):
-            pass
+        return self.annotation_status, self.last_annotated_frame
 
     ###### Selecting Frame for Manual Annotation ######
     # For testing purpose, annotate every second
-    def get_next_frame_to_annotate(self):
-        self.frame_count = self.get_frame_count()
-        self.fps = self.get_fps()
+    # Output: (frame URL, frame_num), or (None, None) when there is nothing left to annotate
+    def get_next_frame_to_annotate(self, profile=None):
         if self.annotation_status == "yet to start":
             frame_num = 0
-            return self.get_frame(frame_num), frame_num
+            return self.get_frame_url(frame_num, profile), frame_num
         elif self.annotation_status == "completed":
             return None, None
         elif isinstance(self.last_annotated_frame, int):
-            next_frame = self.last_annotated_frame + self.fps
+            next_frame = self.last_annotated_frame + max(1, int(round(self.fps)))
             if next_frame < self.frame_count:
-                return self.get_frame(next_frame), next_frame
+                return self.get_frame_url(next_frame, profile), next_frame
             else:
                 # no more frames to annotate
                 self.annotation_status = "manual annotation completed"
@@ -1234,40 +1451,117 @@ class Video(Project):
         else:
             return None, None
     
+    # URL of the binary frame endpoint (the image is decoded when the browser fetches it)
+    # Output: URL of the frame image; a non-default encoding is passed as query parameters
+    def get_frame_url(self, frame_num: int, profile=None):
+        url = f"/projects/{self.project_id}/videos/{self.video_id}/frames/{frame_num}?v={self.get_frame_version()}"
+        if profile is not None and profile != DEFAULT_FRAME_PROFILE:
+            url += f"&{profile.query()}"
+        return url
+
+    # Version of the file frames are decoded from (its path, size and mtime), so a rebuilt proxy gets new frame URLs
+    # Output: short hex string, "0" if the file is missing
+    def get_frame_version(self, frame_path=None):
+        frame_path = frame_path or self.get_frame_path()
+        try:
+            stat = os.stat(frame_path)
+        except (OSError, TypeError):
+            return "0"
+        return hashlib.sha1(f"{frame_path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+
+    # Output: base64 encoded JPEG
     def get_frame(self, frame_num: int):
+        frame_bytes = self.get_frame_bytes(frame_num)
+        frame_encoded = base64.b64encode(frame_bytes).decode('utf-8')
+        return frame_encoded
+
+    # Encoded frame, served from frame_cache when possible (a hit does not open the video)
+    # Output: image bytes encoded with profile (DEFAULT_FRAME_PROFILE if None)
+    def get_frame_bytes(self, frame_num: int, profile=None):
+        profile = profile or DEFAULT_FRAME_PROFILE
         if self.frame_count <= 0:
             raise ValueError("Video file is invalid or has no frames")
         if frame_num < 0 or frame_num >= self.frame_count:
             raise ValueError("Frame number out of range")
-        if not self.video_path:
-            self.video_path = self.get_video_path()
-        cap = cv2.VideoCapture(self.video_path)
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_num)
-        ret, frame = self.cap.read()
-        if ret:
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
-            frame_encoded = base64.b64encode(frame_bytes).decode('utf-8')
-        else:
+        frame_path = self.get_frame_path()
+        key = self._frame_key(frame_path, frame_num, profile)
+        frame_bytes = frame_cache.get(key)
+        if frame_bytes is None:
+            # Reuse a prefetch of this frame that is already running (for at most FRAME_PREFETCH_WAIT seconds)
+            frame_bytes = frame_prefetcher.wait(key)
+        if frame_bytes is None:
+            frame_bytes = self._encode_frame(frame_num, profile, frame_path)
+            frame_cache.put(key, frame_bytes)
+        return frame_bytes
+
+    # Cache key of a frame decoded from frame_path. It includes the frame version, so frames decoded from
+    # a file that was replaced since (the original, once the proxy is built) are never served for the new one,
+    # even when a prefetch started before the invalidation stores them afterwards
+    def _frame_key(self, frame_path, frame_num, profile):
+        return (int(self.video_id), self.get_frame_version(frame_path), frame_num, profile.key)
+
+    # Start decoding the frames that follow the manual annotation step pattern
+    # (frame_num, frame_num + step, ...) so that they are cached before the browser asks for them
+    def prefetch_frames(self, session, frame_num: int, profile=None):
+        profile = profile or DEFAULT_FRAME_PROFILE
+        step = max(1, int(round(self.fps)))
+        frame_nums = range(frame_num, min(frame_num + step * frame_prefetcher.depth, self.frame_count), step)
+        frame_path = self.get_frame_path()
+        frame_prefetcher.schedule(session, [
+            (self._frame_key(frame_path, n, profile), lambda n=n: self._encode_frame(n, profile, frame_path))
+            for n in frame_nums
+        ])
+
+    # Decode through the seek index (keyframe seek + bounded decode) when the video has one
+    def _encode_frame(self, frame_num: int, profile, frame_path=None):
+        frame_path = frame_path or self.get_frame_path()
+        frame = read_frame(frame_path, frame_num, load_seek_index(frame_path))
+        if frame is None:
             raise ValueError("Could not read frame")
-        return frame_encoded
-    
-    def annotate(self, frame_num: int, bbox: list):
+        return encode_frame(frame, profile)
+
+    # Size of the frames served with profile
+    # Output: (width, height)
+    def get_frame_size(self, profile=None):
+        width, height = (self.proxy_width, self.proxy_height) if self.has_proxy() else self.resolution
+        if not (width and height):
+            return width, height
+        return (profile or DEFAULT_FRAME_PROFILE).scaled_size(width, height)
+    
+    # Save all bboxes of a frame in one transaction
+    # Input: frame_num, bboxes [[class_name, x, y, w, h], ...] or [{class_name, x, y, width, height}, ...],
+    #        frame_size (width, height) of the image the boxes were drawn on, None for a frame served with
+    #        DEFAULT_FRAME_PROFILE (from the proxy when there is one)
+    def annotate(self, frame_num: int, bboxes: list, frame_size=None):
         try:
-            self.annotation_status = "manual annotation in progress"
             if frame_num < 0 or frame_num >= self.frame_count:
                 raise ValueError("Frame number out of range")
-            class_name, x, y, w, h = bbox
-            # width, height = self.get_resolution()
-            # x_center, y_center = x + w/2, y + h/2
-            # x_normalized, y_normalized, w_normalized, h_normalized = x_center/width, y_center/height, w/width, h/height
-            bbox_processed = f"{x} {y} {w} {h}"
+            # Boxes drawn on a downscaled frame are stored in source pixels
+            scale_x, scale_y = 1.0, 1.0
+            if not (frame_size and all(frame_size)):
+                frame_size = self.get_frame_size(DEFAULT_FRAME_PROFILE)
+            if frame_size and all(frame_size):
+                width, height = self.get_resolution()
+                if width and height:
+                    scale_x, scale_y = width / frame_size[0], height / frame_size[1]
+            rows = []
+            for bbox in bboxes:
+                if isinstance(bbox, dict):
+                    class_name = bbox.get("class_name", bbox.get("class"))
+                    x, y, w, h = bbox["x"], bbox["y"], bbox["width"], bbox["height"]
+                else:
+                    class_name, x, y, w, h = bbox
+                rows.append((frame_num, class_name, float(x) * scale_x, float(y) * scale_y,
+                             float(w) * scale_x, float(h) * scale_y, self.video_id))
+
+            # Save result (status, progress and boxes are committed together)
+            with db.cursor() as cursor:
+                query = "UPDATE video SET annotation_status = %s, last_annotated_frame = %s WHERE video_id = %s"
+                cursor.execute(query, ("manual annotation in progress", frame_num, self.video_id))
+                if rows:
+                    cursor.executemany(self._insert_bbox_query, rows)
+            self.annotation_status = "manual annotation in progress"
             self.last_annotated_frame = frame_num
-
-            # Save result
-            self.save_annotation_status()
-            self.save_last_annotated_frame()
-            self.save_bbox_data(frame_num, class_name, bbox_processed)
             return True
         
         except Exception as e:
@@ -1303,120 +1597,267 @@ class Video(Project):
         iou = inter_area / float(box1_area + box2_area - inter_area) if (box1_area + box2_area - inter_area) > 0 else 0
         return iou
 
+    # Find the SAM box on a frame that best matches the KCF-predicted box (highest IoU)
+    # Output: (x, y, w, h) or None if tracking lost the object / SAM found nothing
+    def _match_sam_bbox(self, frame, target_bbox, sam_model=None):
+        if target_bbox is None:
+            return None
+        sam_segmenter = SAM(image=frame, model=sam_model)
+        bboxes = sam_segmenter.segment()
+
+        max_iou = -1
+        best_bbox = None
+        for bbox in bboxes:
+            iou = self._calculate_iou(target_bbox, bbox)
+            if iou > max_iou:
+                max_iou = iou
+                best_bbox = bbox
+        return best_bbox
+
     def auto_annotate(self):
         self.annotation_status = "auto annotation in progress"
         
-        bbox_data = self.get_bbox_data()
+        frame_nums, class_names, boxes = self.get_bbox_array()
 
         # Find all annotated frames
-        annotated_frames = list({d["frame_num"] for d in bbox_data if "frame_num" in d})
-
-        # Loop through each segment between annotated frames
-        for i in range(len(annotated_frames) - 1):
-            starting_frame_num = annotated_frames[i]
-            ending_frame_num = annotated_frames[i + 1]
-            print(f"Auto-annotating frames from {starting_frame_num} to {ending_frame_num}...")
-
-            # Convert the bbox string to a tuple of integers
-            frame_bbox = self.get_bbox_data(starting_frame_num)
-            for bbox in frame_bbox:
-                starting_frame_bbox = tuple(bbox['coordinates'].split())
-
-            # Perform KCF tracking to locate the estimated location of the object
-            if not self.video_path:
-                self.video_path = self.get_video_path()
-            kcf_tracker = KCF(video_path=self.video_path)
-            tracking_results = kcf_tracker.predict_frames(starting_frame_bbox=starting_frame_bbox, starting_frame_num=starting_frame_num, ending_frame_num=ending_frame_num)
-
-            # Find the correct segment for each unbounded frame
-            cap = cv2.VideoCapture(self.video_path)
-            cap.set(cv2.CAP_PROP_POS_FRAMES, starting_frame_num+1)
-            for index in range(starting_frame_num+1, ending_frame_num):
-                print(f"Processing frame {index+1}...")
-                ret, frame = cap.read()
-                if not ret:
-                    print(f"无法读取第 {index+1} 帧，视频可能结束")
-                    break
-                sam_segmenter = SAM(image=frame)
-                bboxes = sam_segmenter.segment()
-                    
-                # Find the best matching SAM box by comparing IoU of the kcf-predicted box
-                max_iou = -1
-                best_bbox = None
-                target_bbox = tracking_results[index - starting_frame_num]
-
-                for bbox in bboxes:
-                    iou = self._calculate_iou(target_bbox, bbox)
-                    if iou > max_iou:
-                        max_iou = iou
-                        best_bbox = bbox
-
-                x, y, w, h = best_bbox
-                best_bbox = f"{x} {y} {w} {h}"
-                self.bbox_data.append({"frame_num": index, "class_name": starting_frame_bbox['class_name'],"coordinates": best_bbox})
-                print(f"Best matching bbox for frame {index+1}: {best_bbox}")
-
-                # Save bbox result in database
-                self.save_bbox_data(index, starting_frame_bbox['class_name'], best_bbox)
-
-                # Save the number of frame in progress
-                self.last_annotated_frame = index
-                self.save_last_annotated_frame()
-
-        cap.release()
+        annotated_frames = np.unique(frame_nums).tolist()
+
+        # Tracking and SAM run on the annotation proxy; boxes are converted between its pixels and source pixels
+        frame_path = self.get_frame_path()
+        scale = self.get_frame_scale()
+
+        # Tracked boxes are buffered and written in batches (BBOX_FLUSH_SIZE rows per transaction), and the
+        # progress is saved with each batch, so last_annotated_frame never runs ahead of the stored boxes
+        def save_progress(cursor, rows):
+            cursor.execute("UPDATE video SET last_annotated_frame = %s WHERE video_id = %s", (self.last_annotated_frame, self.video_id))
+        writer = BatchWriter(db, self._insert_bbox_query, on_flush=save_progress)
+
+        # Progress is also saved on its own schedule (every few seconds, and when the job ends or fails)
+        # without forcing the batch out: it stops before the first box that is still buffered
+        def save_frame(frame_num):
+            if writer.rows:
+                frame_num = min(frame_num, writer.rows[0][0] - 1)
+            with db.cursor() as cursor:
+                cursor.execute("UPDATE video SET last_annotated_frame = %s WHERE video_id = %s", (frame_num, self.video_id))
+        progress_writer = ProgressWriter(save_frame)
+
+        # One pass from the first to the last annotated frame: every frame is decoded once and used for
+        # both tracking and SAM. Each annotated frame starts a new segment, tracking its (last) box
+        # (boxes are stored in source pixels)
+        if len(annotated_frames) > 1:
+            reader = FrameReader(frame_path, annotated_frames[0], annotated_frames[-1])
+            segment_ends = dict(zip(annotated_frames, annotated_frames[1:]))
+            kcf_tracker = KCF()
+            tracking, class_name = False, None
+            # The SAM model is held for the whole job (loaded once, shared with other jobs)
+            with writer, progress_writer, model_registry.use("sam") as sam_model:
+                for frame_num, frame in reader:
+                    if frame_num in segment_ends:
+                        print(f"Auto-annotating frames from {frame_num} to {segment_ends[frame_num]}...")
+                        index = np.flatnonzero(frame_nums == frame_num)[-1]
+                        class_name = class_names[index]
+                        starting_frame_bbox = tuple(int(c / s) for c, s in zip(boxes[index], scale * 2))
+                        # Perform KCF tracking to locate the estimated location of the object
+                        tracking = kcf_tracker.init(frame, starting_frame_bbox)
+                        if tracking:
+                            kcf_tracker.update(frame)
+                        continue
+
+                    # Find the correct segment for the unbounded frame
+                    print(f"Processing frame {frame_num+1}...")
+                    target_bbox = kcf_tracker.update(frame) if tracking else None
+                    best_bbox = self._match_sam_bbox(frame, target_bbox, sam_model)
+                    if best_bbox is not None:
+                        x, y, w, h = (float(c) * s for c, s in zip(best_bbox, scale * 2))
+                        print(f"Best matching bbox for frame {frame_num+1}: {x} {y} {w} {h}")
+
+                        # Queue bbox result for the database
+                        writer.add((frame_num, class_name, x, y, w, h, self.video_id))
+
+                    # Save the number of frame in progress
+                    self.last_annotated_frame = frame_num
+                    progress_writer.update(frame_num)
+            logger.info(f"Auto annotation of video {self.video_id} decoded {reader.stats()}")
 
         self.annotation_status = "completed"
         self.save_annotation_status()
 
         return True
 
+    # Build the keyframe / timestamp index and store it next to the video file (or its blob)
+    # Output: True if an index was written
+    def build_seek_index(self):
+        artifact_path = self.get_artifact_path()
+        index = build_seek_index(artifact_path) if artifact_path else None
+        if index is None:
+            logger.warning(f"Could not build seek index for video {self.video_id}")
+            return False
+        save_seek_index(artifact_path, index)
+        logger.info(f"Seek index for video {self.video_id}: {index.frame_count} frames, "
+                    f"{len(index.keyframes)} keyframes, longest GOP {index.max_gop()}")
+        return True
+
+    # Write the annotation proxy (constant frame rate, short GOP, capped resolution) and index it
+    # A proxy that already exists for the same content is reused
+    # Output: True if the video has a proxy
+    def build_proxy(self):
+        artifact_path = self.get_artifact_path()
+        if not artifact_path:
+            return False
+        path = media_proxy_path(artifact_path)
+        reused = bool(self.content_hash) and os.path.isfile(path)
+        metadata = probe_video(path) if reused else transcode_proxy(artifact_path)
+        if metadata is None:
+            logger.warning(f"Could not write annotation proxy for video {self.video_id}, frames are read from the original")
+            return False
+        if not reused or load_seek_index(path) is None:
+            index = build_seek_index(path)
+            if index is not None:
+                save_seek_index(path, index)
+        with db.cursor() as cursor:
+            query = "UPDATE video SET proxy_path = %s, proxy_frames = %s, proxy_width = %s, proxy_height = %s WHERE video_id = %s"
+            cursor.execute(query, (path, metadata["total_frames"], metadata["width"], metadata["height"], self.video_id))
+        self.proxy_path, self.proxy_frames = path, metadata["total_frames"]
+        self.proxy_width, self.proxy_height = metadata["width"], metadata["height"]
+        self.__dict__.pop("frame_count", None)
+        # Frames decoded from the original are replaced by proxy frames
+        frame_cache.invalidate_video(int(self.video_id))
+        logger.info(f"Annotation proxy for video {self.video_id}: {metadata['width']}x{metadata['height']}, "
+                    f"{metadata['total_frames']} frames at {metadata['fps']:.3f} fps")
+        return True
+
+    # Timeline sprite sheets are stored with the blob (shared by all uploads of the content),
+    # or in projects/<project_id>/thumbnails/<video_id>/ for videos outside the blob store
+    def get_thumbnail_dir(self):
+        if self.content_hash and blob_store.exists(self.content_hash):
+            return os.path.join(blob_store.artifact_dir(self.content_hash), "thumbnails")
+        return os.path.join(self.get_project_path(), "thumbnails", str(self.video_id))
+
+    def get_thumbnail_url(self, filename):
+        return f"/projects/{self.project_id}/videos/{self.video_id}/thumbnails/{filename}"
+
+    def has_thumbnails(self):
+        return os.path.isfile(os.path.join(self.get_thumbnail_dir(), THUMBNAIL_INDEX))
+
+    # Sample the annotation frames at a fixed interval and tile them into sprite sheets (one pass)
+    # Output: True if the sprites and index were written
+    def build_thumbnails(self):
+        if self.content_hash and self.has_thumbnails():
+            return True
+        frame_path = self.get_frame_path()
+        index = build_thumbnails(frame_path, self.get_thumbnail_dir()) if frame_path else None
+        if index is None:
+            logger.warning(f"Could not build thumbnails for video {self.video_id}")
+            return False
+        logger.info(f"Thumbnails for video {self.video_id}: {len(index['frames'])} in {len(index['sheets'])} sheets")
+        return True
+
+    # Stages of the ingest pipeline: metadata is required, a video without seek index, proxy or
+    # thumbnails can still be annotated (frames are then read from the original)
+    def ingest_stages(self):
+        stages = [("probe", self.ensure_metadata, True), ("seek_index", self.ensure_seek_index, False)]
+        if INGEST_PROXY:
+            stages.append(("proxy", self.build_proxy, False))
+        if INGEST_THUMBNAILS:
+            stages.append(("thumbnails", self.build_thumbnails, False))
+        return stages
+
+    # Output: True if queued, False if the video is already being ingested
+    # Ingests of the same content write the same artifacts (next to the blob), so they run one at a time
+    def queue_ingest(self):
+        return ingest_pipeline.submit((self.project_id, self.video_id), self.ingest_stages(),
+                                      group=self.content_hash or None)
+
+    # Probe the file unless the row already has metadata (e.g. copied from the same content)
+    def ensure_metadata(self):
+        self._load_video_row()
+        if self.__dict__.get("fps") is not None:
+            return True
+        return self.reuse_artifacts() or self.probe_metadata()
+
+    def ensure_seek_index(self):
+        artifact_path = self.get_artifact_path()
+        if artifact_path and load_seek_index(artifact_path) is not None:
+            return True
+        return self.build_seek_index()
+
+    # Output: {"status": stage or ready / failed, "error": message or None, "pending": True while queued or running}
+    # Videos uploaded before the pipeline existed have no status and count as ready
+    def get_ingest_status(self):
+        return {
+            "status": self.ingest_status or "ready",
+            "error": self.ingest_error,
+            "pending": ingest_pipeline.pending((self.project_id, self.video_id)),
+        }
+
+    def save_ingest_status(self, ingest_status, error=None):
+        with db.cursor() as cursor:
+            query = "UPDATE video SET ingest_status = %s, ingest_error = %s WHERE video_id = %s"
+            cursor.execute(query, (ingest_status, error, self.video_id))
+        self.ingest_status, self.ingest_error = ingest_status, error
+
+    # Remove the video row (e.g. when the upload failed)
+    def delete_record(self):
+        with db.cursor() as cursor:
+            cursor.execute("DELETE FROM video WHERE video_id = %s", (self.video_id,))
+            success = bool(cursor.rowcount)
+        project_cache.invalidate(("videos", self.project_id))
+        frame_cache.invalidate_video(int(self.video_id))
+        return success
+
+    # Undo an upload that failed after the row was created: delete the row and the project's hardlink
+    # of the blob (the blob itself is kept, other videos may use it)
+    def discard_upload(self):
+        video_path = os.path.abspath(str(self.video_path))
+        self.delete_record()
+        blob_root = os.path.abspath(blob_store.root)
+        if os.path.commonpath([video_path, blob_root]) != blob_root and os.path.isfile(video_path):
+            os.remove(video_path)
+
     # Save video path to database
     def save_video_path(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE video SET video_path = %s WHERE video_id = %s"
-        cursor.execute(query,(self.video_path, self.video_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()
+        with db.cursor() as cursor:
+            # A proxy of the old file no longer matches
+            query = "UPDATE video SET video_path = %s, proxy_path = NULL WHERE video_id = %s"
+            cursor.execute(query,(self.video_path, self.video_id))
+            self.proxy_path = None
+            success = bool(cursor.rowcount)
+        # The file changed, so frames decoded from the old one are stale
+        frame_cache.invalidate_video(int(self.video_id))
         return success
     
     # Save video name to database
     def save_video_name(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE video SET video_name = %s WHERE video_id = %s"
-        cursor.execute(query,(self.video_name, self.video_id))
-        connection.commit()
-        success = bool(cursor.rowcount)
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "UPDATE video SET video_name = %s WHERE video_id = %s"
+            cursor.execute(query,(self.video_name, self.video_id))
+            success = bool(cursor.rowcount)
         return success
     
     # Save annotation status to database
     def save_annotation_status(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE video SET annotation_status = %s WHERE video_id = %s"
-        cursor.execute(query,(self.annotation_status, self.video_id))
-        connection.commit()  # 提交事务
-        success = bool(cursor.rowcount)
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "UPDATE video SET annotation_status = %s WHERE video_id = %s"
+            cursor.execute(query,(self.annotation_status, self.video_id))
+            success = bool(cursor.rowcount)
         return success
     
     # Save last annotated frame to database
     def save_last_annotated_frame(self):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "UPDATE video SET last_annotated_frame = %s WHERE video_id = %s"
-        cursor.execute(query,(self.last_annotated_frame, self.video_id))
-        connection.commit()  # 提交事务
-        success = bool(cursor.rowcount)
-        cursor.close()
+        with db.cursor() as cursor:
+            query = "UPDATE video SET last_annotated_frame = %s WHERE video_id = %s"
+            cursor.execute(query,(self.last_annotated_frame, self.video_id))
+            success = bool(cursor.rowcount)
         return success
     
-    def save_bbox_data(self, frame_num, class_name, coordinates):
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        query = "INSERT INTO bbox (frame_num, class_name, coordinates, video_id) VALUES (%s, %s, %s, %s)"
-        cursor.execute(query,(frame_num, class_name, coordinates, self.video_id))
-        connection.commit()  # 提交事务
-        success = bool(cursor.rowcount)
-        cursor.close()
+    _insert_bbox_query = "INSERT INTO bbox (frame_num, class_name, x, y, w, h, video_id) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+
+    # bbox: (x, y, w, h)
+    def save_bbox_data(self, frame_num, class_name, bbox):
+        x, y, w, h = bbox
+        with db.cursor() as cursor:
+            cursor.execute(self._insert_bbox_query,(frame_num, class_name, x, y, w, h, self.video_id))
+            success = bool(cursor.rowcount)
         return success
 
 @app.exception_handler(Exception)
@@ -1439,7 +1880,7 @@ class LoginRequest(BaseModel):
 # Input: username, password
 # Output: success, userID
 @app.post("/login")
-async def login(request: LoginRequest):
+def login(request: LoginRequest):
     try:
         username = request.username
         password = request.password
@@ -1494,7 +1935,7 @@ class RegisterRequest(BaseModel):
 
 #register function by Jimmy for frontend login page to use
 @app.post("/register")
-async def register(request: RegisterRequest):
+def register(request: RegisterRequest):
     """用戶註冊端點"""
     try:
         username = request.username.strip()
@@ -1532,30 +1973,26 @@ async def register(request: RegisterRequest):
                 "message": "密碼確認不匹配"
             }
         
-        # 檢查用戶名是否已存在
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        check_query = "SELECT user_id FROM user WHERE username = %s"
-        cursor.execute(check_query, (username,))
-        existing_user = cursor.fetchone()
-        
-        if existing_user:
-            cursor.close()
-            return {
-                "success": False,
-                "message": "用戶名已存在"
-            }
-        
-        # 生成密碼哈希
-        salt, pwd_hash = UserLogin._hash_password(password)
-        stored_password = base64.b64encode(salt + b':' + pwd_hash).decode('utf-8')
-        
-        # 插入新用戶
-        insert_query = "INSERT INTO user (username, password) VALUES (%s, %s)"
-        cursor.execute(insert_query, (username, stored_password))
-        user_id = cursor.lastrowid
-        
-        connection.commit()
-        cursor.close()
+        with db.cursor() as cursor:
+            # 檢查用戶名是否已存在
+            check_query = "SELECT user_id FROM user WHERE username = %s"
+            cursor.execute(check_query, (username,))
+            existing_user = cursor.fetchone()
+            
+            if existing_user:
+                return {
+                    "success": False,
+                    "message": "用戶名已存在"
+                }
+            
+            # 生成密碼哈希
+            salt, pwd_hash = UserLogin._hash_password(password)
+            stored_password = base64.b64encode(salt + b':' + pwd_hash).decode('utf-8')
+            
+            # 插入新用戶
+            insert_query = "INSERT INTO user (username, password) VALUES (%s, %s)"
+            cursor.execute(insert_query, (username, stored_password))
+            user_id = cursor.lastrowid
         
         return {
             "success": True,
@@ -1579,41 +2016,16 @@ class UserRequest(BaseModel):
 # Input: userID
 # Output: owner project IDs, shared project IDs #change
 @app.post("/get_projects_info")
-async def get_users_projects(request: UserRequest):
+def get_users_projects(request: UserRequest):
     try: 
         userID = request.userID
 
-        # Check database connection
-        if not connection or not connection.open:
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={"error": "Database connection not available"}
-            )
-
+        # Name, video count, status and ownership of all owned and shared projects in one query
         user = User(userID)
-        owned_project_ids = user.get_owned_projects()
-        shared_project_ids = user.get_shared_projects()
-
-        # Get detailed project information for owned projects
-        owned_projects = []
-        for project_id in owned_project_ids:
-            project = Project(project_id)
-            name = project.get_name()
-            videoCount = project.get_video_count()
-            status = project.get_project_status()
-            isOwned = (user == project.get_owner())
-            owned_projects.append({"id": project_id, "name": name, "videoCount": videoCount, "status": status, "isOwned": isOwned})
-        
-        # Get detailed project information for shared projects
-        shared_projects = []
-        for project_id in shared_project_ids:
-            project = Project(project_id)
-            name = project.get_name()
-            videoCount = project.get_video_count()
-            status = project.get_project_status()
-            isOwned = (user == project.get_owner())
-            shared_projects.append({"id": project_id, "name": name, "videoCount": videoCount, "status": status, "isOwned": isOwned})
-        
+        projects_info = user.get_projects_info()
+        owned_projects = [p for p in projects_info if p["isOwned"]]
+        shared_projects = [p for p in projects_info if not p["isOwned"]]
+
         logger.info(f"Retrieved projects for user {userID}: {len(owned_projects)} owned, {len(shared_projects)} shared")
         
         
@@ -1638,15 +2050,8 @@ class ProjectRequest(BaseModel):
 # Input: Project ID
 # Output: {"project name": project_name, "project type": project_type, "video count": video_count, "status": project_status}
 @app.post("/get_project_details")
-async def get_project_details(request: ProjectRequest):
+def get_project_details(request: ProjectRequest):
     try:
-        # 檢查資料庫連接
-        if not connection or not connection.open:
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={"error": "Database connection not available"}
-            )
-        
         project = Project(project_id = request.project_id)
         project_details = {
             "project name": project.get_project_name(),
@@ -1672,7 +2077,7 @@ class CreateProjectRequest(BaseModel):
 
 # Create new project
 @app.post("/create_project")
-async def create_project(request: CreateProjectRequest):
+def create_project(request: CreateProjectRequest):
     try:
         userID = request.userID
         project_name = request.project_name
@@ -1688,14 +2093,6 @@ async def create_project(request: CreateProjectRequest):
                 "message": "Project name cannot be empty"
             }
 
-        # Check database connection
-        if not connection or not connection.open:
-            logger.error("Database connection not available")
-            return JSONResponse(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={"error": "Database connection not available"}
-            )
-
         # Create project instance and initialize
         logger.info("Initializing project...")
         # Initialize project
@@ -1721,7 +2118,7 @@ async def create_project(request: CreateProjectRequest):
         
 # Change project name
 @app.post("/change_project_name")
-async def change_project_name(request: ProjectRequest, new_name: str):
+def change_project_name(request: ProjectRequest, new_name: str):
     try:
         project = Project(project_id = request.project_id)
 
@@ -1751,7 +2148,7 @@ class ShareProjectRequest(BaseModel):
 
 # Share project with another user
 @app.post("/share_project")
-async def share_project(request: ShareProjectRequest):
+def share_project(request: ShareProjectRequest):
     try:
         project_id = request.project_id
         shared_with_username = request.shared_with_username.strip()
@@ -1765,50 +2162,45 @@ async def share_project(request: ShareProjectRequest):
             }
 
         # Check if project exists
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        project_query = "SELECT project_id, project_name, project_owner_id FROM project WHERE project_id = %s"
-        cursor.execute(project_query, (project_id,))
-        project = cursor.fetchone()
+        with db.cursor() as cursor:
+            project_query = "SELECT project_id, project_name, project_owner_id FROM project WHERE project_id = %s"
+            cursor.execute(project_query, (project_id,))
+            project = cursor.fetchone()
         
-        if not project:
-            cursor.close()
-            return {
-                "success": False,
-                "message": "Project not found"
-            }
+            if not project:
+                return {
+                    "success": False,
+                    "message": "Project not found"
+                }
 
-        # Check if target user exists
-        user_query = "SELECT user_id FROM user WHERE username = %s"
-        cursor.execute(user_query, (shared_with_username,))
-        target_user = cursor.fetchone()
+            # Check if target user exists
+            user_query = "SELECT user_id FROM user WHERE username = %s"
+            cursor.execute(user_query, (shared_with_username,))
+            target_user = cursor.fetchone()
         
-        if not target_user:
-            cursor.close()
-            return {
-                "success": False,
-                "message": f"User '{shared_with_username}' not found"
-            }
+            if not target_user:
+                return {
+                    "success": False,
+                    "message": f"User '{shared_with_username}' not found"
+                }
 
-        # Check if already shared
-        share_query = "SELECT id FROM project_shares WHERE project_id = %s AND shared_with_user_id = %s"
-        cursor.execute(share_query, (project_id, target_user['user_id']))
-        existing_share = cursor.fetchone()
+            # Check if already shared
+            share_query = "SELECT id FROM project_shares WHERE project_id = %s AND shared_with_user_id = %s"
+            cursor.execute(share_query, (project_id, target_user['user_id']))
+            existing_share = cursor.fetchone()
         
-        if existing_share:
-            cursor.close()
-            return {
-                "success": False,
-                "message": f"Project is already shared with '{shared_with_username}'"
-            }
+            if existing_share:
+                return {
+                    "success": False,
+                    "message": f"Project is already shared with '{shared_with_username}'"
+                }
 
-        # Create share record
-        insert_query = """
-            INSERT INTO project_shares (project_id, shared_with_user_id, permissions, shared_at) 
-            VALUES (%s, %s, %s, NOW())
-        """
-        cursor.execute(insert_query, (project_id, target_user['user_id'], permissions))
-        connection.commit()
-        cursor.close()
+            # Create share record
+            insert_query = """
+                INSERT INTO project_shares (project_id, shared_with_user_id, permissions, shared_at) 
+                VALUES (%s, %s, %s, NOW())
+            """
+            cursor.execute(insert_query, (project_id, target_user['user_id'], permissions))
 
         return {
             "success": True,
@@ -1830,29 +2222,26 @@ class UnshareProjectRequest(BaseModel):
 
 # Unshare project with a user
 @app.post("/unshare_project")
-async def unshare_project(request: UnshareProjectRequest):
+def unshare_project(request: UnshareProjectRequest):
     try:
         project_id = request.project_id
         shared_with_username = request.shared_with_username.strip()
 
         # Get target user ID
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        user_query = "SELECT user_id FROM user WHERE username = %s"
-        cursor.execute(user_query, (shared_with_username,))
-        target_user = cursor.fetchone()
+        with db.cursor() as cursor:
+            user_query = "SELECT user_id FROM user WHERE username = %s"
+            cursor.execute(user_query, (shared_with_username,))
+            target_user = cursor.fetchone()
         
-        if not target_user:
-            cursor.close()
-            return {
-                "success": False,
-                "message": f"User '{shared_with_username}' not found"
-            }
+            if not target_user:
+                return {
+                    "success": False,
+                    "message": f"User '{shared_with_username}' not found"
+                }
 
-        # Remove share record
-        delete_query = "DELETE FROM project_shares WHERE project_id = %s AND shared_with_user_id = %s"
-        result = cursor.execute(delete_query, (project_id, target_user['user_id']))
-        connection.commit()
-        cursor.close()
+            # Remove share record
+            delete_query = "DELETE FROM project_shares WHERE project_id = %s AND shared_with_user_id = %s"
+            result = cursor.execute(delete_query, (project_id, target_user['user_id']))
 
         if result > 0:
             return {
@@ -1876,22 +2265,21 @@ async def unshare_project(request: UnshareProjectRequest):
 
 # Get project shares
 @app.post("/get_project_shares")
-async def get_project_shares(request: ProjectRequest):
+def get_project_shares(request: ProjectRequest):
     try:
         project_id = request.project_id
 
-        cursor = connection.cursor(pymysql.cursors.DictCursor)
-        # Ask Jimmy (database has a table for project_shares?)
-        query = """
-            SELECT ps.id, ps.permissions, ps.shared_at, u.username, u.user_id
-            FROM project_shares ps
-            JOIN user u ON ps.shared_with_user_id = u.user_id
-            WHERE ps.project_id = %s
-            ORDER BY ps.shared_at DESC
-        """
-        cursor.execute(query, (project_id,))
-        shares = cursor.fetchall()
-        cursor.close()
+        with db.cursor() as cursor:
+            # Ask Jimmy (database has a table for project_shares?)
+            query = """
+                SELECT ps.id, ps.permissions, ps.shared_at, u.username, u.user_id
+                FROM project_shares ps
+                JOIN user u ON ps.shared_with_user_id = u.user_id
+                WHERE ps.project_id = %s
+                ORDER BY ps.shared_at DESC
+            """
+            cursor.execute(query, (project_id,))
+            shares = cursor.fetchall()
 
         return {
             "success": True,
@@ -1910,41 +2298,94 @@ async def get_project_shares(request: ProjectRequest):
 
 #=================================== Page 3 - Video Upload & Management ==========================================
 
-async def save_upload_file(upload_file: UploadFile, destination: Path):
+async def save_upload_file(upload_file: MultipartFileReader, writer):
     """
-    Stream upload to disk in chunks.
+    Stream upload to a blob writer as it arrives from the request body (hashed while it is written).
+    Hashing and writing run on the upload I/O threads, overlapped with reading the next chunks.
     """
     total_written = 0
-    chunk_size = 10 * 1024 * 1024  # 10 MB chunks
+    next_progress = 100 * 1024 * 1024
 
     # Max file size: 5 GB (adjust as needed)
     MAX_FILE_SIZE = 5 * 1024 * 1024 * 1024  # 5 GB in bytes
 
-    with destination.open("wb") as buffer:
-        while True:
-            chunk = await upload_file.read(chunk_size)
-            if not chunk:
-                break
-            buffer.write(chunk)
-            total_written += len(chunk)
+    async def read_chunk():
+        nonlocal total_written, next_progress
+        chunk = await upload_file.read()
+        total_written += len(chunk)
 
-            # Optional: Log progress
-            if total_written % (100 * 1024 * 1024) == 0:  # every 100 MB
-                logger.info(f"Uploaded {total_written / (1024**2):.1f} MB of {upload_file.filename}")
+        # Optional: Log progress
+        if total_written >= next_progress:  # every 100 MB
+            logger.info(f"Uploaded {total_written / (1024**2):.1f} MB of {upload_file.filename}")
+            next_progress += 100 * 1024 * 1024
 
-            # Enforce size limit
-            if total_written > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File too large. Max allowed: {MAX_FILE_SIZE / (1024**3):.1f} GB"
-                )
-
-    return total_written
+        # Enforce size limit
+        if total_written > MAX_FILE_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Max allowed: {MAX_FILE_SIZE / (1024**3):.1f} GB"
+            )
+        return chunk
+
+    return await upload_io.copy(read_chunk, writer.write)
+
+# Link the stored content into the project and queue the ingest pipeline for what the annotation needs.
+# Content that was uploaded before reuses the metadata, seek index, proxy and thumbnails of that
+# upload, so only missing artifacts are built. The response does not wait for the pipeline;
+# clients poll GET /projects/{project_id}/videos/{video_id}/ingest
+# Output: True if the content was already known
+async def ingest_blob(video, digest):
+    await run_in_threadpool(video.attach_blob, digest)
+    known = await run_in_threadpool(video.reuse_artifacts)
+    # The pipeline works on its own Video object, this one is still used for the response
+    await run_in_threadpool(Video(project_id=video.project_id, video_id=video.video_id).queue_ingest)
+    return known
+
+# Response of the upload endpoints
+# The metadata is only included when it is already known (same content uploaded before); otherwise
+# it is probed by the ingest pipeline after the response
+def upload_response(video, video_id, filename, size, digest, deduplicated, known):
+    return {
+        "message": "Upload successful",
+        "filename": filename,
+        "video_id": video_id,
+        "size_bytes": size,
+        "size_gb": round(size / (1024**3), 2),
+        "sha256": digest,
+        "deduplicated": deduplicated,
+        "path": str(video.video_path),
+        "ingest_status": "queued",
+        "ingest_url": f"/projects/{video.project_id}/videos/{video_id}/ingest",
+        "frame_count": video.total_frames if known else None,
+        "fps": video.fps if known else None,
+        "resolution": [video.width, video.height] if known else None,
+        "codec": video.codec if known else None,
+        "duration": video.duration if known else None
+    }
 
+# Validate the file name of a new video and check that the project does not have it yet
+# Output: (name, extension without the dot)
+def check_upload_target(project_id, filename):
+    safe_filename = Path(filename).name
+    name, ext = os.path.splitext(safe_filename)
+    if safe_filename != filename or not name or ext.lower() not in Video._media_types:
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    project = Project(project_id=project_id)
+    if (Path(project.get_project_path()) / "videos" / f"{sanitize_filename(name)}{ext.lower()}").exists():
+        raise HTTPException(status_code=409, detail="File already exists")
+    return name, ext.lstrip(".").lower()
+
+# The multipart body is parsed as it arrives (MultipartFileReader) and the file is written on the upload
+# I/O threads: it is neither spooled to a temporary file nor read through the API threadpool
 @app.post("/upload")
-async def upload(project_id: int, file: UploadFile = File(...)):
+async def upload(project_id: int, request: Request):
     try:
-        project = Project(project_id=project_id)
+        try:
+            file = MultipartFileReader(request.stream(), request.headers.get("content-type"))
+            await file.headers()
+        except UploadError as e:
+            raise HTTPException(status_code=e.status, detail=str(e))
+        project = await run_in_threadpool(Project, project_id=project_id)
         project_dir = Path(project.get_project_path())
 
         # Allowed video MIME types
@@ -1975,29 +2416,33 @@ async def upload(project_id: int, file: UploadFile = File(...)):
                 detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_MIME_TYPES)}"
             )
 
-        # 3. Define destination
-        file_path = project_dir / safe_filename
+        # 3. Define destination (projects/<id>/videos/<name>.<ext>)
+        name, ext = os.path.splitext(safe_filename)
+        file_path = project_dir / "videos" / f"{sanitize_filename(name)}{ext.lower()}"
 
         # Optional: Prevent overwrite (or allow with unique names)
         if file_path.exists():
             raise HTTPException(status_code=409, detail="File already exists")
 
-        # 4. Stream to disk
+        # 4. Register the video and stream it into the blob store, hashing it on the way
+        video = Video(project_id=project_id)
+        video_id, file_path = await run_in_threadpool(video.initialize, name, ext.lstrip(".").lower())
         try:
-            size = await save_upload_file(file, file_path)
-            logger.info(f"Successfully uploaded: {file_path} ({size / (1024**3):.2f} GB)")
+            with blob_store.writer() as writer:  # the partial file is removed if the upload fails
+                size = await save_upload_file(file, writer)
+                digest, created = await upload_io.run(writer.commit)
+            logger.info(f"Successfully uploaded: {file_path} ({size / (1024**3):.2f} GB, "
+                        f"sha256 {digest[:12]}, {'new content' if created else 'already stored'})")
+
+            # 5. Link it into the project and queue the ingest pipeline (probe frame count, fps, resolution,
+            #    codec and duration, index keyframes, transcode the proxy, sample thumbnails) in the background
+            known = await ingest_blob(video, digest)
         except Exception as e:
-            if file_path.exists():
-                file_path.unlink()  # cleanup partial
+            logger.error(f"Upload of {file_path} failed: {e}")
+            await run_in_threadpool(video.discard_upload)
             raise HTTPException(status_code=500, detail="Upload failed")
-        
-        return JSONResponse({
-            "message": "Upload successful",
-            "filename": safe_filename,
-            "size_bytes": size,
-            "size_gb": round(size / (1024**3), 2),
-            "path": str(file_path)
-        })
+
+        return JSONResponse(upload_response(video, video_id, safe_filename, size, digest, known or not created, known))
 
     except Exception as e:
         logger.error(f"Upload error: {str(e)}")
@@ -2006,6 +2451,169 @@ async def upload(project_id: int, file: UploadFile = File(...)):
             content={"error": str(e)}
         )
 
+class UploadByHashRequest(BaseModel):
+    project_id: int
+    filename: str
+    sha256: str
+
+# Add a video whose content is already stored (e.g. uploaded to another project) without sending it again
+# Output: 404 if the content is unknown, the client then uploads the file with /upload
+@app.post("/upload_by_hash")
+async def upload_by_hash(request: UploadByHashRequest):
+    try:
+        digest = request.sha256.lower()
+        if not re.fullmatch(r"[0-9a-f]{64}", digest) or not blob_store.exists(digest):
+            return JSONResponse(status_code=404, content={"error": "Unknown content, upload the file"})
+
+        name, ext = await run_in_threadpool(check_upload_target, request.project_id, request.filename)
+
+        video = Video(project_id=request.project_id)
+        video_id, _ = await run_in_threadpool(video.initialize, name, ext)
+        try:
+            known = await ingest_blob(video, digest)
+        except Exception:
+            await run_in_threadpool(video.discard_upload)
+            raise
+
+        size = os.path.getsize(blob_store.path(digest))
+        return upload_response(video, video_id, request.filename, size, digest, True, known)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Upload by hash error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
+#=== Resumable upload ===
+# 1. POST /uploads {project_id, filename, size, sha256?}  -> upload_id, chunk_size
+# 2. PUT /uploads/{upload_id}?offset=N with the raw chunk as body (optional X-Chunk-SHA256 header),
+#    in any order and in parallel; a failed chunk is simply sent again
+# 3. GET /uploads/{upload_id}  -> received and missing byte ranges (to resume after an interruption)
+# 4. POST /uploads/{upload_id}/complete  -> checksum verified, video registered like /upload
+#    (safe to retry: a completed session answers with the video it registered)
+
+class UploadSessionRequest(BaseModel):
+    project_id: int
+    filename: str
+    size: int
+    sha256: Optional[str] = None  # of the whole file, checked on completion
+
+def upload_error_response(e: UploadError):
+    return JSONResponse(status_code=e.status, content={"error": str(e)})
+
+@app.post("/uploads")
+def create_upload(request: UploadSessionRequest):
+    try:
+        check_upload_target(request.project_id, request.filename)
+        session = upload_sessions.create(request.project_id, request.filename, request.size, request.sha256)
+        return session.status(upload_sessions.chunk_size)
+
+    except HTTPException:
+        raise
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Create upload error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, offset: int, request: Request):
+    try:
+        # A chunk can be at most UPLOAD_MAX_CHUNK_MB and cannot extend past the declared file size;
+        # the bound is enforced while the body is read, Content-Length only rejects it early
+        session = await upload_io.run(upload_sessions.get, upload_id)
+        if offset < 0 or offset > session.size:
+            raise UploadError("Chunk is outside the file", status=416)
+        limit = min(upload_sessions.max_chunk_size, session.size - offset)
+        message = (f"Chunk too large. At most {limit} bytes can be written at offset {offset} "
+                   f"(chunks up to {upload_sessions.max_chunk_size // 1024 ** 2} MB)")
+        if int(request.headers.get("content-length") or 0) > limit:
+            raise UploadError(message, status=413)
+        data = await read_limited(request.stream(), limit, message)
+        session = await upload_io.run(upload_sessions.write, upload_id, offset, data,
+                                      request.headers.get("x-chunk-sha256"))
+        return session.status(upload_sessions.chunk_size)
+
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Upload chunk error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
+@app.get("/uploads/{upload_id}")
+def get_upload(upload_id: str):
+    try:
+        return upload_sessions.get(upload_id).status(upload_sessions.chunk_size)
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.delete("/uploads/{upload_id}")
+def delete_upload(upload_id: str):
+    try:
+        upload_sessions.get(upload_id)
+        upload_sessions.delete(upload_id)
+        return {"success": True}
+    except UploadError as e:
+        return upload_error_response(e)
+
+# Only one of concurrent completions of a session registers the video (the others get 409); a retry
+# after it succeeded gets the same response, with the video_id that was registered
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    try:
+        completed = await upload_io.run(upload_sessions.completed, upload_id)
+        if completed is not None:
+            return completed
+        # The target is checked before the file is hashed (up to UPLOAD_MAX_GB)
+        session = await upload_io.run(upload_sessions.get, upload_id)
+        name, ext = await run_in_threadpool(check_upload_target, session.project_id, session.filename)
+        await upload_io.run(upload_sessions.claim, upload_id)
+        try:
+            session, path, digest = await upload_io.run(upload_sessions.finish, upload_id)
+            _, created = await upload_io.run(blob_store.adopt, path, digest)
+        except Exception:
+            await upload_io.run(upload_sessions.release, upload_id)
+            raise
+        logger.info(f"Resumable upload {upload_id} completed: {session.filename} "
+                    f"({session.size / (1024**3):.2f} GB, sha256 {digest[:12]})")
+
+        # The file is in the blob store now; if registering fails the session is dropped and the
+        # client adds the video with /upload_by_hash
+        video = Video(project_id=session.project_id)
+        try:
+            video_id, _ = await run_in_threadpool(video.initialize, name, ext)
+            try:
+                known = await ingest_blob(video, digest)
+            except Exception:
+                await run_in_threadpool(video.discard_upload)
+                raise
+        except Exception:
+            await upload_io.run(upload_sessions.delete, upload_id)
+            raise
+        response = upload_response(video, video_id, session.filename, session.size, digest, known or not created, known)
+        await upload_io.run(upload_sessions.mark_completed, upload_id, response)
+        return response
+
+    except HTTPException:
+        raise
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Complete upload error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
 # Get all uploaded videos for a project
 # Output: videos_info = [{"name": video_name, "file": video, "path": video_path}, ... ]
 @app.post("/get_uploaded_videos")
@@ -2050,7 +2658,7 @@ def get_project_videos(project_id: int):
 # Get all classes of a project
 # Output: {"class_name": colour, ...}
 @app.post("/get_classes")
-async def get_classes(request:ProjectRequest):
+def get_classes(request:ProjectRequest):
     try:
         project = Project(project_id = request.project_id)
         
@@ -2070,7 +2678,7 @@ async def get_classes(request:ProjectRequest):
 # Add new class to a project and return new classes list
 # Output: {"class_name": colour, ...} 
 @app.post("/add_class")
-async def add_class(request: ProjectRequest, class_name: str, colour: str):
+def add_class(request: ProjectRequest, class_name: str, colour: str):
     try:
         project = Project(project_id = request.project_id)
         
@@ -2100,7 +2708,7 @@ async def add_class(request: ProjectRequest, class_name: str, colour: str):
 # Modify class name of a project and return new classes list
 # Output: {"class_name": colour, ...}
 @app.post("/modify_class")
-async def modify_class(request: ProjectRequest, original_class_name: str, new_class_name: str):
+def modify_class(request: ProjectRequest, original_class_name: str, new_class_name: str):
     try:
         project = Project(project_id = request.project_id)
 
@@ -2139,7 +2747,7 @@ async def modify_class(request: ProjectRequest, original_class_name: str, new_cl
 # Delete class of a project and return new classes list
 # Output: {"class_name": colour, ...}
 @app.post("/delete_class")
-async def add_class(request: ProjectRequest, class_name: str):
+def add_class(request: ProjectRequest, class_name: str):
     try:
         project = Project(project_id = request.project_id)
         
@@ -2170,26 +2778,57 @@ class VideoRequest(BaseModel):
     project_id: int
     video_id: int
 
+# Frame encoding requested by the annotation UI; fields left out use DEFAULT_FRAME_PROFILE
+class NextFrameRequest(VideoRequest):
+    session_id: Optional[str] = None  # identifies the annotator's tab for frame prefetching
+    format: Optional[str] = None
+    quality: Optional[int] = None
+    max_dim: Optional[int] = None
+
+def _frame_profile(format=None, quality=None, max_dim=None):
+    if format is None and quality is None and max_dim is None:
+        return DEFAULT_FRAME_PROFILE
+    return FrameProfile(format or DEFAULT_FRAME_PROFILE.format,
+                        DEFAULT_FRAME_PROFILE.quality if quality is None else quality,
+                        DEFAULT_FRAME_PROFILE.max_dim if max_dim is None else max_dim)
+
 # Get next frame to annotate
 @app.post("/get_next_frame_to_annotate")
-async def get_next_frame_to_annotate(request: VideoRequest):
+def get_next_frame_to_annotate(request: NextFrameRequest, http_request: Request):
     try:
+        try:
+            profile = _frame_profile(request.format, request.quality, request.max_dim)
+        except ValueError as e:
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": str(e)})
         video = Video(project_id = request.project_id, video_id = request.video_id)
-        next_frame, frame_num = video.get_next_frame_to_annotate()
-        
-        if next_frame is None:
+        frame_url, frame_num = video.get_next_frame_to_annotate(profile)
+        if frame_url is not None:
+            # One prefetch session per annotator and video, so each has at most FRAME_PREFETCH_DEPTH frames queued
+            # Clients that send no session id (older UIs) fall back to one session per address
+            client = request.session_id or (http_request.client.host if http_request.client else "unknown")
+            video.prefetch_frames((request.project_id, request.video_id, client), frame_num, profile)
+        
+        if frame_url is None:
             return {
                 "success": False,
                 "message": "All frames have been annotated.",
-                "image": None,
-                "frame_num": None
+                "frame_num": None,
+                "url": None
             }
         
+        # The image itself is served by get_frame_image
+        # Boxes drawn on the served frame are sent back with frame_width/frame_height (see annotate)
+        frame_width, frame_height = video.get_frame_size(profile)
         return {
                 "success": True,
                 "message": "Next frame fetched successfully.",
-                "image": next_frame,
-                "frame_num": frame_num
+                "frame_num": frame_num,
+                "url": frame_url,
+                "total_frames": video.frame_count,
+                "width": video.width,
+                "height": video.height,
+                "frame_width": frame_width,
+                "frame_height": frame_height
         }
 
     except Exception as e:
@@ -2200,9 +2839,132 @@ async def get_next_frame_to_annotate(request: VideoRequest):
             content={"error": str(e)}
         )
 
+# Frame as image bytes, encoded with the optional format (jpeg, webp), quality (1-100) and max_dim query parameters
+# Responses carry a content-derived ETag; only URLs with the current frame version (v) may be cached for a long time,
+# since building the proxy changes which file (and so which image) a frame number is read from
+@app.get("/projects/{project_id}/videos/{video_id}/frames/{frame_num}")
+def get_frame_image(project_id: int, video_id: int, frame_num: int, request: Request,
+                    format: Optional[str] = None, quality: Optional[int] = None, max_dim: Optional[int] = None,
+                    v: Optional[str] = None):
+    try:
+        try:
+            profile = _frame_profile(format, quality, max_dim)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        video = Video(project_id = project_id, video_id = video_id)
+        if video.video_path is None:
+            raise HTTPException(status_code=404, detail="Video not found")
+        try:
+            frame_bytes = video.get_frame_bytes(frame_num, profile)
+        except ValueError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+        etag = '"' + hashlib.sha1(frame_bytes).hexdigest() + '"'
+        cache_control = FRAME_CACHE_CONTROL if v is not None and v == video.get_frame_version() else FRAME_REVALIDATE_CACHE_CONTROL
+        headers = {"ETag": etag, "Cache-Control": cache_control}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+        return Response(frame_bytes, media_type=profile.media_type, headers=headers)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get frame image error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
+# Video file for the browser player, with byte-range support for seeking
+@app.api_route("/projects/{project_id}/videos/{video_id}/stream", methods=["GET", "HEAD"])
+def get_video_stream(project_id: int, video_id: int, request: Request):
+    try:
+        video = Video(project_id = project_id, video_id = video_id)
+        if video.video_path is None:
+            raise HTTPException(status_code=404, detail="Video not found")
+        return video.get_video(request)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get video stream error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
+# Timeline thumbnails: index.json and the sprite_NNN.jpg sheets it lists
+@app.get("/projects/{project_id}/videos/{video_id}/thumbnails/{filename}")
+def get_thumbnail_file(project_id: int, video_id: int, filename: str):
+    try:
+        if not re.fullmatch(r"sprite_\d{3}\.jpg|index\.json", filename):
+            raise HTTPException(status_code=404, detail="File not found.")
+        video = Video(project_id = project_id, video_id = video_id)
+        file_path = os.path.join(video.get_thumbnail_dir(), filename)
+        if not os.path.isfile(file_path):
+            raise HTTPException(status_code=404, detail="Thumbnails not found")
+        media_type = "application/json" if filename == THUMBNAIL_INDEX else "image/jpeg"
+        return FileResponse(file_path, media_type=media_type, headers={"Cache-Control": THUMBNAIL_CACHE_CONTROL})
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get thumbnail error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
+# Ingest status of an uploaded video, polled by the upload page until it is ready or failed
+# Output: {"video_id", "status", "error", "pending", "frame_count", "fps", "resolution"} (metadata once probed)
+@app.get("/projects/{project_id}/videos/{video_id}/ingest")
+def get_ingest_status(project_id: int, video_id: int):
+    try:
+        video = Video(project_id = project_id, video_id = video_id)
+        if video.video_path is None:
+            raise HTTPException(status_code=404, detail="Video not found")
+        ingest = video.get_ingest_status()
+        probed = video.__dict__.get("fps") is not None
+        return {
+            "video_id": video_id,
+            **ingest,
+            "frame_count": video.frame_count if probed else None,
+            "fps": video.fps if probed else None,
+            "resolution": list(video.resolution) if probed else None
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Get ingest status error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
+# Run the ingest pipeline of a video again (e.g. after it failed)
+@app.post("/projects/{project_id}/videos/{video_id}/ingest")
+def retry_ingest(project_id: int, video_id: int):
+    try:
+        video = Video(project_id = project_id, video_id = video_id)
+        if video.video_path is None:
+            raise HTTPException(status_code=404, detail="Video not found")
+        if not video.queue_ingest():
+            return JSONResponse(status_code=409, content={"error": "Video is already being ingested"})
+        return {"video_id": video_id, "status": "queued"}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Retry ingest error: {str(e)}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": str(e)}
+        )
+
 # Check annotation status of a video
 @app.post("/check_annotation_status")
-async def check_annotation_status(request: VideoRequest):  
+def check_annotation_status(request: VideoRequest):  
     try:
         video = Video(project_id = request.project_id, video_id = request.video_id)
         return {
@@ -2218,13 +2980,13 @@ async def check_annotation_status(request: VideoRequest):
     
 # Save annotation for a frame
 @app.post("/annotate")
-async def annotate(request: AnnotationRequest):
+def annotate(request: AnnotationRequest):
     try:
         video = Video(project_id = request.project_id, video_id = request.video_id)
-        for bbox in request.bboxes:
-            success = video.annotate(request.frame_num, bbox)
+        frame_size = (request.frame_width, request.frame_height) if request.frame_width and request.frame_height else None
+        success = video.annotate(request.frame_num, request.bboxes, frame_size)
         
-        if success:
+        if success is True:
             return {
                 "success": True,
                 "message": "Annotation saved."
@@ -2244,7 +3006,7 @@ async def annotate(request: AnnotationRequest):
 # ? No need now?
 # Get next video to annotate
 @app.post("/next_video")
-async def next_video(request: ProjectRequest, current_video_id: str):
+def next_video(request: ProjectRequest, current_video_id: str):
     try:
         project = Project(project_id = request.project_id)
         if current_video_id not in project.videos:
@@ -2287,7 +3049,7 @@ async def create_dataset(request: ProjectRequest, background_tasks: BackgroundTa
         "message": "Training started in the background."
     }
 
-async def _create_dataset(project_id: int):
+def _create_dataset(project_id: int):
     try:
         project = Project(project_id = project_id)
 
@@ -2322,7 +3084,7 @@ async def _create_dataset(project_id: int):
 
 # Get auto annotation progress of a project
 @app.post("/get_auto_annotation_progress")
-async def get_auto_annotation_progress(request: ProjectRequest):
+def get_auto_annotation_progress(request: ProjectRequest):
     try:
         project = Project(project_id = request.project_id)
 
@@ -2342,7 +3104,7 @@ async def get_auto_annotation_progress(request: ProjectRequest):
 
 # Train model for a project
 @app.post("/train")
-async def train(request: ProjectRequest, background_tasks: BackgroundTasks):
+def train(request: ProjectRequest, background_tasks: BackgroundTasks):
     try:
         project = Project(project_id = request.project_id)
 
@@ -2362,7 +3124,7 @@ async def train(request: ProjectRequest, background_tasks: BackgroundTasks):
 
 # Get training progress of a project  
 @app.post("/get_training_progress")
-async def get_training_progress(request: ProjectRequest):
+def get_training_progress(request: ProjectRequest):
     try:
         project = Project(project_id = request.project_id)
 
@@ -2394,7 +3156,7 @@ async def get_training_progress(request: ProjectRequest):
 
 # Get model performance
 @app.post("/get_model_performance")
-async def get_model_performance(request: ProjectRequest):
+def get_model_performance(request: ProjectRequest):
     try:
         project = Project(project_id = request.project_id)
 
@@ -2413,7 +3175,7 @@ async def get_model_performance(request: ProjectRequest):
         )
 
 @app.post("/get_model")
-async def get_model(request: ProjectRequest):
+def get_model(request: ProjectRequest):
     try:
         project_id = request.project_id
         project = Project(project_id)
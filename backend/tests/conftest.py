@@ -0,0 +1,46 @@
+import os
+import sys
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+# Backend modules import each other as top-level modules (as when running server.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+VFR_FRAMES = 24
+
+
+# Gray level of frame i of the fixture videos, so tests can tell which frame was decoded
+def frame_level(i):
+    return 8 * i + 20
+
+
+# Output: number of the fixture frame an image shows
+def frame_id(image):
+    gray = image if image.ndim == 2 else image.mean(axis=2)
+    return int(round((float(gray.mean()) - 20) / 8))
+
+
+@pytest.fixture(scope="session")
+def vfr_video(tmp_path_factory):
+    """
+    Variable frame rate H.264 clip whose stream starts at 0.5 s: frame gaps alternate between
+    120 ms and 33 ms, keyframe every 6 frames. Frame i is a flat image of gray level frame_level(i).
+    """
+    av = pytest.importorskip("av")
+    path = str(tmp_path_factory.mktemp("media") / "vfr.mp4")
+    with av.open(path, "w", format="mp4") as container:
+        stream = container.add_stream("libx264", rate=30)
+        stream.width, stream.height = 64, 64
+        stream.pix_fmt = "yuv420p"
+        stream.codec_context.time_base = Fraction(1, 1000)
+        stream.options = {"g": "6", "keyint_min": "6", "sc_threshold": "0", "bf": "0", "crf": "10"}
+        pts = 500
+        for i in range(VFR_FRAMES):
+            frame = av.VideoFrame.from_ndarray(np.full((64, 64, 3), frame_level(i), np.uint8), format="bgr24")
+            frame.pts, frame.time_base = pts, Fraction(1, 1000)
+            container.mux(stream.encode(frame))
+            pts += 33 if i % 3 else 120
+        container.mux(stream.encode(None))
+    return path
@@ -0,0 +1,49 @@
+import threading
+import time
+
+from ingest import IngestPipeline, READY
+
+
+def test_jobs_of_one_group_run_one_at_a_time():
+    statuses, running, overlaps = [], [], []
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def on_status(key, status, error=None):
+        statuses.append((key, status))
+        if key == "c" and status == READY:
+            done.set()
+
+    def stage():
+        with lock:
+            running.append(1)
+            overlaps.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    pipeline = IngestPipeline(on_status, workers=3)
+    for key in "abc":
+        assert pipeline.submit(key, [("work", stage, True)], group="same-content")
+    assert not pipeline.submit("a", [("work", stage, True)], group="same-content")
+    assert done.wait(5)
+    assert max(overlaps) == 1
+    assert [key for key, status in statuses if status == READY] == ["a", "b", "c"]
+    assert pipeline.stats()["pending"] == 0
+    pipeline.shutdown()
+
+
+def test_status_is_recorded_without_holding_the_lock():
+    pipeline = None
+
+    def on_status(key, status, error=None):
+        # Would deadlock if on_status were called with the pipeline lock held
+        pipeline.pending(key)
+
+    pipeline = IngestPipeline(on_status, workers=1)
+    assert pipeline.submit("a", [("work", lambda: None, True)])
+    deadline = time.time() + 5
+    while pipeline.pending("a") and time.time() < deadline:
+        time.sleep(0.01)
+    assert not pipeline.pending("a")
+    pipeline.shutdown()
@@ -0,0 +1,46 @@
+import pytest
+
+from conftest import VFR_FRAMES, frame_id
+from media import build_seek_index, get_decoder, read_frame
+
+pytest.importorskip("av")
+
+
+@pytest.fixture
+def index(vfr_video):
+    index = build_seek_index(vfr_video)
+    assert index.backend == "pyav" and index.frame_count == VFR_FRAMES
+    return index
+
+
+# With a PyAV index, frames are matched by pts even when DECODER is opencv
+def test_read_frame_with_index_is_frame_accurate(vfr_video, index, monkeypatch):
+    monkeypatch.setenv("DECODER", "opencv")
+    for n in range(VFR_FRAMES):
+        assert frame_id(read_frame(vfr_video, n, index)) == n
+
+
+def test_pyav_decoder_with_index_is_frame_accurate(vfr_video, index):
+    decoder = get_decoder("pyav")
+    for n in (1, 5, 6, 7, 17, 23):
+        assert [(num, frame_id(img)) for num, img in decoder.frames(vfr_video, n, n + 2, index)] == \
+            [(m, m) for m in range(n, min(n + 2, VFR_FRAMES))]
+
+
+# OpenCV does not seek by the index timestamps (they are absolute pts)
+def test_opencv_decoder_ignores_index(vfr_video, index):
+    decoder = get_decoder("opencv")
+    for n in (3, 6, 13, 22):
+        assert frame_id(read_frame(vfr_video, n, index, decoder)) == n
+
+
+@pytest.mark.parametrize("name", ["opencv", "pyav"])
+def test_sequential_decode_numbers_every_frame(vfr_video, name):
+    frames = list(get_decoder(name).frames(vfr_video))
+    assert [num for num, _ in frames] == list(range(VFR_FRAMES))
+    assert [frame_id(img) for _, img in frames] == list(range(VFR_FRAMES))
+
+
+def test_read_frame_out_of_range(vfr_video, index):
+    assert read_frame(vfr_video, VFR_FRAMES, index) is None
+    assert read_frame(vfr_video, -1, index) is None
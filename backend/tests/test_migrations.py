@@ -0,0 +1,108 @@
+import os
+import re
+import sys
+
+import pytest
+
+pytest.importorskip("pymysql")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "database"))
+
+import migrations  # noqa: E402
+
+
+class SchemaCursor:
+    """
+    Cursor for the migration functions that keeps the schema in memory: information_schema
+    lookups answer from it and ALTER / CREATE TABLE statements update it
+    """
+
+    def __init__(self, columns=None, indexes=None):
+        self.columns = {table: set(names) for table, names in (columns or {}).items()}
+        self.indexes = {table: dict(found) for table, found in (indexes or {}).items()}
+        self.executed = []
+        self._result = None
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        self.executed.append(query)
+        sql = " ".join(query.split())
+        if "information_schema.statistics" in sql:
+            table, index = params
+            self._result = {"n": int(index in self.indexes.get(table, {}))}
+        elif "information_schema.columns" in sql:
+            table, column = params
+            self._result = {"n": int(column in self.columns.get(table, set()))}
+        elif "information_schema.tables" in sql:
+            self._result = {"n": int(params[0] in self.columns)}
+        elif match := re.match(r"ALTER TABLE `?(\w+)`? ADD INDEX `(\w+)` \((.*)\)", sql):
+            table, index, columns = match.groups()
+            self.indexes.setdefault(table, {})[index] = [c.strip(" `") for c in columns.split(",")]
+        elif match := re.match(r"ALTER TABLE `?(\w+)`? DROP INDEX `(\w+)`", sql):
+            self.indexes[match.group(1)].pop(match.group(2))
+        elif match := re.match(r"ALTER TABLE `?(\w+)`? ADD COLUMN `(\w+)`", sql):
+            self.columns.setdefault(match.group(1), set()).add(match.group(2))
+        elif match := re.match(r"ALTER TABLE `?(\w+)`? DROP COLUMN `?(\w+)`?", sql):
+            self.columns[match.group(1)].discard(match.group(2))
+        elif match := re.match(r"CREATE TABLE IF NOT EXISTS (\w+) \((.*)\)", sql):
+            table, body = match.groups()
+            self.columns.setdefault(table, set())
+            for kind, index, columns in re.findall(r"(UNIQUE KEY|INDEX) (\w+) \(([^)]*)\)", body):
+                self.indexes.setdefault(table, {})[index] = [c.strip() for c in columns.split(",")]
+
+    def fetchone(self):
+        return self._result
+
+
+# Schema of create_object_detection_db.py before any migration
+def _base_schema():
+    return SchemaCursor(
+        columns={"bbox": {"id", "video_id", "frame_num", "class_name", "coordinates"},
+                 "class": {"project_id", "class_name", "color"},
+                 "project_shared_users": {"project_id", "user_id"},
+                 "video": {"video_id", "project_id", "video_path"}},
+        indexes={"bbox": {"video_id": ["video_id"]}, "class": {"project_id": ["project_id"]},
+                 "project_shared_users": {"idx_user_id": ["user_id"]}})
+
+
+def _apply_all(cursor):
+    for _, _, apply in migrations.MIGRATIONS:
+        apply(cursor)
+
+
+# Every index the EXPLAIN checks expect is created by a migration, on the columns the query filters by
+@pytest.mark.parametrize("description, query, params, table, expected", migrations.EXPLAIN_CHECKS,
+                         ids=[check[0] for check in migrations.EXPLAIN_CHECKS])
+def test_expected_index_is_created(description, query, params, table, expected):
+    cursor = _base_schema()
+    _apply_all(cursor)
+    assert expected in cursor.indexes[table]
+    where = query.split(" WHERE ", 1)[1]
+    filtered = re.findall(r"(\w+) = %s", where)
+    leading = cursor.indexes[table][expected][:len(filtered)]
+    assert sorted(leading) == sorted(filtered), f"{expected} does not lead with {filtered}"
+
+
+def test_replaced_single_column_indexes_are_dropped():
+    cursor = _base_schema()
+    _apply_all(cursor)
+    assert set(cursor.indexes["bbox"]) == {"idx_video_frame"}
+    assert set(cursor.indexes["class"]) == {"idx_project_class_color"}
+    assert set(cursor.indexes["project_shared_users"]) == {"idx_user_project"}
+
+
+def test_migrations_are_rerunnable():
+    cursor = _base_schema()
+    _apply_all(cursor)
+    schema = ({t: set(c) for t, c in cursor.columns.items()}, {t: dict(i) for t, i in cursor.indexes.items()})
+    cursor.executed.clear()
+    _apply_all(cursor)
+    assert not [q for q in cursor.executed if q.lstrip().startswith("ALTER")]
+    assert (cursor.columns, cursor.indexes) == schema
+
+
+def test_columns_used_by_the_server_are_added():
+    cursor = _base_schema()
+    _apply_all(cursor)
+    assert {"x", "y", "w", "h"} <= cursor.columns["bbox"] and "coordinates" not in cursor.columns["bbox"]
+    assert {"fps", "width", "height", "codec", "duration", "proxy_path", "proxy_frames", "proxy_width",
+            "proxy_height", "content_hash", "ingest_status", "ingest_error"} <= cursor.columns["video"]
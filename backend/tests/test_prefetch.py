@@ -0,0 +1,23 @@
+import threading
+
+from cache import FrameCache
+from prefetch import FramePrefetcher
+
+
+def test_wait_returns_prefetched_frame():
+    prefetcher = FramePrefetcher(FrameCache(max_bytes=1 << 20), workers=1, depth=2, wait_timeout=5)
+    release = threading.Event()
+    prefetcher.schedule("a", [((1, 0, "jpeg"), lambda: release.wait(5) and b"frame")])
+    threading.Timer(0.05, release.set).start()
+    assert prefetcher.wait((1, 0, "jpeg")) == b"frame"
+    prefetcher.shutdown()
+
+
+def test_wait_gives_up_after_timeout():
+    prefetcher = FramePrefetcher(FrameCache(max_bytes=1 << 20), workers=1, depth=2, wait_timeout=0.05)
+    release = threading.Event()
+    prefetcher.schedule("a", [((1, 0, "jpeg"), lambda: release.wait(5) and b"frame")])
+    assert prefetcher.wait((1, 0, "jpeg")) is None
+    assert prefetcher.stats()["wait_timeouts"] == 1
+    release.set()
+    prefetcher.shutdown()
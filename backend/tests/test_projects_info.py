@@ -0,0 +1,122 @@
+import sqlite3
+import time
+
+import pytest
+
+try:
+    import server
+except ImportError as e:  # torch, ultralytics, ... are not installed
+    pytest.skip(f"server dependencies are not installed: {e}", allow_module_level=True)
+
+from db import ConnectionPool
+
+
+class SQLiteCursor:
+    """DictCursor-like cursor on sqlite3 (%s placeholders)"""
+
+    def __init__(self, connection):
+        self._connection = connection
+        self._cursor = connection.sqlite.cursor()
+        self.rowcount, self.lastrowid = 0, None
+
+    def execute(self, query, params=()):
+        self._connection.pool._count_query()
+        self._cursor.execute(query.replace("%s", "?"), tuple(params))
+        self.rowcount, self.lastrowid = self._cursor.rowcount, self._cursor.lastrowid
+        return self.rowcount
+
+    def _row(self, row):
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return None if row is None else self._row(row)
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    """pymysql-like connection that counts statements in its pool, like db._CountingConnection"""
+
+    open = True
+
+    def __init__(self, pool, sqlite):
+        self.pool, self.sqlite = pool, sqlite
+
+    def cursor(self, cursor_class=None):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.sqlite.commit()
+
+    def rollback(self):
+        self.sqlite.rollback()
+
+    def ping(self, reconnect=True):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLitePool(ConnectionPool):
+    def __init__(self, sqlite):
+        super().__init__({}, size=2)
+        self.sqlite = sqlite
+
+    def _connect(self):
+        conn = SQLiteConnection(self, self.sqlite)
+        now = time.monotonic()
+        self._timestamps[id(conn)] = (now, now)
+        return conn
+
+
+@pytest.fixture
+def database(monkeypatch):
+    sqlite = sqlite3.connect(":memory:", check_same_thread=False)
+    sqlite.executescript("""
+        CREATE TABLE user (user_id INTEGER PRIMARY KEY, username TEXT);
+        CREATE TABLE project (project_id INTEGER PRIMARY KEY, project_name TEXT, project_status TEXT,
+                              project_owner_id INTEGER);
+        CREATE TABLE video (video_id INTEGER PRIMARY KEY, project_id INTEGER);
+        CREATE TABLE project_shared_users (project_id INTEGER, user_id INTEGER);
+        INSERT INTO user VALUES (1, 'owner'), (2, 'other');
+    """)
+    pool = SQLitePool(sqlite)
+    monkeypatch.setattr(server, "db", pool)
+    return pool
+
+
+def _add_projects(pool, owned, shared, videos_per_project):
+    with pool.cursor() as cursor:
+        for i in range(owned + shared):
+            cursor.execute("INSERT INTO project (project_name, project_status, project_owner_id) VALUES (%s, %s, %s)",
+                           (f"p{i}", "Not started", 1 if i < owned else 2))
+            project_id = cursor.lastrowid
+            if i >= owned:
+                cursor.execute("INSERT INTO project_shared_users VALUES (%s, %s)", (project_id, 1))
+            for _ in range(videos_per_project):
+                cursor.execute("INSERT INTO video (project_id) VALUES (%s)", (project_id,))
+
+
+# Output: (queries of one /get_projects_info call, its response)
+def _projects_info_queries(pool):
+    before = pool.stats()["queries"]
+    response = server.get_users_projects(server.UserRequest(userID=1))
+    return pool.stats()["queries"] - before, response
+
+
+def test_projects_info_query_count_does_not_grow(database):
+    _add_projects(database, owned=1, shared=0, videos_per_project=1)
+    small, response = _projects_info_queries(database)
+    assert [p["videoCount"] for p in response["owned projects"]] == [1]
+
+    _add_projects(database, owned=20, shared=15, videos_per_project=5)
+    large, response = _projects_info_queries(database)
+    assert len(response["owned projects"]) == 21 and len(response["shared projects"]) == 15
+    assert all(p["videoCount"] == 5 for p in response["shared projects"])
+    assert large == small
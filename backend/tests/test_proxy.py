@@ -0,0 +1,38 @@
+import shutil
+
+import pytest
+
+from conftest import VFR_FRAMES, frame_id
+from media import build_seek_index, get_decoder, load_seek_index, proxy_path, proxy_source_frames, read_frame, \
+    save_seek_index, transcode_proxy
+
+
+@pytest.fixture
+def vfr_proxy(vfr_video, tmp_path):
+    path = str(tmp_path / "vfr.mp4")
+    shutil.copy(vfr_video, path)
+    if transcode_proxy(path) is None:
+        pytest.skip("no proxy encoder available")
+    save_seek_index(proxy_path(path), build_seek_index(proxy_path(path)))
+    return path
+
+
+# The annotation UI numbers frames of the proxy; the dataset export decodes the original and maps
+# every proxy frame to the source frame it shows
+def test_proxy_frames_map_to_the_source_frames_they_show(vfr_proxy):
+    frame_path = proxy_path(vfr_proxy)
+    source_index, index = build_seek_index(vfr_proxy), load_seek_index(frame_path)
+    source_frames = proxy_source_frames(source_index, index)
+    assert len(source_frames) == index.frame_count
+    originals = {n: frame for n, frame in get_decoder().frames(vfr_proxy, 0, None, source_index)}
+    for n, shown in get_decoder().frames(frame_path, 0, None, index):
+        assert frame_id(read_frame(frame_path, n, index)) == frame_id(shown)
+        assert frame_id(originals[int(source_frames[n])]) == frame_id(shown)
+
+
+# Proxy frames are resampled to a constant rate, so the original's frame numbers label other images
+def test_vfr_proxy_numbers_differ_from_original(vfr_proxy):
+    original = [frame_id(frame) for _, frame in get_decoder().frames(vfr_proxy, 0, None, None)]
+    proxy = [frame_id(frame) for _, frame in get_decoder().frames(proxy_path(vfr_proxy), 0, None, None)]
+    assert original == list(range(VFR_FRAMES))
+    assert proxy[0] == 0 and proxy != original[:len(proxy)]
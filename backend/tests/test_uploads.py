@@ -0,0 +1,118 @@
+import asyncio
+import fcntl
+import hashlib
+import os
+import threading
+
+import pytest
+
+from uploads import MultipartFileReader, UploadError, UploadSessions, read_limited
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    return UploadSessions(str(tmp_path), chunk_size=4, max_chunk_size=16, max_size=1024, ttl=3600)
+
+
+def test_only_one_completion_claims_the_session(sessions):
+    session = sessions.create(1, "a.mp4", 4)
+    sessions.write(session.upload_id, 0, b"data")
+    results = []
+
+    def claim():
+        try:
+            sessions.claim(session.upload_id)
+            results.append("claimed")
+        except UploadError as e:
+            results.append(e.status)
+
+    threads = [threading.Thread(target=claim) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results, key=str) == [409] * 7 + ["claimed"]
+    _, _, digest = sessions.finish(session.upload_id)
+    assert digest == hashlib.sha256(b"data").hexdigest()
+
+
+def test_claimed_session_rejects_chunks_until_released(sessions):
+    session = sessions.create(1, "a.mp4", 8)
+    sessions.claim(session.upload_id)
+    with pytest.raises(UploadError) as error:
+        sessions.write(session.upload_id, 0, b"data")
+    assert error.value.status == 409
+    sessions.release(session.upload_id)
+    assert sessions.write(session.upload_id, 0, b"data").bytes_received == 4
+
+
+def test_session_is_not_claimed_while_a_chunk_is_written(sessions):
+    session = sessions.create(1, "a.mp4", 4)
+    fd = os.open(os.path.join(sessions.directory, session.upload_id + ".part"), os.O_WRONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)  # what write() holds while it writes
+        with pytest.raises(UploadError) as error:
+            sessions.claim(session.upload_id)
+        assert error.value.status == 409
+    finally:
+        os.close(fd)
+    sessions.write(session.upload_id, 0, b"data")
+    sessions.claim(session.upload_id)
+    with pytest.raises(UploadError) as error:
+        sessions.write(session.upload_id, 0, b"late")
+    assert error.value.status == 409
+    _, path, _ = sessions.finish(session.upload_id)
+    with open(path, "rb") as f:
+        assert f.read() == b"data"
+
+
+def test_completed_session_returns_its_result(sessions):
+    session = sessions.create(1, "a.mp4", 4)
+    sessions.write(session.upload_id, 0, b"data")
+    sessions.claim(session.upload_id)
+    sessions.mark_completed(session.upload_id, {"video_id": 7})
+    assert sessions.completed(session.upload_id) == {"video_id": 7}
+    with pytest.raises(UploadError):
+        sessions.claim(session.upload_id)
+
+
+async def _body(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _multipart(content):
+    return (b"--xyz\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nhello\r\n"
+            b"--xyz\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.mp4\"\r\n"
+            b"Content-Type: video/mp4\r\n\r\n" + content + b"\r\n--xyz--\r\n")
+
+
+@pytest.mark.parametrize("size", [1, 7, 4096])
+def test_multipart_file_is_read_from_the_stream(size):
+    content = bytes(range(256)) * 40
+
+    async def read_all():
+        reader = MultipartFileReader(_body(_multipart(content), size), "multipart/form-data; boundary=xyz")
+        assert await reader.headers() == ("a.mp4", "video/mp4")
+        chunks = []
+        while True:
+            chunk = await reader.read()
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    assert asyncio.run(read_all()) == content
+
+
+def test_multipart_without_file_field_is_rejected():
+    body = b"--xyz\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nhello\r\n--xyz--\r\n"
+    reader = MultipartFileReader(_body(body, 8), "multipart/form-data; boundary=xyz")
+    with pytest.raises(UploadError):
+        asyncio.run(reader.headers())
+
+
+def test_read_limited_stops_at_the_limit():
+    assert asyncio.run(read_limited(_body(b"x" * 10, 3), 10)) == b"x" * 10
+    with pytest.raises(UploadError) as error:
+        asyncio.run(read_limited(_body(b"x" * 11, 3), 10))
+    assert error.value.status == 413
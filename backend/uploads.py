@@ -0,0 +1,450 @@
+"""
+Nocodile 續傳上傳
+Resumable uploads: a session is created with the file size, chunks are written by offset in any
+order (and in parallel), and the file is verified and handed to the blob store when complete
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadError(Exception):
+    """Invalid upload request; status is the HTTP status the endpoint should answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadSession:
+    def __init__(self, upload_id, project_id, filename, size, sha256=None, received=None, created_at=None):
+        self.upload_id = upload_id
+        self.project_id = project_id
+        self.filename = filename
+        self.size = size
+        self.sha256 = sha256
+        self.received = received or []  # sorted, merged [start, end) byte ranges
+        self.created_at = created_at or time.time()
+
+    @property
+    def bytes_received(self):
+        return sum(end - start for start, end in self.received)
+
+    @property
+    def complete(self):
+        return self.received == [[0, self.size]] or self.size == 0
+
+    def missing(self):
+        ranges, position = [], 0
+        for start, end in self.received:
+            if start > position:
+                ranges.append([position, start])
+            position = end
+        if position < self.size:
+            ranges.append([position, self.size])
+        return ranges
+
+    def add_range(self, start, end):
+        ranges = sorted(self.received + [[start, end]])
+        merged = [ranges[0]]
+        for range_start, range_end in ranges[1:]:
+            if range_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        self.received = merged
+
+    def to_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "project_id": self.project_id,
+            "filename": self.filename,
+            "size": self.size,
+            "sha256": self.sha256,
+            "received": self.received,
+            "created_at": self.created_at,
+        }
+
+    def status(self, chunk_size):
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "size": self.size,
+            "chunk_size": chunk_size,
+            "bytes_received": self.bytes_received,
+            "received": self.received,
+            "missing": self.missing(),
+            "complete": self.complete,
+        }
+
+
+class UploadSessions:
+    """
+    Sessions live in `directory` as <id>.part (preallocated to the full size, written with pwrite)
+    and <id>.json (received ranges), so an interrupted upload resumes after a restart too.
+    Completion renames <id>.json to <id>.completing (claim()), which only one caller can do, and
+    ends with <id>.done holding the result, so a retried completion gets the same video.
+    Sessions untouched for UPLOAD_SESSION_TTL hours are removed when a new one is created.
+    """
+
+    def __init__(self, directory, chunk_size=None, max_chunk_size=None, max_size=None, ttl=None):
+        self.directory = directory
+        self.chunk_size = chunk_size or int(os.getenv('UPLOAD_CHUNK_MB', '8')) * 1024 * 1024
+        self.max_chunk_size = max_chunk_size or int(os.getenv('UPLOAD_MAX_CHUNK_MB', '64')) * 1024 * 1024
+        self.max_size = max_size or int(os.getenv('UPLOAD_MAX_GB', '5')) * 1024 ** 3
+        self.ttl = ttl if ttl is not None else float(os.getenv('UPLOAD_SESSION_TTL', '24')) * 3600
+        self._lock = threading.Lock()
+
+    def _path(self, upload_id, ext):
+        return os.path.join(self.directory, f"{upload_id}{ext}")
+
+    def _save(self, session):
+        tmp_path = self._path(session.upload_id, ".json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(session.to_dict(), f)
+        os.replace(tmp_path, self._path(session.upload_id, ".json"))
+
+    def _load(self, upload_id, ext):
+        try:
+            uuid.UUID(hex=upload_id)
+            with open(self._path(upload_id, ext)) as f:
+                return json.load(f)
+        except (ValueError, OSError):
+            return None
+
+    # Session that is being uploaded or completed
+    def get(self, upload_id):
+        data = self._load(upload_id, ".json") or self._load(upload_id, ".completing")
+        if data is None:
+            raise UploadError("Upload session not found", status=404)
+        return UploadSession(**data)
+
+    def create(self, project_id, filename, size, sha256=None):
+        if size < 0 or size > self.max_size:
+            raise UploadError(f"File too large. Max allowed: {self.max_size / 1024 ** 3:.1f} GB", status=413)
+        if sha256 is not None and (len(sha256) != 64 or any(c not in "0123456789abcdef" for c in sha256.lower())):
+            raise UploadError("sha256 must be 64 hex digits")
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        session = UploadSession(uuid.uuid4().hex, project_id, filename, size, sha256.lower() if sha256 else None)
+        with open(self._path(session.upload_id, ".part"), "wb") as f:
+            f.truncate(size)
+        self._save(session)
+        return session
+
+    # Write one chunk at `offset`, optionally checking its SHA-256
+    def write(self, upload_id, offset, data, sha256=None):
+        session = self.get(upload_id)
+        if len(data) > self.max_chunk_size:
+            raise UploadError(f"Chunk too large. Max allowed: {self.max_chunk_size // 1024 ** 2} MB", status=413)
+        if offset < 0 or offset + len(data) > session.size:
+            raise UploadError("Chunk is outside the file", status=416)
+        if sha256 is not None and hashlib.sha256(data).hexdigest() != sha256.lower():
+            raise UploadError("Chunk checksum mismatch", status=422)
+        try:
+            fd = os.open(self._path(upload_id, ".part"), os.O_WRONLY)
+        except FileNotFoundError:
+            raise UploadError("Upload session not found", status=404)
+        try:
+            # Shared lock for the whole write: claim() cannot take the session while a chunk is written,
+            # and once it has (<id>.json renamed) no chunk is written any more
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            if not os.path.exists(self._path(upload_id, ".json")):
+                raise UploadError("Upload is being completed", status=409)
+            os.pwrite(fd, data, offset)
+            # Chunks of one session may arrive in parallel; the range bookkeeping is serialized
+            with self._lock:
+                session = self.get(upload_id)
+                session.add_range(offset, offset + len(data))
+                self._save(session)
+            return session
+        finally:
+            os.close(fd)  # releases the lock
+
+    # Take the session for completion. The rename of <id>.json is atomic, so of concurrent
+    # completions (in any process) exactly one gets the session, the others get 409. It is taken
+    # under an exclusive lock of the .part file, so no chunk write is in progress (409 otherwise)
+    def claim(self, upload_id):
+        session = self.get(upload_id)
+        try:
+            fd = os.open(self._path(upload_id, ".part"), os.O_RDONLY)
+        except FileNotFoundError:
+            raise UploadError("Upload session not found", status=404)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError("Chunks are still being written, complete the upload after they finished", status=409)
+            with self._lock:
+                try:
+                    os.rename(self._path(upload_id, ".json"), self._path(upload_id, ".completing"))
+                except FileNotFoundError:
+                    raise UploadError("Upload is already being completed", status=409)
+        finally:
+            os.close(fd)
+        return session
+
+    # Give a claimed session back (the completion failed before the file was handed over)
+    def release(self, upload_id):
+        with self._lock:
+            try:
+                os.rename(self._path(upload_id, ".completing"), self._path(upload_id, ".json"))
+            except FileNotFoundError:
+                pass
+
+    # Record the result of a completed session and remove its files
+    def mark_completed(self, upload_id, result):
+        tmp_path = self._path(upload_id, ".done.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, self._path(upload_id, ".done"))
+        for ext in (".part", ".completing"):
+            try:
+                os.remove(self._path(upload_id, ext))
+            except FileNotFoundError:
+                pass
+
+    # Output: result given to mark_completed(), or None if the session was not completed
+    def completed(self, upload_id):
+        return self._load(upload_id, ".done")
+
+    # Hash the assembled file and check it against the checksum given at creation
+    # Output: (session, path of the assembled file, sha256)
+    def finish(self, upload_id):
+        session = self.get(upload_id)
+        if not session.complete:
+            raise UploadError(f"Upload is incomplete, missing {session.missing()}", status=409)
+        path = self._path(upload_id, ".part")
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+            os.fsync(f.fileno())  # chunks were written with pwrite, make them durable before completing
+        digest = digest.hexdigest()
+        if session.sha256 is not None and digest != session.sha256:
+            raise UploadError("File checksum mismatch, the upload has to be restarted", status=422)
+        return session, path, digest
+
+    def delete(self, upload_id):
+        for ext in (".part", ".json", ".completing", ".done"):
+            try:
+                os.remove(self._path(upload_id, ext))
+            except FileNotFoundError:
+                pass
+
+    def expire(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            upload_id, ext = os.path.splitext(name)
+            if ext not in (".json", ".completing", ".done"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    self.delete(upload_id)
+            except OSError:
+                pass
+
+
+class UploadLimiter:
+    """
+    At most `max_active` uploads (a multipart upload or one resumable chunk) write to disk at
+    once. Up to `max_queued` more wait at most `queue_timeout` seconds for a slot; beyond that
+    acquire() raises UploadError 503 and the client should retry after `retry_after` seconds.
+    Used from the event loop only.
+    """
+
+    def __init__(self, max_active=None, max_queued=None, queue_timeout=None, retry_after=None):
+        self.max_active = max_active or int(os.getenv('UPLOAD_MAX_CONCURRENT', '4'))
+        self.max_queued = max_queued if max_queued is not None else int(os.getenv('UPLOAD_MAX_QUEUED', '16'))
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.getenv('UPLOAD_QUEUE_TIMEOUT', '30'))
+        self.retry_after = retry_after or int(os.getenv('UPLOAD_RETRY_AFTER', '5'))
+        self._semaphore = asyncio.Semaphore(self.max_active)
+        self.active = 0
+        self.waiting = 0
+        self._accepted = 0
+        self._queued = 0
+        self._rejected = 0
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queued:
+                self._rejected += 1
+                raise UploadError("Too many uploads in progress, retry later", status=503)
+            self._queued += 1
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise UploadError("Too many uploads in progress, retry later", status=503)
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self._accepted += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "max_active": self.max_active,
+            "active": self.active,
+            "waiting": self.waiting,
+            "accepted": self._accepted,
+            "queued": self._queued,
+            "rejected": self._rejected,
+        }
+
+
+class MultipartFileReader:
+    """
+    Read one file field of a multipart/form-data body straight from the request stream.
+    Unlike UploadFile, the body is not spooled to a temporary file first: headers() parses up to
+    the part headers of `field`, then read() returns its bytes as they arrive (b"" at the end).
+    Other fields are skipped.
+    """
+
+    def __init__(self, stream, content_type, field="file"):
+        _, options = parse_options_header(content_type or "")
+        boundary = options.get(b"boundary")
+        if not boundary:
+            raise UploadError("Expected a multipart/form-data body")
+        self.field = field.encode()
+        self.filename = None
+        self.content_type = None
+        self._stream = stream.__aiter__()
+        self._header_field, self._header_value, self._headers = b"", b"", {}
+        self._in_field, self._found, self._done = False, False, False
+        self._data = []
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": lambda data, start, end: self._append_header("_header_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append_header("_header_value", data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _append_header(self, name, data):
+        setattr(self, name, getattr(self, name) + data)
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field, self._header_value = b"", b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self._found or options.get(b"name") != self.field:
+            return
+        self._in_field, self._found = True, True
+        self.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+        self.content_type = self._headers.get(b"content-type", b"").decode("latin-1")
+
+    def _on_part_data(self, data, start, end):
+        if self._in_field:
+            self._data.append(data[start:end])
+
+    def _on_part_end(self):
+        if self._in_field:
+            self._in_field, self._done = False, True
+
+    async def _feed(self):
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            raise UploadError("Incomplete multipart body")
+        self._parser.write(chunk)
+
+    # Output: (filename, content type) of the file field
+    async def headers(self):
+        while not self._found:
+            await self._feed()
+        return self.filename, self.content_type
+
+    async def read(self):
+        await self.headers()
+        while not self._data and not self._done:
+            await self._feed()
+        chunk = b"".join(self._data)
+        self._data = []
+        return chunk
+
+
+# Read a request body from its stream, at most `limit` bytes: the size is enforced while it arrives,
+# also when the client sent no Content-Length
+async def read_limited(stream, limit, message="Request body too large"):
+    chunks, size = [], 0
+    async for chunk in stream:
+        size += len(chunk)
+        if size > limit:
+            raise UploadError(message, status=413)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class UploadIO:
+    """
+    Dedicated threads for upload disk I/O (writing, hashing, moving files), so bulk ingestion
+    neither blocks the event loop nor occupies the API threadpool the annotation endpoints use.
+    """
+
+    def __init__(self, workers=None, max_inflight=None):
+        self.max_inflight = max_inflight or int(os.getenv('UPLOAD_MAX_INFLIGHT', '4'))
+        self._executor = ThreadPoolExecutor(max_workers=workers or int(os.getenv('UPLOAD_IO_WORKERS', '4')),
+                                            thread_name_prefix="upload-io")
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    # Pump chunks from `await read()` (b"" at the end) to the blocking `write(chunk)` in order.
+    # Reading the next chunk overlaps with writing the previous ones; at most max_inflight chunks
+    # are buffered, after that reading waits for the disk.
+    # Output: number of bytes written
+    async def copy(self, read, write):
+        async def write_after(previous, chunk):
+            if previous is not None:
+                await previous
+            await self.run(write, chunk)
+
+        pending, last, total = deque(), None, 0
+        try:
+            while True:
+                chunk = await read()
+                if not chunk:
+                    break
+                last = asyncio.ensure_future(write_after(last, chunk))
+                pending.append(last)
+                total += len(chunk)
+                if len(pending) >= self.max_inflight:
+                    await pending.popleft()
+            if last is not None:
+                await last
+            return total
+        finally:
+            # Let queued writes finish (or fail) before the caller closes or removes the file
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
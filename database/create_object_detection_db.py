@@ -7,6 +7,8 @@ from pathlib import Path
 import base64
 import hashlib
 
+from migrations import migrate
+
 # 添加後端路徑到 Python 路徑
 backend_path = Path(__file__).parent.parent / "backend"
 sys.path.insert(0, str(backend_path))
@@ -313,6 +315,10 @@ def main():
             print("表格創建失敗")
             return False
 
+        # 4. 升級資料庫結構（索引、新表格）
+        print("\n步驟 4: 執行資料庫遷移...")
+        migrate(db.connection)
+
         # # 4. 创建users
         # if not db.create_users():
         #     print("users創建失敗")
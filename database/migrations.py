@@ -0,0 +1,297 @@
+"""
+Nocodile 資料庫遷移工具
+Versioned schema migrations that upgrade an existing database in place.
+
+The applied version is stored in the `schema_migrations` table. Every migration is
+written to be re-runnable (MySQL commits DDL implicitly, so a migration that failed
+half way is simply applied again), and is recorded only after it finished.
+
+Usage:
+    python database/migrations.py status     # show applied / pending migrations
+    python database/migrations.py upgrade    # apply pending migrations
+    python database/migrations.py explain    # check the hot queries use the expected indexes
+"""
+
+import os
+import sys
+
+import pymysql
+import pymysql.cursors
+
+
+#==================================== Helpers ====================================
+
+def _table_exists(cursor, table):
+    cursor.execute(
+        "SELECT COUNT(*) AS n FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+        (table,))
+    return cursor.fetchone()["n"] > 0
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute(
+        "SELECT COUNT(*) AS n FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column))
+    return cursor.fetchone()["n"] > 0
+
+
+def _index_exists(cursor, table, index):
+    cursor.execute(
+        "SELECT COUNT(*) AS n FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index))
+    return cursor.fetchone()["n"] > 0
+
+
+def _add_index(cursor, table, index, columns):
+    if not _index_exists(cursor, table, index):
+        cursor.execute(f"ALTER TABLE `{table}` ADD INDEX `{index}` ({', '.join(f'`{c}`' for c in columns)})")
+        print(f"  + {table}.{index} ({', '.join(columns)})")
+
+
+# Only drop indexes that a new composite index makes redundant (the composite index must be
+# created first, so foreign keys always keep an index to use)
+def _drop_index(cursor, table, index):
+    if _index_exists(cursor, table, index):
+        cursor.execute(f"ALTER TABLE `{table}` DROP INDEX `{index}`")
+        print(f"  - {table}.{index}")
+
+
+#==================================== Migrations ====================================
+
+def _001_composite_indexes(cursor):
+    # get_bbox_data(frame_num) / dataset export: WHERE video_id = ? [AND frame_num = ?]
+    _add_index(cursor, "bbox", "idx_video_frame", ["video_id", "frame_num"])
+    _drop_index(cursor, "bbox", "video_id")
+
+    # get_classes: SELECT class_name, color WHERE project_id = ? (answered from the index alone)
+    _add_index(cursor, "class", "idx_project_class_color", ["project_id", "class_name", "color"])
+    _drop_index(cursor, "class", "project_id")
+
+    # get_projects_info / get_shared_projects: SELECT project_id WHERE user_id = ?
+    _add_index(cursor, "project_shared_users", "idx_user_project", ["user_id", "project_id"])
+    _drop_index(cursor, "project_shared_users", "idx_user_id")
+
+
+def _002_project_shares(cursor):
+    # Used by /share_project, /unshare_project and /get_project_shares
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS project_shares (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            project_id INT NOT NULL,
+            shared_with_user_id INT NOT NULL,
+            permissions ENUM('read', 'write') NOT NULL DEFAULT 'read',
+            shared_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+            -- Foreign key
+            FOREIGN KEY (project_id) REFERENCES project(project_id) ON DELETE CASCADE,
+            FOREIGN KEY (shared_with_user_id) REFERENCES user(user_id) ON DELETE CASCADE,
+
+            -- Unique key
+            UNIQUE KEY unique_project_shared_user (project_id, shared_with_user_id),
+
+            -- Index for quicker search
+            INDEX idx_shared_with_user (shared_with_user_id, project_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+
+def _003_numeric_bbox_columns(cursor):
+    # "x y w h" strings -> four FLOAT columns (16 bytes per box instead of up to 50 characters)
+    for column in ("x", "y", "w", "h"):
+        if not _column_exists(cursor, "bbox", column):
+            cursor.execute(f"ALTER TABLE bbox ADD COLUMN `{column}` FLOAT NOT NULL DEFAULT 0")
+    if _column_exists(cursor, "bbox", "coordinates"):
+        cursor.execute("""
+            UPDATE bbox SET
+                x = CAST(SUBSTRING_INDEX(TRIM(coordinates), ' ', 1) AS DECIMAL(12, 4)),
+                y = CAST(SUBSTRING_INDEX(SUBSTRING_INDEX(TRIM(coordinates), ' ', 2), ' ', -1) AS DECIMAL(12, 4)),
+                w = CAST(SUBSTRING_INDEX(SUBSTRING_INDEX(TRIM(coordinates), ' ', 3), ' ', -1) AS DECIMAL(12, 4)),
+                h = CAST(SUBSTRING_INDEX(SUBSTRING_INDEX(TRIM(coordinates), ' ', 4), ' ', -1) AS DECIMAL(12, 4))
+        """)
+        print(f"  ~ bbox: {cursor.rowcount} rows converted")
+        cursor.execute("ALTER TABLE bbox DROP COLUMN coordinates")
+
+
+def _004_video_metadata(cursor):
+    # Probed once per video (total_frames already exists); NULL fps means "not probed yet"
+    columns = {
+        "fps": "FLOAT NULL",
+        "width": "INT NULL",
+        "height": "INT NULL",
+        "codec": "VARCHAR(16) NULL",
+        "duration": "FLOAT NULL",
+    }
+    for column, definition in columns.items():
+        if not _column_exists(cursor, "video", column):
+            cursor.execute(f"ALTER TABLE video ADD COLUMN `{column}` {definition}")
+            print(f"  + video.{column}")
+
+
+def _005_video_proxy(cursor):
+    # Annotation proxy written at ingest; NULL proxy_path means frames are read from the original
+    columns = {
+        "proxy_path": "VARCHAR(255) NULL",
+        "proxy_frames": "INT NULL",
+        "proxy_width": "INT NULL",
+        "proxy_height": "INT NULL",
+    }
+    for column, definition in columns.items():
+        if not _column_exists(cursor, "video", column):
+            cursor.execute(f"ALTER TABLE video ADD COLUMN `{column}` {definition}")
+            print(f"  + video.{column}")
+
+
+def _006_video_content_hash(cursor):
+    # SHA-256 of the video bytes (blob store key); videos uploaded before have NULL
+    if not _column_exists(cursor, "video", "content_hash"):
+        cursor.execute("ALTER TABLE video ADD COLUMN `content_hash` CHAR(64) NULL")
+        print("  + video.content_hash")
+    _add_index(cursor, "video", "idx_content_hash", ["content_hash"])
+
+
+def _007_video_ingest_status(cursor):
+    # Post-upload ingest stage (queued, probe, seek_index, proxy, thumbnails, ready, failed);
+    # videos uploaded before have NULL and are treated as ready
+    columns = {
+        "ingest_status": "VARCHAR(16) NULL",
+        "ingest_error": "TEXT NULL",
+    }
+    for column, definition in columns.items():
+        if not _column_exists(cursor, "video", column):
+            cursor.execute(f"ALTER TABLE video ADD COLUMN `{column}` {definition}")
+            print(f"  + video.{column}")
+
+
+# (version, description, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "composite indexes for bbox, class and project_shared_users lookups", _001_composite_indexes),
+    (2, "create project_shares table", _002_project_shares),
+    (3, "store bbox coordinates as numeric x, y, w, h columns", _003_numeric_bbox_columns),
+    (4, "video metadata columns (fps, width, height, codec, duration)", _004_video_metadata),
+    (5, "video annotation proxy columns (proxy_path, proxy_frames, proxy_width, proxy_height)", _005_video_proxy),
+    (6, "video content hash for the blob store", _006_video_content_hash),
+    (7, "video ingest status columns (ingest_status, ingest_error)", _007_video_ingest_status),
+]
+
+
+#==================================== Runner ====================================
+
+def _ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+    """)
+
+
+def applied_versions(connection):
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        _ensure_version_table(cursor)
+        cursor.execute("SELECT version FROM schema_migrations")
+        return {row["version"] for row in cursor.fetchall()}
+
+
+def migrate(connection, target=None):
+    """
+    Apply all pending migrations up to `target` (default: latest)
+    Output: list of applied versions
+    """
+    done = applied_versions(connection)
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        print(f"遷移 {version:03d}: {description}")
+        with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+            apply(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+        connection.commit()
+        applied.append(version)
+    if not applied:
+        print("資料庫結構已是最新版本")
+    return applied
+
+
+def status(connection):
+    done = applied_versions(connection)
+    for version, description, _ in MIGRATIONS:
+        print(f"[{'x' if version in done else ' '}] {version:03d} {description}")
+    return all(version in done for version, _, _ in MIGRATIONS)
+
+
+#==================================== EXPLAIN checks ====================================
+
+# (description, query, params, table, expected index)
+EXPLAIN_CHECKS = [
+    ("bbox of one frame",
+     "SELECT frame_num, class_name, x, y, w, h FROM bbox WHERE video_id = %s AND frame_num = %s",
+     (1, 0), "bbox", "idx_video_frame"),
+    ("bbox of one video",
+     "SELECT frame_num, class_name, x, y, w, h FROM bbox WHERE video_id = %s",
+     (1,), "bbox", "idx_video_frame"),
+    ("classes of a project",
+     "SELECT class_name, color FROM class WHERE project_id = %s",
+     (1,), "class", "idx_project_class_color"),
+    ("projects shared with a user",
+     "SELECT DISTINCT project_id FROM project_shared_users WHERE user_id = %s",
+     (1,), "project_shared_users", "idx_user_project"),
+    ("existing share lookup",
+     "SELECT id FROM project_shares WHERE project_id = %s AND shared_with_user_id = %s",
+     (1, 1), "project_shares", "unique_project_shared_user"),
+    ("video with the same content",
+     "SELECT video_id FROM video WHERE content_hash = %s AND fps IS NOT NULL",
+     ("0" * 64,), "video", "idx_content_hash"),
+]
+
+
+def explain(connection):
+    """
+    Run EXPLAIN on the hot lookups and check that MySQL picks the expected index.
+    On near-empty tables the optimizer may prefer a full scan, so run this on a database with real data.
+    Output: True if every query uses its index
+    """
+    ok = True
+    with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+        for description, query, params, table, expected in EXPLAIN_CHECKS:
+            cursor.execute("EXPLAIN " + query, params)
+            plan = [row for row in cursor.fetchall() if row["table"] == table]
+            used = plan[0]["key"] if plan else None
+            passed = used == expected
+            ok = ok and passed
+            print(f"[{'OK' if passed else 'FAIL'}] {description}: key={used} (expected {expected}), "
+                  f"type={plan[0]['type'] if plan else None}, Extra={plan[0].get('Extra') if plan else None}")
+    return ok
+
+
+def main():
+    # The database the server uses (backend/db.py), so the migrated schema is the one it queries
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from db import DB_CONFIG
+
+    commands = {"upgrade": migrate, "status": status, "explain": explain}
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command not in commands:
+        print(f"Usage: python {sys.argv[0]} [{'|'.join(commands)}]")
+        return False
+
+    print(f"目標資料庫: {DB_CONFIG['host']}/{DB_CONFIG['database']}")
+    try:
+        connection = pymysql.connect(**DB_CONFIG)
+    except pymysql.MySQLError as e:
+        print(f"無法連接資料庫: {e}")
+        return False
+    try:
+        result = commands[command](connection)
+        return result is not False
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+"""
+Nocodile backend benchmarks
+Run against a running backend (and database) to compare performance before and after a change.
+
+Usage:
+    python scripts/benchmark.py api-latency --project-id 1 --video-id 1 --concurrency 32
+    python scripts/benchmark.py api-latency --project-id 1 --video-id 1 --uploads 8 --upload-mb 512
+    python scripts/benchmark.py projects-info --user-id 1 --user-id 2
+    python scripts/benchmark.py bbox-write --rows 20000 --flush-size 500
+    python scripts/benchmark.py frame-encode --video backend/projects/1/videos/sample.mp4 --frames 20
+    python scripts/benchmark.py random-access --video backend/projects/1/videos/sample.mp4 --reads 50
+    python scripts/benchmark.py decode-passes --video backend/projects/1/videos/sample.mp4
+    python scripts/benchmark.py decode-throughput --threads 1 --threads 0
+    python scripts/benchmark.py auto-annotate-fps --video backend/projects/1/videos/sample.mp4 --frames 10
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def post_json(base_url, endpoint, payload, timeout=60):
+    """POST a JSON body and return the decoded response"""
+    request = urllib.request.Request(
+        f"{base_url}{endpoint}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def get_json(base_url, endpoint, timeout=60):
+    """GET an endpoint and return the decoded response"""
+    with urllib.request.urlopen(f"{base_url}{endpoint}", timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def mysql_connect(args):
+    """Direct MySQL connection from the --mysql-* arguments"""
+    import pymysql
+
+    return pymysql.connect(host=args.mysql_host, port=args.mysql_port, user=args.mysql_user,
+                           password=args.mysql_password, database=args.mysql_database, charset="utf8mb4")
+
+
+@contextmanager
+def scratch_video(args, video_id):
+    """
+    Copy of a video row (same file and metadata, same project) for benchmarks that write
+    annotations. The copy and every bbox written to it are deleted afterwards, so the real
+    video's annotations are never touched. Yields the id of the copy.
+    """
+    columns = ("project_id, video_path, total_frames, fps, width, height, codec, duration, "
+               "proxy_path, proxy_frames, proxy_width, proxy_height, content_hash")
+    conn = mysql_connect(args)
+    with closing(conn):
+        with closing(conn.cursor()) as cursor:
+            cursor.execute(f"INSERT INTO video ({columns}, video_name, annotation_status, ingest_status) "
+                           f"SELECT {columns}, 'benchmark-scratch', 'yet to start', 'ready' FROM video WHERE video_id = %s",
+                           (video_id,))
+            if not cursor.rowcount:
+                raise ValueError(f"Video {video_id} not found")
+            scratch_id = cursor.lastrowid
+        conn.commit()
+        try:
+            yield scratch_id
+        finally:
+            with closing(conn.cursor()) as cursor:
+                cursor.execute("DELETE FROM bbox WHERE video_id = %s", (scratch_id,))
+                cursor.execute("DELETE FROM video WHERE video_id = %s", (scratch_id,))
+            conn.commit()
+
+
+def add_mysql_arguments(parser):
+    parser.add_argument("--mysql-host", default="localhost")
+    parser.add_argument("--mysql-port", type=int, default=3306)
+    parser.add_argument("--mysql-user", default="root")
+    parser.add_argument("--mysql-password", default="noconoconocodile")
+    parser.add_argument("--mysql-database", default="Nocodile")
+
+
+def upload_traffic(base_url, project_id, size, stop):
+    """
+    Push `size` bytes through the resumable upload endpoints, chunk after chunk, until `stop` is
+    set. The session is deleted instead of completed, so no video is added to the project.
+    Output: (bytes uploaded, number of 503 answers)
+    """
+    session = post_json(base_url, "/uploads", {"project_id": project_id, "filename": f"benchmark-{os.getpid()}-"
+                                               f"{threading.get_ident()}.mp4", "size": size})
+    chunk = os.urandom(session["chunk_size"])
+    sent, rejected, offset = 0, 0, 0
+    try:
+        while offset < size and not stop.is_set():
+            data = chunk[:size - offset]
+            request = urllib.request.Request(f"{base_url}/uploads/{session['upload_id']}?offset={offset}",
+                                             data=data, method="PUT",
+                                             headers={"Content-Type": "application/octet-stream"})
+            try:
+                urllib.request.urlopen(request, timeout=120).close()
+            except urllib.error.HTTPError as e:
+                if e.code != 503:
+                    raise
+                rejected += 1
+                time.sleep(int(e.headers.get("Retry-After", "1")))
+                continue
+            offset += len(data)
+            sent += len(data)
+    finally:
+        urllib.request.urlopen(urllib.request.Request(f"{base_url}/uploads/{session['upload_id']}",
+                                                      method="DELETE"), timeout=60).close()
+    return sent, rejected
+
+
+def query_count(base_url):
+    """Number of statements the backend has sent to MySQL so far"""
+    return get_json(base_url, "/metrics")["db_pool"]["queries"]
+
+
+def print_latencies(title, latencies, elapsed):
+    """Print latency percentiles in milliseconds"""
+    ms = [l * 1000 for l in latencies]
+    print(f"\n{title}")
+    print(f"  requests:   {len(ms)}")
+    print(f"  throughput: {len(ms) / elapsed:.1f} req/s")
+    print(f"  mean:       {statistics.mean(ms):.1f} ms")
+    print(f"  p50:        {percentile(ms, 50):.1f} ms")
+    print(f"  p95:        {percentile(ms, 95):.1f} ms")
+    print(f"  p99:        {percentile(ms, 99):.1f} ms")
+    print(f"  max:        {max(ms):.1f} ms")
+
+#=================================== Benchmarks ==========================================
+
+def bench_api_latency(args):
+    """
+    Concurrent annotation-page traffic: every worker repeatedly polls the endpoints the
+    annotate page uses. With --write, workers also save an annotation on each iteration; the
+    annotations go to a scratch copy of the video (created and removed through --mysql-*).
+    With --uploads, that many clients upload --upload-mb each at the same time (bulk ingestion).
+    """
+    if args.write:
+        with scratch_video(args, args.video_id) as scratch_id:
+            return run_api_latency(args, scratch_id)
+    return run_api_latency(args, args.video_id)
+
+
+def run_api_latency(args, video_id):
+    project = {"project_id": args.project_id}
+    video = {"project_id": args.project_id, "video_id": video_id}
+    calls = [
+        ("/check_annotation_status", video),
+        ("/get_classes", project),
+        ("/get_project_details", project),
+        ("/get_training_progress", project),
+    ]
+    if args.write:
+        calls.append(("/annotate", {**video, "frame_num": 0, "bboxes": [["benchmark", 10, 10, 20, 20]]}))
+
+    def worker(_):
+        latencies = []
+        for i in range(args.requests):
+            endpoint, payload = calls[i % len(calls)]
+            start = time.perf_counter()
+            post_json(args.url, endpoint, payload)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    stop = threading.Event()
+    upload_pool = ThreadPoolExecutor(max_workers=max(1, args.uploads))
+    uploads = [upload_pool.submit(upload_traffic, args.url, args.project_id, args.upload_mb * 1024 * 1024, stop)
+               for _ in range(args.uploads)]
+    if uploads:
+        time.sleep(1)  # let the uploads get going
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    latencies = [l for r in results for l in r]
+    title = f"API latency ({args.concurrency} concurrent clients"
+    print_latencies(title + (f", {args.uploads} uploads)" if uploads else ")"), latencies, elapsed)
+    if uploads:
+        sent, rejected = map(sum, zip(*[u.result() for u in uploads]))
+        print(f"  uploaded:   {sent / 1024 ** 2:.0f} MB ({sent / 1024 ** 2 / elapsed:.1f} MB/s), {rejected} chunks answered 503")
+    upload_pool.shutdown()
+
+
+def bench_projects_info(args):
+    """
+    Round trips per /get_projects_info call for users with different numbers of projects.
+    The query count must not grow with the project count (asserted by backend/tests/test_projects_info.py;
+    this measures it against a real database). Run with no other traffic on the backend.
+    """
+    print(f"{'user':>6} {'projects':>9} {'queries':>8} {'latency':>10}")
+    counts = set()
+    for user_id in args.user_id:
+        before = query_count(args.url)
+        start = time.perf_counter()
+        result = post_json(args.url, "/get_projects_info", {"userID": user_id})
+        latency = time.perf_counter() - start
+        queries = query_count(args.url) - before
+        projects = len(result.get("owned projects", [])) + len(result.get("shared projects", []))
+        counts.add(queries)
+        print(f"{user_id:>6} {projects:>9} {queries:>8} {latency * 1000:>8.1f}ms")
+    constant = len(counts) == 1
+    print("\nQuery count is constant" if constant else "\nQuery count varies with project count")
+    return constant
+
+
+def bench_bbox_write(args):
+    """
+    Rows/s for bbox inserts: one commit per row (the old /annotate and auto_annotate path)
+    against executemany in transactions of --flush-size rows. Talks to MySQL directly and
+    writes into a temporary copy of the bbox table, so no project data is touched.
+    """
+    conn = mysql_connect(args)
+    query = "INSERT INTO bench_bbox (frame_num, class_name, x, y, w, h, video_id) VALUES (%s, %s, %s, %s, %s, %s, %s)"
+    rows = [(i, "benchmark", i % 640, i % 480, 32, 32, 0) for i in range(args.rows)]
+
+    def per_row():
+        with closing(conn.cursor()) as cursor:
+            for row in rows:
+                cursor.execute(query, row)
+                conn.commit()
+
+    def batched():
+        with closing(conn.cursor()) as cursor:
+            for i in range(0, len(rows), args.flush_size):
+                cursor.executemany(query, rows[i:i + args.flush_size])
+                conn.commit()
+
+    with closing(conn):
+        with closing(conn.cursor()) as cursor:
+            cursor.execute("CREATE TEMPORARY TABLE bench_bbox LIKE bbox")
+        results = {}
+        for name, run in (("per-row commit", per_row), (f"batched ({args.flush_size}/txn)", batched)):
+            with closing(conn.cursor()) as cursor:
+                cursor.execute("TRUNCATE TABLE bench_bbox")
+            start = time.perf_counter()
+            run()
+            results[name] = len(rows) / (time.perf_counter() - start)
+            print(f"{name:>22}: {results[name]:>10.0f} rows/s")
+    baseline, batched_rate = results.values()
+    print(f"\nSpeed-up: {batched_rate / baseline:.1f}x")
+
+
+FRAME_PROFILES = [
+    ("jpeg", 95, 0), ("jpeg", 80, 0), ("jpeg", 80, 1920), ("jpeg", 80, 1280),
+    ("jpeg", 70, 960), ("webp", 80, 1920), ("webp", 80, 1280), ("webp", 70, 960),
+]
+
+
+def bench_frame_encode(args):
+    """
+    Encode time and size per frame profile (format, quality, max_dim) for frames spread over
+    a local video. Decoding is done once up front, so only resize + encode is measured.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from media import probe_video, read_frame, FrameProfile, encode_frame
+
+    metadata = probe_video(args.video)
+    if metadata is None or metadata["total_frames"] <= 0:
+        print(f"Cannot open {args.video}")
+        return False
+    step = max(1, metadata["total_frames"] // args.frames)
+    frames = [read_frame(args.video, n) for n in range(0, metadata["total_frames"], step)][:args.frames]
+    frames = [frame for frame in frames if frame is not None]
+    print(f"{len(frames)} frames of {metadata['width']}x{metadata['height']} ({metadata['codec']})\n")
+
+    print(f"{'profile':>18} {'size':>11} {'encode ms':>10} {'KiB/frame':>10} {'vs default':>10}")
+    baseline = None
+    for format, quality, max_dim in FRAME_PROFILES:
+        profile = FrameProfile(format, quality, max_dim)
+        timings, sizes = [], []
+        for frame in frames:
+            start = time.perf_counter()
+            data = encode_frame(frame, profile)
+            timings.append((time.perf_counter() - start) * 1000)
+            sizes.append(len(data))
+        width, height = profile.scaled_size(metadata["width"], metadata["height"])
+        mean_size = statistics.mean(sizes)
+        baseline = baseline or mean_size
+        print(f"{format + ' q' + str(quality) + ' ' + (str(max_dim) if max_dim else 'full'):>18} "
+              f"{str(width) + 'x' + str(height):>11} {statistics.mean(timings):>10.1f} "
+              f"{mean_size / 1024:>10.1f} {mean_size / baseline:>9.0%}")
+
+
+def bench_random_access(args):
+    """
+    Latency of reading random frames from the original video and from its annotation proxy
+    (written first if it does not exist). Each file is read with and without its seek index.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from media import probe_video, read_frame, build_seek_index, transcode_proxy, proxy_path
+
+    proxy = proxy_path(args.video)
+    if not os.path.exists(proxy) or args.rebuild_proxy:
+        start = time.perf_counter()
+        if transcode_proxy(args.video) is None:
+            print("Cannot write the proxy (no ffmpeg binary or PyAV)")
+            return False
+        print(f"Proxy written in {time.perf_counter() - start:.1f}s")
+
+    rng = random.Random(args.seed)
+    print(f"{'file':>9} {'index':>6} {'size MiB':>9} {'frames':>7} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name, path in (("original", args.video), ("proxy", proxy)):
+        metadata = probe_video(path)
+        frames = [rng.randrange(metadata["total_frames"]) for _ in range(args.reads)]
+        index = build_seek_index(path)
+        for label, file_index in (("none", None), ("seek", index)):
+            if label == "seek" and index is None:
+                continue
+            timings = []
+            for n in frames:
+                start = time.perf_counter()
+                read_frame(path, n, file_index)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{name:>9} {label:>6} {os.path.getsize(path) / 2**20:>9.1f} {metadata['total_frames']:>7} "
+                  f"{percentile(timings, 50):>8.1f} {percentile(timings, 95):>8.1f} {max(timings):>8.1f}")
+
+
+def bench_decode_passes(args):
+    """
+    Decode time of one auto-annotate + dataset export run, with a manual annotation every --step
+    frames. Before: KCF decodes each segment, auto_annotate decodes it again for SAM and the export
+    decodes the whole video. After: one FrameReader pass over all segments plus one for the export.
+    Only decoding is timed (no tracking, SAM or JPEG writing).
+    """
+    import cv2
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from media import probe_video, proxy_path
+    from cv_models import FrameReader
+
+    annotation_path = proxy_path(args.video) if os.path.exists(proxy_path(args.video)) else args.video
+    metadata = probe_video(annotation_path)
+    step = args.step or max(1, int(round(metadata["fps"])))
+    annotated = list(range(0, metadata["total_frames"], step))
+    print(f"{len(annotated) - 1} segments of {step} frames in {os.path.basename(annotation_path)}\n")
+
+    def read_range(path, start, end):
+        cap = cv2.VideoCapture(path)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        frames = 0
+        for _ in range(start, end):
+            if not cap.read()[0]:
+                break
+            frames += 1
+        cap.release()
+        return frames
+
+    def before():
+        frames = 0
+        for start, end in zip(annotated, annotated[1:]):
+            frames += read_range(annotation_path, start, start + 1)      # KCF: starting frame
+            frames += read_range(annotation_path, start, end + 1)        # KCF: tracked segment
+            frames += read_range(annotation_path, start + 1, end)        # auto_annotate: SAM
+        return frames + read_range(args.video, 0, 1 << 31)               # export
+
+    def after():
+        frames = 0
+        for reader in (FrameReader(annotation_path, annotated[0], annotated[-1]), FrameReader(args.video)):
+            for _ in reader:
+                pass
+            frames += reader.frames_read
+        return frames
+
+    results = {}
+    for name, run in (("before (3 passes)", before), ("after (FrameReader)", after)):
+        start = time.perf_counter()
+        frames = run()
+        results[name] = time.perf_counter() - start
+        print(f"{name:>20}: {frames:>8} frames decoded in {results[name]:>7.2f}s")
+    old, new = results.values()
+    print(f"\nSpeed-up: {old / new:.1f}x")
+
+
+def bench_decode_throughput(args):
+    """
+    Frames/s of sequential decoding for every decoder (OpenCV, PyAV) and thread count, on the
+    given videos or on the sample videos in the repository (annotation proxies excluded).
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from media import DECODERS, PROXY_SUFFIX, av
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    videos = args.video or sorted(
+        path for ext in ("mp4", "mov", "avi", "mkv", "webm")
+        for path in glob.glob(os.path.join(root, "backend", "**", "videos", f"*.{ext}"), recursive=True)
+        if not path.endswith(PROXY_SUFFIX))
+    if not videos:
+        print("No videos found, pass --video")
+        return False
+    decoders = [name for name in DECODERS if name != "pyav" or av is not None]
+
+    print(f"{'video':>32} {'decoder':>8} {'threads':>8} {'frames':>7} {'fps':>9}")
+    for path in videos:
+        for name in decoders:
+            for threads in args.threads or [1, 0]:
+                decoder = DECODERS[name](threads, args.pixel_format)
+                start = time.perf_counter()
+                frames = 0
+                for _ in decoder.frames(path, 0, args.frames or None):
+                    frames += 1
+                elapsed = time.perf_counter() - start
+                print(f"{os.path.basename(path)[-32:]:>32} {name:>8} {threads or 'auto':>8} {frames:>7} "
+                      f"{frames / elapsed if elapsed else 0:>9.1f}")
+
+
+def bench_auto_annotate_fps(args):
+    """
+    Frames/s of the SAM step of auto-annotation on --frames consecutive frames. Before: the SAM
+    checkpoint was loaded for every frame. After: the model comes from the process-wide
+    ModelRegistry, loaded once (the load is included in the time, as for a cold first job).
+    Tracking and database writes are not included.
+    """
+    if args.checkpoint:
+        os.environ["SAM_CHECKPOINT"] = os.path.abspath(args.checkpoint)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from cv_models import SAM, FrameReader, model_registry, _load_sam
+
+    frames = [frame for _, frame in FrameReader(args.video, args.start, args.start + args.frames)]
+    print(f"{len(frames)} frames of {os.path.basename(args.video)}\n")
+
+    def before():
+        for frame in frames:
+            SAM(image=frame, model=_load_sam()).segment()
+
+    def after():
+        with model_registry.use("sam") as model:
+            for frame in frames:
+                SAM(image=frame, model=model).segment()
+
+    results = {}
+    for name, run in (("before (load per frame)", before), ("after (ModelRegistry)", after)):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        results[name] = len(frames) / elapsed
+        print(f"{name:>24}: {elapsed:>7.2f}s, {results[name]:>6.2f} frames/s")
+    old, new = results.values()
+    print(f"\nSpeed-up: {new / old:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nocodile backend benchmarks")
+    parser.add_argument("--url", default="http://localhost:8888", help="Backend base URL")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = subparsers.add_parser("api-latency", help="p50/p95/p99 latency under concurrent annotation traffic")
+    p.add_argument("--project-id", type=int, required=True)
+    p.add_argument("--video-id", type=int, required=True)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--requests", type=int, default=50, help="Requests per client")
+    p.add_argument("--write", action="store_true", help="Include /annotate writes (on a scratch copy of the video)")
+    p.add_argument("--uploads", type=int, default=0, help="Concurrent uploads running during the measurement")
+    p.add_argument("--upload-mb", type=int, default=256, help="Size of each upload")
+    add_mysql_arguments(p)
+    p.set_defaults(func=bench_api_latency)
+
+    p = subparsers.add_parser("projects-info", help="Database round trips per /get_projects_info call")
+    p.add_argument("--user-id", type=int, action="append", required=True, help="Repeat for several users")
+    p.set_defaults(func=bench_projects_info)
+
+    p = subparsers.add_parser("bbox-write", help="Rows/s for per-row vs batched bbox inserts (direct MySQL)")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--flush-size", type=int, default=500, help="Rows per transaction (BBOX_FLUSH_SIZE)")
+    add_mysql_arguments(p)
+    p.set_defaults(func=bench_bbox_write)
+
+    p = subparsers.add_parser("frame-encode", help="Encode time and bytes per frame profile (local video file)")
+    p.add_argument("--video", required=True, help="Path of a video file")
+    p.add_argument("--frames", type=int, default=20, help="Number of frames spread over the video")
+    p.set_defaults(func=bench_frame_encode)
+
+    p = subparsers.add_parser("random-access", help="Random frame read latency, original video vs annotation proxy")
+    p.add_argument("--video", required=True, help="Path of a video file")
+    p.add_argument("--reads", type=int, default=50, help="Random frames read from each file")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--rebuild-proxy", action="store_true", help="Transcode the proxy even if it exists")
+    p.set_defaults(func=bench_random_access)
+
+    p = subparsers.add_parser("decode-passes", help="Decode time of auto-annotate + export, separate passes vs FrameReader")
+    p.add_argument("--video", required=True, help="Path of the original video (its proxy is used if it exists)")
+    p.add_argument("--step", type=int, default=0, help="Frames between manual annotations (default: 1 second)")
+    p.set_defaults(func=bench_decode_passes)
+
+    p = subparsers.add_parser("decode-throughput", help="Decode frames/s per decoder backend and thread count")
+    p.add_argument("--video", action="append", help="Video file (repeatable, default: sample videos in the repo)")
+    p.add_argument("--threads", type=int, action="append", help="Thread counts to try, 0 = auto (default: 1 and 0)")
+    p.add_argument("--frames", type=int, default=0, help="Decode at most this many frames per run (0 = whole video)")
+    p.add_argument("--pixel-format", default="bgr24", choices=["bgr24", "rgb24", "gray"])
+    p.set_defaults(func=bench_decode_throughput)
+
+    p = subparsers.add_parser("auto-annotate-fps", help="SAM frames/s with the model loaded per frame vs once (ModelRegistry)")
+    p.add_argument("--video", required=True, help="Path of a video file")
+    p.add_argument("--frames", type=int, default=10, help="Number of consecutive frames")
+    p.add_argument("--start", type=int, default=0, help="First frame")
+    p.add_argument("--checkpoint", help="SAM checkpoint (default: SAM_CHECKPOINT or sam_vit_b_01ec64.pth)")
+    p.set_defaults(func=bench_auto_annotate_fps)
+
+    args = parser.parse_args()
+    return args.func(args) is not False
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)